@@ -13,6 +13,7 @@ from . import polynomial
 from . import stats
 from . import interpolate
 from . import dctpack
+from . import fatigue
 try:
     from . import fig
 except ImportError:
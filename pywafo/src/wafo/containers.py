@@ -20,14 +20,6 @@ def empty_copy(obj):
     return newcopy
 
 
-def _set_seed(iseed):
-    if iseed is not None:
-        try:
-            np.random.set_state(iseed)
-        except:
-            np.random.seed(iseed)
-
-
 def now():
     '''
     Return current date and time as a string
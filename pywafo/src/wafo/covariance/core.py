@@ -16,37 +16,36 @@ date : Date and time of creation or change.
 
 from __future__ import division
 import warnings
+import hashlib
+from collections import OrderedDict
 import numpy as np
 from numpy import (zeros, ones, sqrt, inf, where, nan,
                    atleast_1d, hstack, r_, linspace, flatnonzero, size,
-                   isnan, finfo, diag, ceil, random, pi)
+                   isnan, finfo, diag, ceil, pi)
 from numpy.fft import fft
-from numpy.random import randn
 import scipy.interpolate as interpolate
-from scipy.linalg import toeplitz, lstsq
+from scipy.linalg import (toeplitz, eigh, cholesky_banded,
+                          cho_solve_banded, solve_banded, LinAlgError)
 from scipy import sparse
 from pylab import stineman_interp
 
 from wafo.containers import PlotData
-from wafo.misc import sub_dict_select, nextpow2  # , JITImport
+from wafo.misc import (sub_dict_select, nextpow2, check_random_state,
+                       LRUCache, spawn_seeds, parallel_map)
 import wafo.spectrum as _wafospec
-from scipy.sparse.linalg.dsolve.linsolve import spsolve
-from scipy.sparse.base import issparse
 from scipy.signal.windows import parzen
+from scipy.signal import fftconvolve
 # _wafospec = JITImport('wafo.spectrum')
 
-__all__ = ['CovData1D']
+__all__ = ['CovData1D', 'CirculantSimulator']
 
+_EPS = finfo(float).eps
+# CirculantSimulator objects memoized by (acf hash, dt, ns, dtype)
+_SIMULATOR_CACHE = LRUCache(maxsize=8)
+_GAP_CACHE = LRUCache(maxsize=4096)
 
-def _set_seed(iseed):
-    if iseed is not None:
-        try:
-            random.set_state(iseed)
-        except:
-            random.seed(iseed)
 
-
-def rndnormnd(mean, cov, cases=1):
+def rndnormnd(mean, cov, cases=1, random_state=None):
     '''
     Random vectors from a multivariate Normal distribution
 
@@ -56,6 +55,8 @@ def rndnormnd(mean, cov, cases=1):
          mean and covariance, respectively.
     cases : scalar integer
         number of sample vectors
+    random_state : None, int, RandomState or Generator
+        random number generator (default the global np.random generator)
 
     Returns
     -------
@@ -83,7 +84,206 @@ def rndnormnd(mean, cov, cases=1):
     --------
     np.random.multivariate_normal
     '''
-    return np.random.multivariate_normal(mean, cov, cases)
+    rng = check_random_state(random_state)
+    return rng.multivariate_normal(mean, cov, cases)
+
+
+class CirculantSimulator(object):
+
+    '''
+    Simulator of stationary Gaussian processes by circulant embedding
+
+    Parameters
+    ----------
+    acf : array-like
+        auto covariance function, R(k*dt), k=0,1,...,n-1
+    ns : scalar integer
+        number of simulated points in each realisation.
+        If ns>n-1 it is assummed that R(k)=0 for all k>n-1
+    dt : real scalar
+        sampling period of acf (default 1)
+    nugget : real scalar
+        nugget effect added to R(0) to ensure that round off errors do not
+        result in negative spectral estimates. (default 0)
+    dtype : numpy dtype
+        data type of the output, e.g., np.float32 to halve the memory
+        footprint of large simulations. (default float)
+
+    The square root spectrum of the circulant embedding, which is the costly
+    part of the setup, is computed once in the constructor and reused by
+    all calls to sim, iter_cases and iter_time.
+
+    Example
+    -------
+    >>> import wafo.spectrum.models as sm
+    >>> R = sm.Jonswap().tospecdata().tocovdata()
+    >>> simulator = CirculantSimulator(R.data, ns=500,
+    ...                                dt=R.sampling_period())
+    >>> x = simulator.sim(cases=4, random_state=1)
+    >>> x.shape
+    (500, 4)
+
+    Long realisations in blocks of ns points:
+    >>> x = np.hstack([xi[:, 0] for xi in
+    ...                simulator.iter_time(nblocks=10, random_state=1)])
+    >>> x.shape
+    (5000,)
+
+    See also
+    --------
+    CovData1D.sim
+
+    Reference
+    -----------
+    C.R Dietrich and G. N. Newsam (1997)
+    "Fast and exact simulation of stationary
+    Gaussian process through circulant embedding
+    of the Covariance matrix"
+    SIAM J. SCI. COMPT. Vol 18, No 4, pp. 1088-1107
+    '''
+
+    def __init__(self, acf, ns, dt=1.0, nugget=0.0, dtype=float):
+        acf = np.array(acf, dtype=float).ravel()
+        acf[0] = acf[0] + nugget
+        self.ns = int(ns)
+        self.dt = dt
+        self.dtype = np.dtype(dtype)
+        self.t = linspace(0, (self.ns - 1) * dt, self.ns)
+        self.nfft, self.s_sqr = self._sqrt_spectrum(acf, self.ns)
+        self._kernel = None
+
+    @staticmethod
+    def _sqrt_spectrum(acf, ns):
+        n = acf.size
+        # Fast and exact simulation of simulation of stationary
+        # Gaussian process throug circulant embedding of the
+        # Covariance matrix
+        floatinfo = finfo(float)
+        if (abs(acf[-1]) > floatinfo.eps):  # assuming acf(n+1)==0
+            m2 = 2 * n - 1
+            nfft = 2 ** nextpow2(max(m2, 2 * ns))
+            acf = r_[acf, zeros(nfft - m2), acf[-1:0:-1]]
+            # warnings,warn('I am now assuming that ACF(k)=0 for k>MAXLAG.')
+        else:  # ACF(n)==0
+            m2 = 2 * n - 2
+            nfft = 2 ** nextpow2(max(m2, 2 * ns))
+            acf = r_[acf, zeros(nfft - m2), acf[n - 1:1:-1]]
+
+        S = fft(acf, nfft).real  # periodogram
+
+        I = S.argmax()
+        k = flatnonzero(S < 0)
+        if k.size > 0:
+            _msg = '''
+                Not able to construct a nonnegative circulant vector from ACF.
+                Apply parzen windowfunction to the ACF in order to avoid this.
+                The returned result is now only an approximation.'''
+
+            # truncating negative values to zero to ensure that
+            # that this noise is not added to the simulated timeseries
+
+            S[k] = 0.
+
+            ix = flatnonzero(k > 2 * I)
+            if ix.size > 0:
+                # truncating all oscillating values above 2 times the peak
+                # frequency to zero to ensure that
+                # that high frequency noise is not added to
+                # the simulated timeseries.
+                ix0 = k[ix[0]]
+                S[ix0:-ix0] = 0.0
+
+        trunc = 1e-5
+        maxS = S[I]
+        k = flatnonzero(S[I:-I] < maxS * trunc)
+        if k.size > 0:
+            S[k + I] = 0.
+            # truncating small values to zero to ensure that
+            # that high frequency noise is not added to
+            # the simulated timeseries
+        return nfft, sqrt(S / nfft)  # sqrt(S(wn)*dw )
+
+    def sim(self, cases=1, random_state=None, derivative=False):
+        '''
+        Return cases realisations (and derivatives) as ns x cases array(s)
+
+        Parameters
+        ----------
+        cases : scalar integer
+            number of replicates (default=1)
+        random_state : None, int, RandomState or Generator
+            random number generator (default the global np.random generator)
+        derivative : bool
+            if true : return derivative of simulated signal as well
+        '''
+        rng = check_random_state(random_state)
+        nfft, ns = self.nfft, self.ns
+        cases1 = int(cases / 2)
+        cases2 = int(ceil(cases / 2))
+        # Generate standard normal random numbers for the simulations
+        randn = rng.standard_normal
+        epsi = randn((nfft, cases2)) + 1j * randn((nfft, cases2))
+        y = fft(epsi * self.s_sqr[:, None], nfft, axis=0)
+        x = hstack((y[2:ns + 2, 0:cases2].real,
+                    y[2:ns + 2, 0:cases1].imag)).astype(self.dtype)
+        if not derivative:
+            return x
+        w = r_[0:(nfft // 2 + 1), -(nfft // 2 - 1):0] * 2 * pi / nfft / self.dt
+        y = fft(epsi * (self.s_sqr * w)[:, None], nfft, axis=0)
+        xder = hstack((y[2:ns + 2, 0:cases2].imag,
+                       -y[2:ns + 2, 0:cases1].real)).astype(self.dtype)
+        return x, xder
+
+    def iter_cases(self, cases, block=100, random_state=None):
+        '''
+        Yield cases realisations as ns x block arrays
+
+        Only one block is kept in memory at the time.
+        '''
+        rng = check_random_state(random_state)
+        for start in range(0, cases, block):
+            yield self.sim(min(block, cases - start), random_state=rng)
+
+    def _get_kernel(self):
+        if self._kernel is None:
+            # The covariance of the circulant embedding is the
+            # autocorrelation of the (real and even) square root kernel
+            kernel = np.fft.ifft(self.s_sqr).real * sqrt(self.nfft)
+            kernel = np.roll(kernel, self.nfft // 2)
+            k = flatnonzero(np.abs(kernel) > _EPS * np.abs(kernel).max())
+            self._kernel = kernel[k[0]:k[-1] + 1]
+        return self._kernel
+
+    def iter_time(self, nblocks=None, random_state=None):
+        '''
+        Yield one long realisation in consecutive ns x 1 blocks
+
+        Parameters
+        ----------
+        nblocks : scalar integer or None
+            number of blocks to yield (default None, i.e., infinitely many).
+        random_state : None, int, RandomState or Generator
+            random number generator (default the global np.random generator)
+
+        Notes
+        -----
+        White noise is filtered with the square root kernel of the circulant
+        embedding by overlap-save, so the memory use is independent of the
+        total length. The covariance equals the embedded ACF for lags up to
+        nfft/2 apart from the truncation of the kernel at relative size eps.
+        '''
+        rng = check_random_state(random_state)
+        kernel = self._get_kernel()
+        n_k = kernel.size
+        ns = self.ns
+        noise = rng.standard_normal(n_k - 1 + ns)
+        count = 0
+        while nblocks is None or count < nblocks:
+            x = fftconvolve(noise, kernel, mode='valid')
+            yield x[:, None].astype(self.dtype)
+            count += 1
+            noise[:n_k - 1] = noise[ns:]
+            noise[n_k - 1:] = rng.standard_normal(ns)
 
 
 class CovData1D(PlotData):
@@ -297,7 +497,8 @@ class CovData1D(PlotData):
         if self.data.argmax() != 0:
             raise ValueError('ACF does not have a maximum at zero lag')
 
-    def sim(self, ns=None, cases=1, dt=None, iseed=None, derivative=False):
+    def sim(self, ns=None, cases=1, dt=None, iseed=None, derivative=False,
+            random_state=None):
         '''
         Simulates a Gaussian process and its derivative from ACF
 
@@ -316,6 +517,9 @@ class CovData1D(PlotData):
         derivative : bool
             if true : return derivative of simulated signal as well
             otherwise
+        random_state : None, int, RandomState or Generator
+            random number generator used instead of iseed if given,
+            see wafo.misc.spawn_random_states for parallel simulations.
 
         Returns
         -------
@@ -334,6 +538,9 @@ class CovData1D(PlotData):
         Note: The simulation may give high frequency ripple when used with a
                 small dt.
 
+        The circulant embedding is memoized, see CovData1D.simulator, so
+        repeated calls with the same ACF and ns only pay for the simulation.
+
         Example:
         >>> import wafo.spectrum.models as sm
         >>> Sj = sm.Jonswap()
@@ -343,7 +550,7 @@ class CovData1D(PlotData):
 
         See also
         --------
-        spec2sdat, gaus2dat
+        spec2sdat, gaus2dat, CovData1D.simulator
 
         Reference
         -----------
@@ -354,117 +561,68 @@ class CovData1D(PlotData):
         SIAM J. SCI. COMPT. Vol 18, No 4, pp. 1088-1107
         '''
 
-        # TODO fix it, it does not work
-
-        # Add a nugget effect to ensure that round off errors
-        # do not result in negative spectral estimates
-        nugget = 0  # 10**-12
-
-        _set_seed(iseed)
-        self._is_valid_acf()
-        acf = self.data.ravel()
-        n = acf.size
-        acf.shape = (n, 1)
-
-        dT = self.sampling_period()
-
+        rng = check_random_state(iseed if random_state is None
+                                 else random_state)
+        if ns is None:
+            ns = self.data.size - 1
+        simulator = self.simulator(ns)
         x = zeros((ns, cases + 1))
-
+        x[:, 0] = simulator.t
+        xs = simulator.sim(cases, random_state=rng, derivative=derivative)
         if derivative:
             xder = x.copy()
-
-        # add a nugget effect to ensure that round off errors
-        # do not result in negative spectral estimates
-        acf[0] = acf[0] + nugget
-
-        # Fast and exact simulation of simulation of stationary
-        # Gaussian process throug circulant embedding of the
-        # Covariance matrix
-        floatinfo = finfo(float)
-        if (abs(acf[-1]) > floatinfo.eps):  # assuming acf(n+1)==0
-            m2 = 2 * n - 1
-            nfft = 2 ** nextpow2(max(m2, 2 * ns))
-            acf = r_[acf, zeros((nfft - m2, 1)), acf[-1:0:-1, :]]
-            # warnings,warn('I am now assuming that ACF(k)=0 for k>MAXLAG.')
-        else:  # ACF(n)==0
-            m2 = 2 * n - 2
-            nfft = 2 ** nextpow2(max(m2, 2 * ns))
-            acf = r_[acf, zeros((nfft - m2, 1)), acf[n - 1:1:-1, :]]
-
-        # m2=2*n-2
-        S = fft(acf, nfft, axis=0).real  # periodogram
-
-        I = S.argmax()
-        k = flatnonzero(S < 0)
-        if k.size > 0:
-            _msg = '''
-                Not able to construct a nonnegative circulant vector from ACF.
-                Apply parzen windowfunction to the ACF in order to avoid this.
-                The returned result is now only an approximation.'''
-
-            # truncating negative values to zero to ensure that
-            # that this noise is not added to the simulated timeseries
-
-            S[k] = 0.
-
-            ix = flatnonzero(k > 2 * I)
-            if ix.size > 0:
-                # truncating all oscillating values above 2 times the peak
-                # frequency to zero to ensure that
-                # that high frequency noise is not added to
-                # the simulated timeseries.
-                ix0 = k[ix[0]]
-                S[ix0:-ix0] = 0.0
-
-        trunc = 1e-5
-        maxS = S[I]
-        k = flatnonzero(S[I:-I] < maxS * trunc)
-        if k.size > 0:
-            S[k + I] = 0.
-            # truncating small values to zero to ensure that
-            # that high frequency noise is not added to
-            # the simulated timeseries
-
-        cases1 = int(cases / 2)
-        cases2 = int(ceil(cases / 2))
-# Generate standard normal random numbers for the simulations
-
-        # randn = np.random.randn
-        epsi = randn(nfft, cases2) + 1j * randn(nfft, cases2)
-        Ssqr = sqrt(S / (nfft))  # sqrt(S(wn)*dw )
-        ephat = epsi * Ssqr  # [:,np.newaxis]
-        y = fft(ephat, nfft, axis=0)
-        x[:, 1:cases + 1] = hstack((y[2:ns + 2, 0:cases2].real,
-                                    y[2:ns + 2, 0:cases1].imag))
-
-        x[:, 0] = linspace(0, (ns - 1) * dT, ns)  # (0:dT:(dT*(np-1)))'
-
-        if derivative:
-            Ssqr = Ssqr * \
-                r_[0:(nfft / 2 + 1), -(nfft / 2 - 1):0] * 2 * pi / nfft / dT
-            ephat = epsi * Ssqr  # [:,newaxis]
-            y = fft(ephat, nfft, axis=0)
-            xder[:, 1:(cases + 1)] = hstack((y[2:ns + 2, 0:cases2].imag -
-                                            y[2:ns + 2, 0:cases1].real))
-            xder[:, 0] = x[:, 0]
+            x[:, 1:], xder[:, 1:] = xs
+        else:
+            x[:, 1:] = xs
 
         if self.tr is not None:
             print('   Transforming data.')
             g = self.tr
+            # all the cases are transformed in one call
             if derivative:
-                for ix in range(cases):
-                    tmp = g.gauss2dat(x[:, ix + 1], xder[:, ix + 1])
-                    x[:, ix + 1] = tmp[0]
-                    xder[:, ix + 1] = tmp[1]
+                x[:, 1:], xder[:, 1:] = g.gauss2dat(x[:, 1:], xder[:, 1:])
             else:
-                for ix in range(cases):
-                    x[:, ix + 1] = g.gauss2dat(x[:, ix + 1])
+                x[:, 1:] = g.gauss2dat(x[:, 1:])
 
         if derivative:
             return x, xder
         else:
             return x
 
+    def simulator(self, ns, dtype=float):
+        '''
+        Return circulant embedding simulator for ns points from the ACF
+
+        The simulator is memoized per ACF and size, so repeated simulations
+        from the same covariance only pay for the random numbers and one FFT.
+
+        Example
+        -------
+        >>> import wafo.spectrum.models as sm
+        >>> R = sm.Jonswap().tospecdata().tocovdata()
+        >>> simulator = R.simulator(ns=1000)
+        >>> for xs in simulator.iter_cases(cases=100, block=30,
+        ...                                random_state=1):
+        ...     xs.shape
+        (1000, 30)
+        (1000, 30)
+        (1000, 30)
+        (1000, 10)
+
+        See also
+        --------
+        CirculantSimulator
+        '''
+        self._is_valid_acf()
+        acf = np.asarray(self.data, dtype=float).ravel()
+        dt = self.sampling_period()
+        key = (hashlib.sha1(acf).hexdigest(), dt, int(ns), np.dtype(dtype))
+        simulator = _SIMULATOR_CACHE.get(key)
+        if simulator is None:
+            simulator = CirculantSimulator(acf, ns, dt=dt, dtype=dtype)
+            _SIMULATOR_CACHE[key] = simulator
+        return simulator
+
     def _get_lag_where_acf_is_almost_zero(self):
         acf = self.data.ravel()
         r0 = acf[0]
@@ -507,13 +665,13 @@ class CovData1D(PlotData):
         start_max = num_x - Nsig
         if (nw == 0) and (num_restored < len(i_unknown)):
             # move to the next missing data
-            start_ix = min(i_unknown[num_restored + 1] - overlap, start_max)
+            start_ix = min(i_unknown[num_restored] - overlap, start_max)
         else:
             start_ix = min(idx[0] + num_acf, start_max)
 
         return idx + start_ix - idx[0]
 
-    def simcond(self, xo, method='approx', i_unknown=None):
+    def simcond(self, xo, method='approx', i_unknown=None, random_state=None):
         """
         Simulate values conditionally on observed known values
 
@@ -532,6 +690,8 @@ class CovData1D(PlotData):
                 matrix.
         i_unknown : integers
             indices to spurious or missing data in x
+        random_state : None, int, RandomState or Generator
+            random number generator (default the global np.random generator)
 
         Returns
         -------
@@ -567,8 +727,10 @@ class CovData1D(PlotData):
         reconstructed data"
         in Proceedings of 9th ISOPE Conference, Vol III, pp 66-73
         """
+        rng = check_random_state(random_state)
         x = atleast_1d(xo).ravel()
-        acf = self._get_acf()
+        # the tapering keeps the truncated covariance positive definite
+        acf = self._get_acf(smooth=True)
 
         num_x = len(x)
         num_acf = len(acf)
@@ -588,7 +750,8 @@ class CovData1D(PlotData):
             warnings.warn('All data missing, returning sample from' +
                           ' the apriori distribution.')
             mu1o_std = ones(num_unknown) * sqrt(acf[0])
-            return self.sim(ns=num_unknown, cases=1)[:, 1], mu1o, mu1o_std
+            sample = self.sim(ns=num_unknown, cases=1, random_state=rng)[:, 1]
+            return sample, mu1o, mu1o_std
 
         i_known = flatnonzero(1 - isnan(x))
 
@@ -596,26 +759,20 @@ class CovData1D(PlotData):
             # exact but slow. It also may not return any result
             if num_acf > 0.3 * num_x:
                 Sigma = toeplitz(hstack((acf, zeros(num_x - num_acf))))
+                Soo, So1, S11 = self._split_cov(Sigma, i_known, i_unknown)
+                S1o_Sooinv, Sigma1o = _cond_operator(Soo, So1, S11)
+                mu1o = S1o_Sooinv.dot(x[i_known])
             else:
-                acf[0] = acf[0] * 1.00001
-                Sigma = sptoeplitz(hstack((acf, zeros(num_x - num_acf))))
-            Soo, So1, S11 = self._split_cov(Sigma, i_known, i_unknown)
-
-            if issparse(Sigma):
-                So1 = So1.todense()
-                S11 = S11.todense()
-                S1o_Sooinv = spsolve(Soo + Soo.T, 2 * So1).T
-            else:
-                Sooinv_So1, _res, _rank, _s = lstsq(Soo + Soo.T, 2 * So1,
-                                                    cond=1e-4)
-                S1o_Sooinv = Sooinv_So1.T
-            mu1o = S1o_Sooinv.dot(x[i_known])
-            Sigma1o = S11 - S1o_Sooinv.dot(So1)
+                # The truncated ACF makes Soo banded.
+                acf = r_[acf[0] * 1.00001, acf[1:]]
+                mu1o, Sigma1o = _cond_banded(acf, i_known, i_unknown,
+                                             x[i_known])
             if (diag(Sigma1o) < 0).any():
                 raise ValueError('Failed to converge to a solution')
 
             mu1o_std = sqrt(diag(Sigma1o))
-            sample[:] = rndnormnd(mu1o, Sigma1o, cases=1).ravel()
+            sample[:] = rndnormnd(mu1o, Sigma1o, cases=1,
+                                  random_state=rng).ravel()
 
         elif method.startswith('appr'):
             # approximating by only condition on the closest points
@@ -623,6 +780,9 @@ class CovData1D(PlotData):
             Nsig = min(2 * num_acf, num_x)
 
             Sigma = toeplitz(hstack((acf, zeros(Nsig - num_acf))))
+            # the conditional distribution only depends on where the unknown
+            # values are in the window, hence memoize it per gap pattern
+            conditioner = _WindowConditioner(Sigma)
             overlap = int(Nsig / 4)
             # indices to the points used
             idx = r_[0:Nsig] + max(0, min(i_unknown[0] - overlap,
@@ -638,29 +798,18 @@ class CovData1D(PlotData):
             x2 = x.copy()
 
             while ns > 0:
-                Soo, So1, S11 = self._split_cov(Sigma, t_known, t_unknown)
-                if issparse(Soo):
-                    So1 = So1.todense()
-                    S11 = S11.todense()
-                    S1o_Sooinv = spsolve(Soo + Soo.T, 2 * So1).T
-                else:
-                    Sooinv_So1, _res, _rank, _s = lstsq(Soo + Soo.T, 2 * So1,
-                                                        cond=1e-4)
-                    S1o_Sooinv = Sooinv_So1.T
-                Sigma1o = S11 - S1o_Sooinv.dot(So1)
-                if (diag(Sigma1o) < 0).any():
-                    raise ValueError('Failed to converge to a solution')
+                S1o_Sooinv, sigma1o_std, sigma1o_sqrt = conditioner(t_unknown)
 
                 ix = slice((num_restored), (num_restored + ns))
                 # standard deviation of the expected surface
-                mu1o_std[ix] = np.maximum(mu1o_std[ix], sqrt(diag(Sigma1o)))
+                mu1o_std[ix] = np.maximum(mu1o_std[ix], sigma1o_std)
 
                 # expected surface conditioned on the closest known
                 # observations from x
                 mu1o[ix] = S1o_Sooinv.dot(x2[idx[t_known]])
                 # sample conditioned on the known observations from x
                 mu1os = S1o_Sooinv.dot(x[idx[t_known]])
-                sample[ix] = rndnormnd(mu1os, Sigma1o, cases=1)
+                sample[ix] = mu1os + sigma1o_sqrt.dot(rng.standard_normal(ns))
                 if idx[-1] == num_x - 1:
                     ns = 0  # no more points to simulate
                 else:
@@ -669,7 +818,7 @@ class CovData1D(PlotData):
                     # removing indices to data which has been simulated
                     mask_unknown[idx[:-overlap]] = False
                     # data we want to simulate once more
-                    nw = sum(mask_unknown[idx[-overlap:]] is True)
+                    nw = mask_unknown[idx[-overlap:]].sum()
                     num_restored += ns - nw  # update # points simulated so far
 
                     idx = self._update_window(idx, i_unknown, num_x, num_acf,
@@ -681,6 +830,331 @@ class CovData1D(PlotData):
                     ns = len(t_unknown)  # # missing data in the interval
         return sample, mu1o, mu1o_std
 
+    def simcond_gaps(self, xo, i_unknown=None, maxgap=None, n_jobs=1,
+                     random_state=None):
+        """
+        Simulate values in each gap of xo conditioned on its closest neighbors
+
+        Parameters
+        ----------
+        xo : vector
+            timeseries with missing values given as NaN.
+        i_unknown : integer array
+            indices to spurious or missing data in xo
+        maxgap : scalar integer
+            gaps longer than maxgap are simulated with simcond(method='approx')
+            (default 2*len(acf)).
+        n_jobs : scalar integer
+            number of processes used (default 1). n_jobs <= 0 uses all cpus.
+        random_state : None, int, tuple or numpy.random.RandomState
+            source of the random numbers, see wafo.misc.check_random_state.
+
+        Returns
+        -------
+        sample, mu, sigma : ndarray
+            same as for simcond.
+
+        Notes
+        -----
+        Each run of missing values is simulated independently, conditioned on
+        the observed values at less than len(acf) lags from it. The
+        conditional distribution only depends on the pattern of missing
+        values in this window, hence it is computed once for each pattern
+        and ACF and is reused between calls. This makes it possible to fill
+        thousands of gaps in very long records, e.g., spike-cleaned data.
+
+        Example
+        -------
+        >>> import wafo.spectrum.models as sm
+        >>> R = sm.Jonswap().tospecdata().tocovdata()
+        >>> x = R.sim(ns=10000, random_state=0)[:, 1]
+        >>> inds = np.r_[100:105, 2000:2010, 5000:5005]
+        >>> sample, mu, sigma = R.simcond_gaps(x, i_unknown=inds,
+        ...                                    random_state=1)
+        >>> sample.shape
+        (20,)
+
+        See also
+        --------
+        simcond
+        """
+        rng = check_random_state(random_state)
+        x = np.array(xo, dtype=float).ravel()
+        # the tapering keeps the truncated covariance positive definite
+        acf = self._get_acf(smooth=True)
+        num_x = len(x)
+        num_acf = len(acf)
+        if maxgap is None:
+            maxgap = 2 * num_acf
+        if i_unknown is not None:
+            x[i_unknown] = nan
+        mask_unknown = isnan(x)
+        i_unknown = flatnonzero(mask_unknown)
+        num_unknown = len(i_unknown)
+
+        mu1o = zeros((num_unknown,))
+        mu1o_std = zeros((num_unknown,))
+        sample = zeros((num_unknown,))
+        if num_unknown == 0:
+            warnings.warn('No missing data, no point to continue.')
+            return sample, mu1o, mu1o_std
+
+        # start and stop of each run of missing values and its window
+        edges = np.diff(r_[0, mask_unknown.view(np.int8), 0])
+        starts, stops = flatnonzero(edges > 0), flatnonzero(edges < 0)
+        lo = np.maximum(starts - num_acf + 1, 0)
+        hi = np.minimum(stops + num_acf - 1, num_x)
+        pos = np.searchsorted(i_unknown, starts)
+        is_long = (stops - starts) > maxgap
+
+        # group the windows by their pattern of missing values
+        groups = OrderedDict()
+        for k in flatnonzero(~is_long):
+            t_unknown = flatnonzero(mask_unknown[lo[k]:hi[k]])
+            key = (hi[k] - lo[k], starts[k] - lo[k], stops[k] - lo[k],
+                   t_unknown.tostring())
+            groups.setdefault(key, (t_unknown, []))[1].append(k)
+
+        acf_key = hashlib.sha1(acf).hexdigest()
+        missing = [pattern for pattern in groups
+                   if (acf_key,) + pattern not in _GAP_CACHE]
+        distributions = parallel_map(_gap_distribution,
+                                     [(acf, pattern[0], groups[pattern][0])
+                                      for pattern in missing], n_jobs)
+        for key, distribution in zip(missing, distributions):
+            _GAP_CACHE[(acf_key,) + key] = distribution
+
+        for key, (t_unknown, ks) in groups.items():
+            S1o_Sooinv, sigma1o_std, sigma1o_sqrt = _GAP_CACHE[(acf_key,) +
+                                                               key]
+            num_window, start, stop = key[:3]
+            t_known = np.setdiff1d(np.arange(num_window), t_unknown)
+            own = slice(np.searchsorted(t_unknown, start),
+                        np.searchsorted(t_unknown, stop))
+            ks = np.asarray(ks)
+            x_known = x[lo[ks][:, None] + t_known]
+            mu = x_known.dot(S1o_Sooinv[own].T)
+            noise = rng.standard_normal((len(ks), len(t_unknown)))
+            ix = pos[ks][:, None] + np.arange(stop - start)
+            mu1o[ix] = mu
+            mu1o_std[ix] = sigma1o_std[own]
+            sample[ix] = mu + noise.dot(sigma1o_sqrt[own].T)
+
+        k_long = flatnonzero(is_long)
+        if len(k_long):
+            lags = self.args[:num_acf]
+            # simcond tapers the ACF itself
+            raw_acf = self._get_acf()
+            # RandomState has randint, Generator has integers
+            randint = getattr(rng, 'integers', None) or rng.randint
+            seeds = spawn_seeds(randint(2 ** 31 - 1), len(k_long))
+            results = parallel_map(_simcond_window,
+                                   [(raw_acf, lags, x[lo[k]:hi[k]].copy(),
+                                     seed)
+                                    for k, seed in zip(k_long, seeds)],
+                                   n_jobs)
+            for k, result in zip(k_long, results):
+                i0 = np.searchsorted(flatnonzero(mask_unknown[lo[k]:hi[k]]),
+                                     starts[k] - lo[k])
+                ix = slice(pos[k], pos[k] + stops[k] - starts[k])
+                own = slice(i0, i0 + stops[k] - starts[k])
+                sample[ix], mu1o[ix], mu1o_std[ix] = [r[own] for r in result]
+        return sample, mu1o, mu1o_std
+
+
+def _cond_operator(Soo, So1, S11, rcond=1e-4):
+    '''
+    Return S1o*inv(Soo) and conditional covariance S11 - S1o*inv(Soo)*So1
+
+    The pseudo inverse of Soo is obtained from its eigen decomposition,
+    ignoring eigenvalues smaller than rcond times the largest one. This
+    regularizes the nearly singular covariance matrices of densely sampled
+    processes. Unlike lstsq(Soo, So1, cond=rcond) negative eigenvalues are
+    ignored too, i.e., Soo is replaced by its positive semi-definite part.
+    '''
+    eigval, eigvec = eigh(Soo)
+    k = eigval > rcond * eigval.max()
+    eigvec = eigvec[:, k]
+    S1o_Sooinv = (So1.T.dot(eigvec) / eigval[k]).dot(eigvec.T)
+    return S1o_Sooinv, S11 - S1o_Sooinv.dot(So1)
+
+
+class _WindowConditioner(object):
+
+    '''
+    Conditional distribution of unknown values in a window of a stationary
+    Gaussian process, memoized per pattern of unknown values.
+
+    Parameters
+    ----------
+    sigma : array-like, shape nsig x nsig
+        covariance matrix of the values in the window
+    maxsize : scalar integer
+        maximum number of gap patterns kept in memory
+    '''
+
+    def __init__(self, sigma, maxsize=64):
+        self.sigma = sigma
+        self._cache = LRUCache(maxsize)
+
+    def __call__(self, t_unknown):
+        '''
+        Return S1o*inv(Soo), and the standard deviation and a matrix square
+        root of the conditional covariance of the unknown values at t_unknown
+        '''
+        t_unknown = np.asarray(t_unknown)
+        key = t_unknown.tostring()
+        if key not in self._cache:
+            self._cache[key] = _cond_distribution(self.sigma, t_unknown)
+        return self._cache[key]
+
+
+def _cond_distribution(sigma, t_unknown):
+    '''
+    Return S1o*inv(Soo), and the standard deviation and a matrix square root
+    of the conditional covariance of the values at t_unknown given the rest
+    '''
+    mask = zeros(len(sigma), dtype=bool)
+    mask[t_unknown] = True
+    t_known = flatnonzero(~mask)
+    Soo = sigma[t_known][:, t_known]
+    So1 = sigma[t_known][:, t_unknown]
+    S11 = sigma[t_unknown][:, t_unknown]
+    S1o_Sooinv, Sigma1o = _cond_operator(Soo, So1, S11)
+    if (diag(Sigma1o) < 0).any():
+        raise ValueError('Failed to converge to a solution')
+    eigval, eigvec = eigh(Sigma1o)
+    sigma1o_sqrt = eigvec * sqrt(eigval.clip(min=0))
+    return S1o_Sooinv, sqrt(diag(Sigma1o)), sigma1o_sqrt
+
+
+def _gap_distribution(args):
+    '''
+    Return conditional distribution of the unknown values in a gap window
+    '''
+    acf, num_window, t_unknown = args
+    num_acf = min(len(acf), num_window)
+    sigma = toeplitz(hstack((acf[:num_acf], zeros(num_window - num_acf))))
+    return _cond_distribution(sigma, t_unknown)
+
+
+def _simcond_window(args):
+    '''
+    Return conditional sample, mean and standard deviation in a gap window
+    '''
+    acf, lags, x, seed = args
+    return CovData1D(acf, lags).simcond(x, method='approx',
+                                        random_state=seed)
+
+
+def _banded_toeplitz(acf, idx):
+    '''
+    Return upper banded storage of the covariance matrix of x[idx]
+
+    x is a stationary process with covariance acf[k] for lag k < len(acf) and
+    zero otherwise. idx must be sorted. See scipy.linalg.cholesky_banded.
+    '''
+    num_acf = len(acf)
+    m = len(idx)
+    # bandwidth is the largest number of later indices closer than num_acf
+    bandwidth = (np.searchsorted(idx, idx + num_acf - 1, side='right') -
+                 np.arange(m)).max() - 1
+    ab = zeros((bandwidth + 1, m))
+    for d in range(bandwidth + 1):
+        lag = idx[d:] - idx[:m - d]
+        ab[bandwidth - d, d:] = where(lag < num_acf,
+                                      acf[np.minimum(lag, num_acf - 1)], 0)
+    return ab
+
+
+def _cond_banded(acf, i_known, i_unknown, x_known, maxsize=2 ** 22):
+    '''
+    Return conditional mean and covariance of the unknown values given the
+    known ones using a banded Cholesky factorization of Soo.
+
+    Each column of So1 is only nonzero for the known values less than
+    len(acf) lags from the unknown value. The corresponding column of
+    inv(Soo)*So1 decays exponentially away from this band, hence it is only
+    computed in a window around the band, which is widened until the
+    solution at the window edges is negligible. This makes the cost
+    proportional to the number of unknown values instead of the record
+    length times the number of unknown values, and it avoids the very slow
+    arithmetic on denormal numbers in the decayed tails of the solution.
+    The columns are processed in chunks of at most maxsize elements in order
+    to cap the memory used for many missing values.
+    '''
+    num_acf = len(acf)
+    num_known = len(i_known)
+    ab = _banded_toeplitz(acf, i_known)
+    bandwidth = len(ab) - 1
+    try:
+        chol = cholesky_banded(ab)
+
+        def solve(rhs, start=0, stop=None):
+            # Exact for the rows from start if rhs is zero before start,
+            # since the forward substitution does not depend on later rows.
+            return cho_solve_banded((chol[:, start:stop], False), rhs)
+    except LinAlgError:
+        # The truncated ACF is not positive definite. Use banded LU instead.
+        ab_full = np.vstack((ab, zeros((bandwidth, ab.shape[1]))))
+        for d in range(1, bandwidth + 1):
+            ab_full[bandwidth + d, :-d] = ab[bandwidth - d, d:]
+
+        def solve(rhs, start=0, stop=None):
+            return solve_banded((bandwidth, bandwidth),
+                                ab_full[:, start:stop], rhs)
+
+    # So1[rows[j, w], j] = band[j, w] are the nonzero elements of So1
+    lo = np.searchsorted(i_known, i_unknown - num_acf + 1)
+    hi = np.searchsorted(i_known, i_unknown + num_acf)
+    width = max((hi - lo).max(), 1)
+    in_band = np.arange(width) < (hi - lo)[:, None]
+    rows = np.minimum(lo[:, None] + np.arange(width), max(num_known - 1, 0))
+    lag = np.abs(i_known[rows] - i_unknown[:, None])
+    band = where(in_band, acf[np.minimum(lag, num_acf - 1)], 0)
+
+    mu1o = (band * solve(x_known)[rows]).sum(axis=1)
+    lag = np.abs(i_unknown[:, None] - i_unknown[None, :])
+    Sigma1o = where(lag < num_acf, acf[np.minimum(lag, num_acf - 1)], 0)
+
+    num_unknown = len(i_unknown)
+    tol = np.finfo(float).eps
+    margin = 8 * num_acf
+    max_cols = max(maxsize // max(band.size, 1), 1)
+    # unknown values with overlapping bands are solved together
+    group_stops = r_[flatnonzero(lo[1:] >= hi[:-1]) + 1, num_unknown]
+    start = 0
+    for group_stop in group_stops:
+        while start < group_stop:
+            ix = slice(start, min(group_stop, start + max_cols))
+            cols = np.arange(ix.stop - start)[:, None].repeat(width, axis=1)
+            mask = in_band[ix]
+            while True:
+                first = max(lo[start] - margin, 0)
+                last = min(hi[ix.stop - 1] + margin, num_known)
+                So1 = zeros((last - first, ix.stop - start))
+                So1[rows[ix][mask] - first, cols[mask]] = band[ix][mask]
+                sooinv_so1 = solve(So1, first, last)
+                size = np.abs(sooinv_so1)
+                edge = max(size[:bandwidth + 1].max() if first else 0,
+                           size[-bandwidth - 1:].max()
+                           if last < num_known else 0)
+                if edge <= tol * size.max():
+                    break
+                margin *= 2
+            # only the unknown values with bands inside the window are
+            # correlated with the unknown values in ix
+            ix2 = slice(np.searchsorted(hi, first, side='right'),
+                        np.searchsorted(lo, last))
+            local = rows[ix2] - first
+            weights = where(in_band[ix2] & (local >= 0) &
+                            (local < last - first), band[ix2], 0)
+            local = local.clip(0, last - first - 1)
+            Sigma1o[ix2, ix] -= np.einsum('jw,jwc->jc', weights,
+                                          sooinv_so1[local])
+            start = ix.stop
+    return mu1o, Sigma1o
+
 
 def sptoeplitz(x):
     k = flatnonzero(x)
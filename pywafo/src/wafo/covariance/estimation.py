@@ -1,174 +1,379 @@
-'''
-Created on 10. mai 2014
-
-@author: pab
-'''
-import numpy as np
-from numpy.fft import fft
-from wafo.misc import nextpow2
-from scipy.signal.windows import get_window
-from wafo.containers import PlotData
-from wafo.covariance import CovData1D
-import warnings
-
-
-def sampling_period(t_vec):
-    '''
-    Returns sampling interval
-
-     Returns
-     -------
-     dt : scalar
-         sampling interval, unit:
-         [s] if lagtype=='t'
-         [m] otherwise
-
-     See also
-    '''
-    dt1 = t_vec[1] - t_vec[0]
-    n = len(t_vec) - 1
-    t = t_vec[-1] - t_vec[0]
-    dt = t / n
-    if abs(dt - dt1) > 1e-10:
-        warnings.warn('Data is not uniformly sampled!')
-    return dt
-
-
-class CovarianceEstimator(object):
-    '''
-    Class for estimating AutoCovariance from timeseries
-
-    Parameters
-    ----------
-    lag : scalar, int
-        maximum time-lag for which the ACF is estimated.
-        (Default lag where ACF is zero)
-    tr : transformation object
-        the transformation assuming that x is a sample of a transformed
-        Gaussian process. If g is None then x  is a sample of a Gaussian
-        process (Default)
-    detrend : function
-        defining detrending performed on the signal before estimation.
-        (default detrend_mean)
-    window : vector of length NFFT or function
-        To create window vectors see numpy.blackman, numpy.hamming,
-        numpy.bartlett, scipy.signal, scipy.signal.get_window etc.
-    flag : string, 'biased' or 'unbiased'
-        If 'unbiased' scales the raw correlation by 1/(n-abs(k)),
-        where k is the index into the result, otherwise scales the raw
-        cross-correlation by 1/n. (default)
-    norm : bool
-        True if normalize output to one
-    dt : scalar
-        time-step between data points (default see sampling_period).
-    '''
-    def __init__(self, lag=None, tr=None, detrend=None, window='boxcar',
-                 flag='biased', norm=False, dt=None):
-        self.lag = lag
-        self.tr = tr
-        self.detrend = detrend
-        self.window = window
-        self.flag = flag
-        self.norm = norm
-        self.dt = dt
-
-    def _estimate_lag(self, R, Ncens):
-        Lmax = min(300, len(R) - 1)  # maximum lag if L is undetermined
-        # finding where ACF is less than 2 st. deviations.
-        sigma = np.sqrt(np.r_[0, R[0] ** 2,
-                              R[0] ** 2 + 2 * np.cumsum(R[1:] ** 2)] / Ncens)
-        lag = Lmax + 2 - (np.abs(R[Lmax::-1]) > 2 * sigma[Lmax::-1]).argmax()
-        if self.window == 'parzen':
-            lag = int(4 * lag / 3)
-        # print('The default L is set to %d' % L)
-        return lag
-
-    def tocovdata(self, timeseries):
-        '''
-        Return auto covariance function from data.
-
-        Return
-        -------
-        R : CovData1D object
-            with attributes:
-            data : ACF vector length L+1
-            args : time lags  length L+1
-            sigma : estimated large lag standard deviation of the estimate
-                     assuming x is a Gaussian process:
-                     if R(k)=0 for all lags k>q then an approximation
-                     of the variance for large samples due to Bartlett
-                     var(R(k))=1/N*(R(0)^2+2*R(1)^2+2*R(2)^2+ ..+2*R(q)^2)
-                     for  k>q and where  N=length(x). Special case is
-                     white noise where it equals R(0)^2/N for k>0
-            norm : bool
-                If false indicating that R is not normalized
-
-         Example:
-         --------
-         >>> import wafo.data
-         >>> import wafo.objects as wo
-         >>> x = wafo.data.sea()
-         >>> ts = wo.mat2timeseries(x)
-         >>> acf = ts.tocovdata(150)
-         >>> h = acf.plot()
-        '''
-        lag = self.lag
-        window = self.window
-        detrend = self.detrend
-
-        try:
-            x = timeseries.data.flatten('F')
-            dt = timeseries.sampling_period()
-        except Exception:
-            x = timeseries[:, 1:].flatten('F')
-            dt = sampling_period(timeseries[:, 0])
-        if not (self.dt is None):
-            dt = self.dt
-
-        if not (self.tr is None):
-            x = self.tr.dat2gauss(x)
-
-        n = len(x)
-        indnan = np.isnan(x)
-        if any(indnan):
-            x = x - x[1 - indnan].mean()
-            Ncens = n - indnan.sum()
-            x[indnan] = 0.
-        else:
-            Ncens = n
-            x = x - x.mean()
-        if hasattr(detrend, '__call__'):
-            x = detrend(x)
-
-        nfft = 2 ** nextpow2(n)
-        Rper = abs(fft(x, nfft)) ** 2 / Ncens  # Raw periodogram
-        R = np.real(fft(Rper)) / nfft  # ifft = fft/nfft since Rper is real!
-
-        if self.flag.startswith('unbiased'):
-            # unbiased result, i.e. divide by n-abs(lag)
-            R = R[:Ncens] * Ncens / np.arange(Ncens, 1, -1)
-
-        if self.norm:
-            R = R / R[0]
-
-        if lag is None:
-            lag = self._estimate_lag(R, Ncens)
-        lag = min(lag, n - 2)
-        if isinstance(window, str) or type(window) is tuple:
-            win = get_window(window, 2 * lag - 1)
-        else:
-            win = np.asarray(window)
-        R[:lag] = R[:lag] * win[lag - 1::]
-        R[lag] = 0
-        lags = slice(0, lag + 1)
-        t = np.linspace(0, lag * dt, lag + 1)
-        acf = CovData1D(R[lags], t)
-        acf.sigma = np.sqrt(np.r_[0, R[0] ** 2,
-                            R[0] ** 2 + 2 * np.cumsum(R[1:] ** 2)] / Ncens)
-        acf.children = [PlotData(-2. * acf.sigma[lags], t),
-                        PlotData(2. * acf.sigma[lags], t)]
-        acf.plot_args_children = ['r:']
-        acf.norm = self.norm
-        return acf
-
-    __call__ = tocovdata
+'''
+Created on 10. mai 2014
+
+@author: pab
+'''
+import numpy as np
+from numpy.fft import rfft, irfft
+from wafo.misc import nextpow2
+try:
+    from scipy.fftpack import next_fast_len
+except ImportError:  # scipy < 0.18
+    def next_fast_len(target):
+        return 2 ** nextpow2(target)
+from scipy.signal.windows import get_window
+from wafo.containers import PlotData
+from wafo.covariance import CovData1D
+import warnings
+
+
+def sampling_period(t_vec):
+    '''
+    Returns sampling interval
+
+     Returns
+     -------
+     dt : scalar
+         sampling interval, unit:
+         [s] if lagtype=='t'
+         [m] otherwise
+
+     See also
+    '''
+    dt1 = t_vec[1] - t_vec[0]
+    n = len(t_vec) - 1
+    t = t_vec[-1] - t_vec[0]
+    dt = t / n
+    if abs(dt - dt1) > 1e-10:
+        warnings.warn('Data is not uniformly sampled!')
+    return dt
+
+
+_LMAX = 300  # maximum lag if L is undetermined
+
+
+def _lagged_products(x, y=None, kmax=0, method='auto', nfft=None):
+    '''
+    Return sum of lagged products r[k] = sum_t x[t] * y[t + k], k=0..kmax
+
+    Parameters
+    ----------
+    x : array, shape (n, m)
+    y : array, shape (n + kmax, m) or shorter
+        Terms where t + k is beyond the end of y are omitted.
+        (default y = x)
+    kmax : int
+        maximum lag.
+    method : string, 'auto', 'fft' or 'direct'
+        'direct' sums the lagged products in O(n*kmax) operations, 'fft'
+        uses a zero padded FFT of length nfft >= n + kmax so that the result
+        is not circular. 'auto' selects 'direct' when kmax is small compared
+        to log2(n).
+    nfft : int
+        FFT length (default next_fast_len(n + kmax)). Keeping it fixed for
+        repeated calls lets the FFT reuse its cached plan.
+
+    Returns
+    -------
+    r : array, shape (kmax + 1, m)
+    '''
+    nx = len(x)
+    same = y is None
+    y = x if same else y[:nx + kmax]
+    if method == 'auto':
+        method = 'direct' if kmax + 1 <= 3 * np.log2(max(nx, 2)) else 'fft'
+    if method == 'direct':
+        r = np.zeros((kmax + 1, x.shape[1]))
+        for k in range(min(kmax + 1, len(y))):
+            nk = min(nx, len(y) - k)
+            r[k] = np.einsum('ij,ij->j', x[:nk], y[k:k + nk])
+        return r
+    elif method != 'fft':
+        raise ValueError('Unknown method (%s)' % method)
+    if nfft is None:
+        nfft = next_fast_len(nx + kmax)
+    X = rfft(x, nfft, axis=0)
+    if same:
+        Rper = abs(X) ** 2  # Raw periodogram
+    else:
+        Rper = X.conj() * rfft(y, nfft, axis=0)
+    return irfft(Rper, nfft, axis=0)[:kmax + 1]
+
+
+def _chunked_lagged_products(x, kmax, chunksize, prepare, method='auto'):
+    '''
+    Return lagged products of prepare(x) accumulated over chunks of x.
+
+    Only chunksize + kmax samples of x are in memory at a time, so x may
+    be a memory mapped array.
+    '''
+    n = len(x)
+    nfft = next_fast_len(chunksize + kmax)  # same FFT length for all chunks
+    r = 0
+    for start in range(0, n, chunksize):
+        stop = min(start + chunksize, n)
+        y = prepare(x[start:min(stop + kmax, n)])
+        r = r + _lagged_products(y[:stop - start], y, kmax, method, nfft)
+    return r
+
+
+class CovarianceEstimator(object):
+    '''
+    Class for estimating AutoCovariance from timeseries
+
+    Parameters
+    ----------
+    lag : scalar, int
+        maximum time-lag for which the ACF is estimated.
+        (Default lag where ACF is zero)
+    tr : transformation object
+        the transformation assuming that x is a sample of a transformed
+        Gaussian process. If g is None then x  is a sample of a Gaussian
+        process (Default)
+    detrend : function
+        defining detrending performed on the signal before estimation.
+        (default detrend_mean)
+    window : vector of length NFFT or function
+        To create window vectors see numpy.blackman, numpy.hamming,
+        numpy.bartlett, scipy.signal, scipy.signal.get_window etc.
+    flag : string, 'biased' or 'unbiased'
+        If 'unbiased' scales the raw correlation by 1/(n-abs(k)),
+        where k is the index into the result, otherwise scales the raw
+        cross-correlation by 1/n. (default)
+    norm : bool
+        True if normalize output to one
+    dt : scalar
+        time-step between data points (default see sampling_period).
+    method : string, 'auto', 'fft' or 'direct'
+        'fft' computes the ACF from the zero padded periodogram, 'direct'
+        sums the lagged products in O(n*lag) operations. 'auto' selects
+        'direct' when lag is small compared to log2(n). (default)
+    chunksize : int, optional
+        If given the data are read and accumulated in chunks of chunksize
+        samples, e.g., to estimate the ACF of memory mapped records.
+        Detrending is then restricted to removing the mean.
+    '''
+    def __init__(self, lag=None, tr=None, detrend=None, window='boxcar',
+                 flag='biased', norm=False, dt=None, method='auto',
+                 chunksize=None):
+        self.lag = lag
+        self.tr = tr
+        self.detrend = detrend
+        self.window = window
+        self.flag = flag
+        self.norm = norm
+        self.dt = dt
+        self.method = method
+        self.chunksize = chunksize
+
+    def _estimate_lag(self, R, Ncens):
+        Lmax = min(_LMAX, len(R) - 1)
+        # finding where ACF is less than 2 st. deviations.
+        sigma = np.sqrt(np.r_[0, R[0] ** 2,
+                              R[0] ** 2 + 2 * np.cumsum(R[1:] ** 2)] / Ncens)
+        lag = Lmax + 2 - (np.abs(R[Lmax::-1]) > 2 * sigma[Lmax::-1]).argmax()
+        if self.window == 'parzen':
+            lag = int(4 * lag / 3)
+        # print('The default L is set to %d' % L)
+        return lag
+
+    def _get_data(self, timeseries):
+        try:
+            x = timeseries.data
+            dt = timeseries.sampling_period()
+        except Exception:
+            x = timeseries[:, 1:]
+            dt = sampling_period(timeseries[:, 0])
+        if not (self.dt is None):
+            dt = self.dt
+        x = np.asarray(x)
+        if x.ndim == 1:
+            x = x[:, None]
+        return x, dt
+
+    def _transform(self, x):
+        x = np.asarray(x, dtype=float)
+        if not (self.tr is None):
+            x = self.tr.dat2gauss(x.ravel()).reshape(x.shape)
+        return x
+
+    def _center(self, x):
+        """Return x with each channel centered and detrended, NaNs zeroed.
+
+        The number of valid (non-NaN) values in each channel is returned
+        as Ncens.
+        """
+        x = self._transform(x)
+        indnan = np.isnan(x)
+        Ncens = len(x) - indnan.sum(axis=0)
+        x = np.where(indnan, 0., x - np.nanmean(x, axis=0))
+        detrend = self.detrend
+        if hasattr(detrend, '__call__'):
+            x = np.column_stack([detrend(xi) for xi in x.T])
+        return x, Ncens
+
+    def _chunked_lagged_products(self, x, kmax):
+        chunksize = self.chunksize
+        total = Ncens = 0
+        for start in range(0, len(x), chunksize):
+            xi = self._transform(x[start:start + chunksize])
+            valid = ~np.isnan(xi)
+            total = total + np.where(valid, xi, 0).sum(axis=0)
+            Ncens = Ncens + valid.sum(axis=0)
+        mean = total / Ncens
+
+        def prepare(xi):
+            xi = self._transform(xi) - mean
+            return np.where(np.isnan(xi), 0., xi)
+        r = _chunked_lagged_products(x, kmax, chunksize, prepare,
+                                     self.method)
+        return r, Ncens
+
+    def tocovdata(self, timeseries):
+        '''
+        Return auto covariance function from data.
+
+        Return
+        -------
+        R : CovData1D object
+            with attributes:
+            data : ACF vector length L+1
+            args : time lags  length L+1
+            sigma : estimated large lag standard deviation of the estimate
+                     assuming x is a Gaussian process:
+                     if R(k)=0 for all lags k>q then an approximation
+                     of the variance for large samples due to Bartlett
+                     var(R(k))=1/N*(R(0)^2+2*R(1)^2+2*R(2)^2+ ..+2*R(q)^2)
+                     for  k>q and where  N=length(x). Special case is
+                     white noise where it equals R(0)^2/N for k>0
+            norm : bool
+                If false indicating that R is not normalized
+
+         Example:
+         --------
+         >>> import wafo.data
+         >>> import wafo.objects as wo
+         >>> x = wafo.data.sea()
+         >>> ts = wo.mat2timeseries(x)
+         >>> acf = ts.tocovdata(150)
+         >>> h = acf.plot()
+        '''
+        lag = self.lag
+        window = self.window
+
+        x, dt = self._get_data(timeseries)
+        n = len(x)
+        # Only the lags needed are computed, also when lag is estimated.
+        kmax = int(4 * (_LMAX + 2) / 3) if lag is None else lag
+        kmax = max(min(kmax, n - 1), 0)
+        if self.chunksize is None:
+            x, Ncens = self._center(x)
+            r = _lagged_products(x, None, kmax, self.method)
+        else:
+            r, Ncens = self._chunked_lagged_products(x, kmax)
+        # The channels are treated as independent realizations of the same
+        # process and averaged.
+        R = r.sum(axis=1)
+        if self.flag.startswith('unbiased'):
+            # unbiased result, i.e. divide by n-abs(lag)
+            k = np.arange(kmax + 1)
+            nk = np.maximum(Ncens[:, None] - k, 0).sum(axis=0)
+            R = R / np.maximum(nk, 1)
+        else:
+            R = R / Ncens.sum()
+        Ncens = Ncens.sum()
+
+        if self.norm:
+            R = R / R[0]
+
+        if lag is None:
+            lag = self._estimate_lag(R, Ncens)
+        lag = min(lag, n - 2)
+        if isinstance(window, str) or type(window) is tuple:
+            win = get_window(window, 2 * lag - 1)
+        else:
+            win = np.asarray(window)
+        R[:lag] = R[:lag] * win[lag - 1::]
+        R[lag] = 0
+        lags = slice(0, lag + 1)
+        t = np.linspace(0, lag * dt, lag + 1)
+        acf = CovData1D(R[lags], t)
+        acf.sigma = np.sqrt(np.r_[0, R[0] ** 2,
+                            R[0] ** 2 + 2 * np.cumsum(R[1:] ** 2)] / Ncens)
+        acf.children = [PlotData(-2. * acf.sigma[lags], t),
+                        PlotData(2. * acf.sigma[lags], t)]
+        acf.plot_args_children = ['r:']
+        acf.norm = self.norm
+        return acf
+
+    __call__ = tocovdata
+
+    def tocrosscov(self, timeseries):
+        '''
+        Return auto and cross covariance functions of multichannel data.
+
+        Returns
+        -------
+        R : array, shape (lag+1, m, m)
+            R[k, i, j] = E[x_i(t) * x_j(t+k*dt)], where m is the number of
+            channels. The lag window is applied as in tocovdata and
+            R[k, j, i] gives the covariance at the negative lag -k.
+        t : array, shape (lag+1,)
+            time lags.
+
+        Notes
+        -----
+        All channels are transformed in one zero padded FFT and the cross
+        products are formed one channel at a time, so the work space scales
+        linearly with the number of channels. If lag is not given it is
+        estimated from the average of the auto covariances.
+
+        Example
+        -------
+        >>> import wafo.data
+        >>> import wafo.objects as wo
+        >>> from wafo.covariance.estimation import CovarianceEstimator
+        >>> x = wafo.data.sea()
+        >>> ts = wo.TimeSeries(np.c_[x[:-2, 1], x[2:, 1]], x[:-2, 0])
+        >>> R, t = CovarianceEstimator(lag=10).tocrosscov(ts)
+        >>> R.shape
+        (11, 2, 2)
+        >>> np.allclose(R[:-3, 0, 1], R[2:-1, 0, 0], atol=1e-3)
+        True
+        '''
+        x, dt = self._get_data(timeseries)
+        valid = ~np.isnan(x)
+        x, Ncens = self._center(x)
+        n, m = x.shape
+
+        lag = self.lag
+        kmax = int(4 * (_LMAX + 2) / 3) if lag is None else lag
+        kmax = max(min(kmax, n - 1), 0)
+        nfft = next_fast_len(n + kmax)
+        X = rfft(x, nfft, axis=0)
+        if lag is None:
+            R0 = irfft((abs(X) ** 2).sum(axis=1), nfft) / Ncens.sum()
+            lag = self._estimate_lag(R0[:kmax + 1], Ncens.sum())
+        lag = min(lag, n - 2)
+
+        unbiased = self.flag.startswith('unbiased')
+        if valid.all():
+            counts = np.ones((m, m)) * (n - np.arange(lag + 1))[:, None, None]
+        else:
+            V = rfft(valid.astype(float), nfft, axis=0)
+            counts = np.empty((lag + 1, m, m))
+        R = np.empty((lag + 1, m, m))
+        for i in range(m):
+            R[:, i] = irfft(X[:, i:i + 1].conj() * X, nfft,
+                            axis=0)[:lag + 1]
+            if not valid.all():
+                counts_i = irfft(V[:, i:i + 1].conj() * V, nfft,
+                                 axis=0)[:lag + 1]
+                counts[:, i] = np.maximum(np.round(counts_i), 1)
+        if unbiased:
+            R = R / counts
+        else:
+            R = R / counts[0]
+        if self.norm:
+            std = np.sqrt(np.diag(R[0]))
+            R = R / (std[:, None] * std[None, :])
+
+        window = self.window
+        if isinstance(window, str) or type(window) is tuple:
+            win = get_window(window, 2 * lag - 1)
+        else:
+            win = np.asarray(window)
+        R[:lag] = R[:lag] * win[lag - 1::, None, None]
+        R[lag] = 0
+        t = np.linspace(0, lag * dt, lag + 1)
+        return R, t
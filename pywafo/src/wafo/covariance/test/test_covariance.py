@@ -1,6 +1,7 @@
 from numpy.testing import (run_module_suite, assert_equal,
                            assert_array_almost_equal)
 # assert_almost_equal, assert_array_equal)
+import numpy as np
 import wafo.spectrum.models as sm
 # from wafo.covariance import CovData1D
 
@@ -24,5 +25,144 @@ def test_covariance():
                                           -2.20056021, -1.84451748], decimal=3)
 
 
+def test_sim_random_state():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    R = S.tocovdata()
+    x0 = R.sim(ns=100, dt=0.2, iseed=0)
+    x1 = R.sim(ns=100, dt=0.2, random_state=np.random.RandomState(0))
+    assert_array_almost_equal(x0, x1)
+
+    inds = np.arange(40, 60)
+    xo = x0[:, 1].copy()
+    s0 = R.simcond(xo.copy(), i_unknown=inds, random_state=1)[0]
+    s1 = R.simcond(xo.copy(), i_unknown=inds, random_state=1)[0]
+    assert_array_almost_equal(s0, s1)
+
+
+def test_circulant_simulator():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    R = S.tocovdata()
+    simulator = R.simulator(ns=100)
+    assert(R.simulator(ns=100) is simulator)
+
+    x = simulator.sim(cases=5, random_state=0)
+    blocks = list(simulator.iter_cases(cases=5, block=2, random_state=0))
+    assert_equal([b.shape for b in blocks], [(100, 2), (100, 2), (100, 1)])
+    assert_equal(x.shape, (100, 5))
+
+    simulator32 = R.simulator(ns=100, dtype=np.float32)
+    xt = list(simulator32.iter_time(nblocks=3, random_state=0))
+    assert_equal(len(xt), 3)
+    assert_equal(xt[0].dtype, np.float32)
+
+
+def test_simcond_banded():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    R = S.tocovdata()
+    x = R.sim(ns=400, random_state=0)[:, 1]
+    inds = np.r_[100:110, 300:305]
+    # the truncated ACF is short compared to the record, hence the exact
+    # method uses a banded factorization which must agree with a dense one
+    sample, mu, sigma = R.simcond(x.copy(), method='exact',
+                                  i_unknown=inds, random_state=1)
+    acf = R._get_acf(smooth=True)
+    n = len(acf)
+    acf = np.r_[acf[0] * 1.00001, acf[1:]]
+    lag = np.abs(np.arange(400)[:, None] - np.arange(400)[None, :])
+    Sigma = np.where(lag < n, acf[np.minimum(lag, n - 1)], 0)
+    i_known = np.setdiff1d(np.arange(400), inds)
+    So1 = Sigma[i_known][:, inds]
+    S1o_Sooinv = np.linalg.solve(Sigma[i_known][:, i_known], So1).T
+    assert_array_almost_equal(mu, S1o_Sooinv.dot(x[i_known]))
+    assert_array_almost_equal(sigma**2, np.diag(Sigma[inds][:, inds] -
+                                                S1o_Sooinv.dot(So1)))
+
+
+def test_simcond_banded_far_gaps():
+    R = sm.Jonswap().tospecdata().tocovdata()
+    num_x = 3000
+    x = R.sim(ns=num_x, random_state=0)[:, 1]
+    inds = np.r_[0:5, 1000:1010, 2995:3000]
+    # the gaps are solved in separate windows much shorter than the record
+    sample, mu, sigma = R.simcond(x.copy(), method='exact',
+                                  i_unknown=inds, random_state=1)
+    acf = R._get_acf(smooth=True)
+    n = len(acf)
+    acf = np.r_[acf[0] * 1.00001, acf[1:]]
+    lag = np.abs(np.arange(num_x)[:, None] - np.arange(num_x)[None, :])
+    Sigma = np.where(lag < n, acf[np.minimum(lag, n - 1)], 0)
+    i_known = np.setdiff1d(np.arange(num_x), inds)
+    So1 = Sigma[i_known][:, inds]
+    S1o_Sooinv = np.linalg.solve(Sigma[i_known][:, i_known], So1).T
+    assert_array_almost_equal(mu, S1o_Sooinv.dot(x[i_known]))
+    assert_array_almost_equal(sigma**2, np.diag(Sigma[inds][:, inds] -
+                                                S1o_Sooinv.dot(So1)))
+
+
+def test_simcond_approx_gap():
+    R = sm.Jonswap().tospecdata().tocovdata()
+    x = R.sim(ns=4000, random_state=0)[:, 1]
+    # the untapered ACF gives an indefinite conditional covariance here
+    sample, mu, sigma = R.simcond(x.copy(), method='approx',
+                                  i_unknown=np.r_[1000:1010],
+                                  random_state=1)
+    assert(np.all(sigma > 0))
+    assert(np.all(sigma <= np.sqrt(R.data[0])))
+
+
+def test_simcond_exact_long_record():
+    R = sm.Jonswap().tospecdata().tocovdata()
+    x = R.sim(ns=20000, random_state=0)[:, 1]
+    inds = np.r_[500:520]
+    sample, mu, sigma = R.simcond(x.copy(), method='exact', i_unknown=inds,
+                                  random_state=1)
+    assert_equal(sample.shape, (20,))
+    assert(np.all(np.isfinite(mu)))
+    # the conditional variance is largest in the middle of the gap and
+    # never exceeds the variance of the process
+    assert(np.all(sigma > 0))
+    assert(np.all(sigma <= np.sqrt(R.data[0])))
+    assert(sigma[10] > sigma[0])
+
+
+def test_simcond_gaps():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    R = S.tocovdata()
+    x = R.sim(ns=5000, random_state=0)[:, 1]
+    # the two short gaps share the same pattern, the last one is long
+    inds = np.r_[100:103, 1000:1003, 3000:3500]
+    sample, mu, sigma = R.simcond_gaps(x, i_unknown=inds, random_state=1)
+    assert_equal(sample.shape, (506,))
+    assert_array_almost_equal(sigma[:3], sigma[3:6])
+    assert(np.all(sigma[:6] < sigma[250]))
+
+    sample2, mu2, sigma2 = R.simcond_gaps(x, i_unknown=inds,
+                                          random_state=1, n_jobs=2)
+    assert_array_almost_equal(sample, sample2)
+    assert_array_almost_equal(mu, mu2)
+
+
+def test_covariance_estimator():
+    from wafo.covariance.estimation import CovarianceEstimator
+    rng = np.random.RandomState(1)
+    n = 1024
+    x = np.convolve(rng.randn(n + 9), np.ones(10) / 10, 'valid')
+    data = np.c_[np.arange(n) * 0.1, x]
+    xc = x - x.mean()
+    r = np.correlate(xc, xc, 'full')[n - 1:]
+    unbiased = r / np.arange(n, 0, -1)
+    for flag, ref in [('biased', r / n), ('unbiased', unbiased)]:
+        for method in ['fft', 'direct']:
+            R = CovarianceEstimator(lag=40, flag=flag, method=method)(data)
+            assert_array_almost_equal(R.data[:40], ref[:40])
+            R = CovarianceEstimator(lag=40, flag=flag, method=method,
+                                    chunksize=100)(data)
+            assert_array_almost_equal(R.data[:40], ref[:40])
+
+
 if __name__ == '__main__':
     run_module_suite()
@@ -0,0 +1,332 @@
+'''
+Fatigue damage from cycle matrices
+
+Cycles are first counted into a compact cycle (rainflow) matrix over a fixed
+grid of levels, and the Palmgren-Miner damage is then evaluated for many
+S-N curves at once as a matrix product between the damage per cycle of each
+curve and the cycle counts.
+'''
+from __future__ import division
+import numpy as np
+from wafo.misc import parallel_map
+
+__all__ = ['cc2cmat', 'cmat2dam', 'sum_cmat', 'SNCurves']
+
+
+def _levels(param):
+    a, b, n = param
+    return np.linspace(a, b, int(n))
+
+
+def _cell_index(param, x):
+    '''Return index of the level nearest to x, clipped to the grid.'''
+    a, b, n = param
+    n = int(n)
+    scale = (n - 1) / (b - a)
+    return np.clip(np.round((np.asarray(x) - a) * scale), 0, n - 1).astype(int)
+
+
+def cc2cmat(param, cc, weights=None):
+    '''
+    Return cycle matrix from a cycle count.
+
+    Parameters
+    ----------
+    param : (a, b, n)
+        Parameter vector, [a b n] defines the discretization levels
+        u = linspace(a, b, n).
+    cc : array-like, shape (nc, 2) or CyclePairs object
+        cycle count with minima in column 0 and maxima in column 1.
+    weights : array-like, shape (nc,), optional
+        weight of each cycle, e.g., 0.5 for half cycles (default 1).
+
+    Returns
+    -------
+    F : ndarray, shape (n, n)
+        cycle matrix, F[i, j] is the number of cycles with minimum at level
+        u[i] and maximum at level u[j]. Each extreme is rounded to the
+        nearest level.
+
+    Example
+    -------
+    >>> cc = np.array([[-1., 1.], [-1., 0.9], [0., 1.]])
+    >>> F = cc2cmat((-1, 1, 3), cc)
+    >>> F
+    array([[ 0.,  0.,  2.],
+           [ 0.,  0.,  1.],
+           [ 0.,  0.,  0.]])
+
+    See also
+    --------
+    cmat2dam, sum_cmat, wafo.misc.mctp2rfc
+    '''
+    if hasattr(cc, 'get_minima_and_maxima'):
+        cc = np.column_stack(cc.get_minima_and_maxima())
+    cc = np.asarray(cc, dtype=float).reshape(-1, 2)
+    n = int(param[2])
+    index = _cell_index(param, cc)
+    F = np.bincount(index[:, 0] * n + index[:, 1], weights=weights,
+                    minlength=n * n)
+    return F.reshape(n, n).astype(float)
+
+
+def _cc2cmat(args):
+    param, cc, weights = args
+    return cc2cmat(param, cc, weights)
+
+
+def sum_cmat(param, ccs, n_jobs=1):
+    '''
+    Return the sum of cycle matrices for a sequence of cycle counts.
+
+    Parameters
+    ----------
+    param : (a, b, n)
+        discretization levels, see cc2cmat.
+    ccs : sequence
+        of cycle counts, e.g., one for each file or record. An item may also
+        be a (cc, weights) tuple.
+    n_jobs : int
+        number of worker processes used for the binning (default 1).
+
+    Returns
+    -------
+    F : ndarray, shape (n, n)
+        the accumulated cycle matrix. Cycle matrices on the same levels are
+        additive, so partial results from different workers can also simply
+        be added.
+
+    Example
+    -------
+    >>> ccs = [np.array([[-1., 1.]]), np.array([[-1., 0.9], [0., 1.]])]
+    >>> np.allclose(sum_cmat((-1, 1, 3), ccs),
+    ...             cc2cmat((-1, 1, 3), np.vstack(ccs)))
+    True
+    '''
+    tasks = []
+    for cc in ccs:
+        cc, weights = cc if isinstance(cc, tuple) else (cc, None)
+        if hasattr(cc, 'get_minima_and_maxima'):
+            cc = np.column_stack(cc.get_minima_and_maxima())
+        tasks.append((param, cc, weights))
+    n = int(param[2])
+    F = np.zeros((n, n))
+    for Fi in parallel_map(_cc2cmat, tasks, n_jobs):
+        F += Fi
+    return F
+
+
+def _cmat_cycles(param, F):
+    '''Return amplitude, mean and counts of the non-empty cells of F.
+
+    F may be a single cycle matrix of shape (n, n) or a stack of shape
+    (nmat, n, n).
+    '''
+    u = _levels(param)
+    F = np.asarray(F, dtype=float)
+    counts = F.reshape(-1, len(u) * len(u))
+    i, j = divmod(np.flatnonzero(np.any(counts != 0, axis=0)), len(u))
+    amp = np.abs(u[j] - u[i]) / 2.
+    mean = (u[j] + u[i]) / 2.
+    return amp, mean, counts[:, i * len(u) + j]
+
+
+def cmat2dam(param, F, beta, K=1):
+    '''
+    Return Palmgren-Miner damage for a cycle matrix.
+
+    Parameters
+    ----------
+    param : (a, b, n)
+        discretization levels, see cc2cmat.
+    F : array-like, shape (n, n)
+        cycle matrix.
+    beta : array-like, size m
+        Beta-values, material parameter.
+    K : scalar, optional
+        K-value, material parameter.
+
+    Returns
+    -------
+    D : ndarray, size m
+        Damage, D[i] = K * sum(F * a**beta[i]) with a = (u[j] - u[i]) / 2
+
+    Example
+    -------
+    >>> cc = np.array([[-1., 1.], [-1., 0.9], [0., 1.]])
+    >>> F = cc2cmat((-1, 1, 3), cc)
+    >>> cmat2dam((-1, 1, 3), F, beta=[1, 2])
+    array([ 2.5 ,  2.25])
+
+    See also
+    --------
+    cc2cmat, SNCurves
+    '''
+    amp, _mean, counts = _cmat_cycles(param, F)
+    beta = np.atleast_1d(beta).ravel()
+    damage_per_cycle = K * amp ** beta[:, None]
+    return damage_per_cycle.dot(counts[0])
+
+
+class SNCurves(object):
+    '''
+    A collection of S-N curves evaluated jointly.
+
+    Parameters
+    ----------
+    m : array-like
+        slope (inverse) of the S-N curve, N = K * S**(-m), for S >= knee.
+    K : array-like
+        intercept of the S-N curve.
+    m2 : array-like, optional
+        slope below the knee for bi-linear curves (default m). The intercept
+        below the knee is chosen so that the curve is continuous.
+    knee : array-like, optional
+        stress amplitude at the slope change (default 0).
+    endurance : array-like, optional
+        endurance limit: cycles with amplitude below it do not give any
+        damage (default 0).
+    ultimate : array-like, optional
+        ultimate strength used for the Goodman mean-stress correction
+        S = S_a / (1 - S_m / ultimate), applied to tensile mean stresses
+        only. (default inf, i.e., no correction)
+
+    All parameters are broadcast against each other and define one curve per
+    element, e.g., 10^4 structural details.
+
+    Notes
+    -----
+    The damage of a cycle matrix F is
+        D[c] = sum_ij F[i, j] / N_c(S_ij)
+    where S_ij is the (mean stress corrected) amplitude of the cycles in
+    cell (i, j). Only the non-empty cells enter, and the sum for all curves
+    is evaluated as a matrix product.
+
+    Example
+    -------
+    >>> sn = SNCurves(m=[3, 5], K=[1e12, 1e14], m2=5, knee=50, endurance=20)
+    >>> N = sn.cycles_to_failure([10., 100.])
+    >>> np.isinf(N[:, 0]).all(), np.allclose(N[:, 1], [1e6, 1e4])
+    (True, True)
+
+    See also
+    --------
+    cc2cmat, cmat2dam
+    '''
+
+    def __init__(self, m, K, m2=None, knee=0, endurance=0, ultimate=np.inf):
+        if m2 is None:
+            m2 = m
+        m, K, m2, knee, endurance, ultimate = np.broadcast_arrays(
+            *[np.asarray(p, dtype=float).ravel()
+              for p in (m, K, m2, knee, endurance, ultimate)])
+        self.m = m
+        self.K = K
+        self.m2 = m2
+        self.knee = knee
+        self.endurance = endurance
+        self.ultimate = ultimate
+        # Intercept below the knee making the curve continuous.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.K2 = np.where(knee > 0, K * knee ** (m2 - m), K)
+
+    def __len__(self):
+        return len(self.m)
+
+    def _damage_per_cycle(self, amp, mean, curves):
+        m, K, m2, knee, endurance, ultimate, K2 = [
+            p[curves, None] for p in (self.m, self.K, self.m2, self.knee,
+                                      self.endurance, self.ultimate, self.K2)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = 1 - np.maximum(mean, 0) / ultimate
+            S = np.where(corr > 0, amp / corr, np.inf)
+            d = np.where(S >= knee, S ** m / K, S ** m2 / K2)
+        return np.where(S < endurance, 0., d)
+
+    def cycles_to_failure(self, amp, mean=0):
+        '''
+        Return number of cycles to failure, N, for each curve.
+
+        Parameters
+        ----------
+        amp, mean : array-like, shape (k,)
+            cycle amplitudes and mean values.
+
+        Returns
+        -------
+        N : ndarray, shape (len(self), k)
+        '''
+        amp, mean = np.broadcast_arrays(np.atleast_1d(amp).ravel(),
+                                        np.atleast_1d(mean).ravel())
+        d = self._damage_per_cycle(amp, mean, slice(None))
+        with np.errstate(divide='ignore'):
+            return 1. / d
+
+    def damage(self, param, F, chunksize=1024):
+        '''
+        Return Palmgren-Miner damage of cycle matrices for all curves.
+
+        Parameters
+        ----------
+        param : (a, b, n)
+            discretization levels, see cc2cmat.
+        F : array-like, shape (n, n) or (nmat, n, n)
+            cycle matrix or a stack of cycle matrices, e.g., one for each
+            sea state.
+        chunksize : int
+            number of curves evaluated at a time, limiting the work space to
+            chunksize times the number of non-empty cells.
+
+        Returns
+        -------
+        D : ndarray, shape (len(self),) or (len(self), nmat)
+
+        Example
+        -------
+        >>> cc = np.array([[-1., 1.], [-1., 0.9], [0., 1.]])
+        >>> F = cc2cmat((-1, 1, 3), cc)
+        >>> sn = SNCurves(m=[1, 2], K=1)
+        >>> np.allclose(sn.damage((-1, 1, 3), F),
+        ...             cmat2dam((-1, 1, 3), F, beta=[1, 2]))
+        True
+        '''
+        amp, mean, counts = _cmat_cycles(param, F)
+        D = self.cycle_damage(amp, mean, counts.T, chunksize)
+        if np.ndim(F) == 2:
+            return D[:, 0]
+        return D
+
+    def cycle_damage(self, amp, mean=0, counts=1, chunksize=1024):
+        '''
+        Return Palmgren-Miner damage of counted cycles for all curves.
+
+        Parameters
+        ----------
+        amp, mean : array-like, shape (k,)
+            cycle amplitudes and mean values.
+        counts : array-like, shape (k,) or (k, nmat)
+            number of cycles with the given amplitude and mean, e.g., the
+            non-empty cells of one or more cycle matrices (default 1).
+        chunksize : int
+            number of curves evaluated at a time.
+
+        Returns
+        -------
+        D : ndarray, shape (len(self),) or (len(self), nmat)
+
+        Example
+        -------
+        >>> sn = SNCurves(m=[1, 2], K=1)
+        >>> sn.cycle_damage([1., 0.95, 0.5])
+        array([ 2.45  ,  2.1525])
+        '''
+        amp, mean = np.broadcast_arrays(np.atleast_1d(amp).ravel(),
+                                        np.atleast_1d(mean).ravel())
+        counts = np.asarray(counts, dtype=float)
+        if counts.ndim == 0:
+            counts = np.ones(amp.shape) * counts
+        D = np.empty((len(self),) + counts.shape[1:])
+        for start in range(0, len(self), chunksize):
+            curves = slice(start, start + chunksize)
+            D[curves] = self._damage_per_cycle(amp, mean, curves).dot(counts)
+        return D
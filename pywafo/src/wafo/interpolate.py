@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 from __future__ import division
 import numpy as np
+import hashlib
 import scipy.signal
-# import scipy.sparse.linalg  # @UnusedImport
+import scipy.sparse.linalg
 import scipy.sparse as sparse
 from numpy import ones, zeros, prod, sin, diff, pi, inf, vstack, linspace
 from scipy.interpolate import PiecewisePolynomial, interp1d
 
 import polynomial as pl
+from wafo.misc import LRUCache
 
 
 __all__ = [
@@ -15,6 +17,9 @@ __all__ = [
     'SmoothSpline', 'pchip_slopes', 'slopes', 'stineman_interp', 'Pchip',
     'StinemanInterp', 'CubicHermiteSpline']
 
+# Factorized smoothing spline systems memoized by (p, knots and variances)
+_SPLINE_SYSTEM_CACHE = LRUCache(maxsize=16)
+
 
 def savitzky_golay(y, window_size, order, deriv=0):
     """Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
@@ -509,7 +514,7 @@ class SmoothSpline(PPform):
         # ndy = y.ndim
         szy = y.shape
 
-        nd = prod(szy[:-1])
+        nd = int(prod(szy[:-1]))
         ny = szy[-1]
 
         if n < 2:
@@ -567,6 +572,19 @@ class SmoothSpline(PPform):
         return coefs, x
 
     def _compute_u(self, p, D, dydx, dx, dx1, n):
+        key = _spline_system_key(p, D, dx)
+        if key in _SPLINE_SYSTEM_CACHE:
+            solve, p = _SPLINE_SYSTEM_CACHE[key]
+        else:
+            solve, p = self._spline_system(p, D, dx, dx1, n)
+            _SPLINE_SYSTEM_CACHE[key] = solve, p
+
+        ddydx = diff(dydx, axis=0)
+        u = 2 * solve(ddydx)
+        return u.reshape(n - 2, -1), p
+
+    @staticmethod
+    def _spline_system(p, D, dx, dx1, n):
         if p is None or p != 0:
             data = [dx[1:n - 1], 2 * (dx[:n - 2] + dx[1:n - 1]), dx[:n - 2]]
             R = sparse.spdiags(data, [-1, 0, 1], n - 2, n - 2)
@@ -589,11 +607,16 @@ class SmoothSpline(PPform):
         else:
             QQ = R
 
-        # Make sure it uses symmetric matrix solver
-        ddydx = diff(dydx, axis=0)
-        # sp.linalg.use_solver(useUmfpack=True)
-        u = 2 * sparse.linalg.spsolve((QQ + QQ.T), ddydx)  # @UndefinedVariable
-        return u.reshape(n - 2, -1), p
+        # Factorize the symmetric system once, it only depends on the knots,
+        # the variances and p.
+        return sparse.linalg.splu((QQ + QQ.T).tocsc()).solve, p
+
+
+def _spline_system_key(p, D, dx):
+    '''Return hashable key identifying a smoothing spline system'''
+    sha = hashlib.sha1(np.ascontiguousarray(dx, dtype=float))
+    sha.update(np.ascontiguousarray(D.diagonal(), dtype=float))
+    return (p, sha.hexdigest())
 
 
 def _edge_case(m0, d1):
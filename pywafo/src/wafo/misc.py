@@ -4,6 +4,7 @@ Misc
 from __future__ import division
 import sys
 import fractions
+import multiprocessing
 import numpy as np
 from numpy import (
     meshgrid,
@@ -12,6 +13,7 @@ from numpy import (
     sqrt, arctan2, sin, cos, exp, log, log1p, mod, diff, empty_like,
     finfo, inf, pi, interp, isnan, isscalar, zeros, ones, linalg,
     r_, sign, unique, hstack, vstack, nonzero, where, extract)
+from numpy.lib.stride_tricks import as_strided
 from scipy.special import gammaln, gamma, psi
 from scipy.integrate import trapz, simps
 import warnings
@@ -29,13 +31,16 @@ _TINY = np.finfo(float).tiny
 _EPS = np.finfo(float).eps
 
 __all__ = [
-    'is_numlike', 'JITImport', 'DotDict', 'Bunch', 'printf', 'sub_dict_select',
-    'parse_kwargs', 'detrendma', 'ecross', 'findcross',
+    'is_numlike', 'JITImport', 'DotDict', 'Bunch', 'LRUCache', 'printf',
+    'sub_dict_select', 'parse_kwargs', 'check_random_state', 'spawn_seeds',
+    'spawn_random_states', 'parallel_map',
+    'detrendma', 'ecross', 'findcross',
     'findextrema', 'findpeaks', 'findrfc', 'rfcfilter', 'findtp', 'findtc',
     'findoutliers', 'common_shape', 'argsreduce',
     'stirlerr', 'getshipchar', 'betaloge', 'gravity', 'nextpow2',
     'discretize', 'polar2cart', 'cart2polar', 'meshgrid', 'ndgrid',
-    'trangood', 'tranproc', 'plot_histgrm', 'num2pistr', 'test_docstrings']
+    'trangood', 'tranproc', 'PreparedTransform', 'plot_histgrm',
+    'num2pistr', 'test_docstrings']
 
 
 def rotation_matrix(heading, pitch, roll):
@@ -439,6 +444,52 @@ class Bunch(object):
         self.__dict__.update(kwargs)
 
 
+class LRUCache(object):
+
+    ''' Dictionary like cache holding the maxsize most recently used items
+
+    Example
+    -------
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache['a']
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache, 'a' in cache, len(cache)
+    (False, True, 2)
+    '''
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value  # mark as most recently used
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        if key in self._data:
+            return self[key]
+        return default
+
+    def clear(self):
+        self._data.clear()
+
+
 def printf(format, *args):  # @ReservedAssignment
     sys.stdout.write(format % args)
 
@@ -495,6 +546,129 @@ def testfun(*args, **kwargs):
     return opts
 
 
+def check_random_state(seed=None):
+    '''
+    Return random number generator defined by seed
+
+    Parameters
+    ----------
+    seed : None, int, array, tuple, RandomState or Generator
+        None gives the global generator of np.random, an int or array gives a
+        new RandomState seeded with it and a tuple as returned from
+        np.random.get_state gives a new RandomState in that state. A
+        RandomState or Generator instance is returned unchanged.
+
+    Example
+    -------
+    >>> rng = check_random_state(1)
+    >>> x = rng.standard_normal(3)
+    >>> np.all(x == check_random_state(1).standard_normal(3))
+    True
+    >>> check_random_state(rng) is rng
+    True
+    '''
+    if seed is None:
+        return np.random.mtrand._rand
+    if hasattr(seed, 'standard_normal'):
+        return seed
+    if isinstance(seed, tuple):
+        rng = np.random.RandomState()
+        rng.set_state(seed)
+        return rng
+    return np.random.RandomState(seed)
+
+
+def spawn_seeds(seed, n):
+    '''
+    Return n independent seeds derived from one master seed
+
+    Parameters
+    ----------
+    seed : None or int
+        master seed. The same master seed always gives the same seeds.
+    n : int
+        number of seeds to return
+
+    Returns
+    -------
+    seeds : list of arrays of uint32
+        seeds that can be given to np.random.RandomState or np.random.seed.
+
+    The seeds are spawned with np.random.SeedSequence when available and
+    are otherwise drawn from a RandomState seeded by the master seed.
+
+    Example
+    -------
+    >>> seeds = spawn_seeds(1234, 3)
+    >>> len(seeds)
+    3
+    >>> rngs = [np.random.RandomState(s) for s in seeds]
+    >>> [rng.rand() for rng in rngs] == [np.random.RandomState(s).rand()
+    ...                                  for s in spawn_seeds(1234, 3)]
+    True
+    '''
+    if hasattr(np.random, 'SeedSequence'):
+        children = np.random.SeedSequence(seed).spawn(n)
+        return [child.generate_state(4) for child in children]
+    rng = np.random.RandomState(seed)
+    return list(rng.randint(0, 2 ** 32, size=(n, 4), dtype=np.uint32))
+
+
+def spawn_random_states(seed, n):
+    '''
+    Return n independent random number generators from one master seed
+
+    Use one generator per task (not per worker) and the results of a Monte
+    Carlo campaign become reproducible whatever the number of workers.
+
+    Example
+    -------
+    >>> rngs = spawn_random_states(1234, 4)
+    >>> x = [rng.standard_normal() for rng in rngs]
+    >>> x == [rng.standard_normal() for rng in spawn_random_states(1234, 4)]
+    True
+
+    See also
+    --------
+    spawn_seeds, check_random_state
+    '''
+    return [np.random.RandomState(iseed) for iseed in spawn_seeds(seed, n)]
+
+
+def parallel_map(fun, iterable, n_jobs=1):
+    '''
+    Return [fun(item) for item in iterable] evaluated by n_jobs processes
+
+    Parameters
+    ----------
+    fun : callable
+        function of one argument. Must be picklable, i.e., defined at module
+        level, when n_jobs != 1.
+    iterable : sequence
+        arguments to fun.
+    n_jobs : int
+        number of worker processes. If n_jobs <= 0 all the cpus are used.
+        n_jobs=1 evaluates sequentially in the calling process (default).
+
+    Example
+    -------
+    >>> parallel_map(abs, [-1, 2, -3])
+    [1, 2, 3]
+    '''
+    items = list(iterable)
+    if n_jobs is not None and n_jobs <= 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs or 1, len(items))
+    if n_jobs <= 1:
+        return [fun(item) for item in items]
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        return pool.map(fun, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def detrendma(x, L):
     """
     Removes a trend from data using a moving average
@@ -1014,12 +1188,24 @@ def mctp2rfc(fmM, fMm=None):
 
     Parameters
     ----------
-    fmM =  the min2max Markov matrix,
-    fMm  = the max2min Markov matrix,
+    fmM =  the min2max Markov matrix, shape (N, N) or a stack of Markov
+           matrices, shape (..., N, N), e.g., one for each sea state.
+    fMm  = the max2min Markov matrix (default fmM),
 
     Returns
     -------
-    f_rfc = the rainflow matrix,
+    f_rfc = the rainflow matrix, same shape as fmM.
+
+    Notes
+    -----
+    The block of f_mM (and f_Mm) used for f_rfc[r, c] is the principal
+    submatrix P[r:N-1-c, r:N-1-c] of the fixed matrix
+    P = f_mM[:N-2, N-2:0:-1]. The Markov corrections do not depend on the
+    rainflow matrix found so far, so the inverses of I - B*A are grown one
+    row and column at a time for all rows of f_rfc at once. The value of
+    f_rfc[r, c] only depends on the values below and to the right of it,
+    i.e., all values on an anti-diagonal r + c = d are found together, with
+    the block sums read from tables of tail sums.
 
     Example:
     -------
@@ -1046,105 +1232,236 @@ def mctp2rfc(fmM, fMm=None):
            [ True,  True,  True,  True,  True]], dtype=bool)
     '''
 
-    if fMm is None:
-        fmM = np.atleast_1d(fmM)
-        fMm = fmM.copy()
-    else:
-        fmM, fMm = np.atleast_1d(fmM, fMm)
-    f_mM, f_Mm = fmM.copy(), fMm.copy()
-    N = max(f_mM.shape)
-    f_max = np.sum(f_mM, axis=1)
-    f_min = np.sum(f_mM, axis=0)
-    f_rfc = zeros((N, N))
-    f_rfc[N - 2, 0] = f_max[N - 2]
-    f_rfc[0, N - 2] = f_min[N - 2]
-    for k in range(2, N - 1):
-        for i in range(1, k):
-            AA = f_mM[N - 1 - k:N - 1 - k + i, k - i:k]
-            AA1 = f_Mm[N - 1 - k:N - 1 - k + i, k - i:k]
-            RAA = f_rfc[N - 1 - k:N - 1 - k + i, k - i:k]
-            nA = max(AA.shape)
-            MA = f_max[N - 1 - k:N - 1 - k + i]
-            mA = f_min[k - i:k]
-            SA = AA.sum()
-            SRA = RAA.sum()
-
-            DRFC = SA - SRA
-            # ?? check
-            NT = min(mA[0] - sum(RAA[:, 0]), MA[0] - sum(RAA[0, :]))
-            NT = max(NT, 0)  # ??check
-
-            if NT > 1e-6 * max(MA[0], mA[0]):
-                NN = MA - np.sum(AA, axis=1)  # T
-                e = (mA - np.sum(AA, axis=0))  # T
-                e = np.flipud(e)
-                PmM = np.rot90(AA.copy())
-                for j in range(nA):
-                    norm = mA[nA - 1 - j]
-                    if norm != 0:
-                        PmM[j, :] = PmM[j, :] / norm
-                        e[j] = e[j] / norm
-                    # end
-                # end
-                fx = 0.0
-                if (max(abs(e)) > 1e-6 and
-                        max(abs(NN)) > 1e-6 * max(MA[0], mA[0])):
-                    PMm = AA1.copy()
-                    for j in range(nA):
-                        norm = MA[j]
-                        if norm != 0:
-                            PMm[j, :] = PMm[j, :] / norm
-                            # end
-                        # end
-                    PMm = np.fliplr(PMm)
-
-                    A = PMm
-                    B = PmM
-
-                    if nA == 1:
-                        fx = NN * (A / (1 - B * A) * e)
-                    else:
-                        rh = np.eye(A.shape[0]) - np.dot(B, A)
-                        # least squares
-                        fx = np.dot(NN, np.dot(A, linalg.solve(rh, e)))
-                    # end
-                # end
-                f_rfc[N - 1 - k, k - i] = fx + DRFC
-
-                #  check2=[ DRFC  fx]
-                # pause
-            else:
-                f_rfc[N - 1 - k, k - i] = 0.0
-            # end
-        # end
-        m0 = max(0, f_min[0] - np.sum(f_rfc[N - k + 1:N, 0]))
-        M0 = max(0, f_max[N - 1 - k] - np.sum(f_rfc[N - 1 - k, 1:k]))
-        f_rfc[N - 1 - k, 0] = min(m0, M0)
-        #  n_loops_left=N-k+1
-    # end
+    fmM = np.asarray(fmM, dtype=float)
+    fMm = fmM if fMm is None else np.asarray(fMm, dtype=float)
+    N = fmM.shape[-1]
+    f_mM = fmM.reshape(-1, N, N)
+    f_Mm = np.broadcast_to(fMm, fmM.shape).reshape(-1, N, N)
+    nb = len(f_mM)
+    f_max = np.sum(f_mM, axis=2)
+    f_min = np.sum(f_mM, axis=1)
+    FX = _markov_corrections(f_mM, f_Mm, f_max, f_min)
+
+    def tail_sums(f):
+        """Return S[:, a, b] = f[:, a:, b:].sum(), padded with zeros"""
+        m = f.shape[-1]
+        S = zeros((nb, m + 1, m + 1))
+        S[:, :m, :m] = f[:, ::-1, ::-1].cumsum(1).cumsum(2)[:, ::-1, ::-1]
+        return S
+
+    SM = tail_sums(f_mM)
+    f_rfc = zeros((nb, N, N))
+    f_rfc[:, N - 2, 0] = f_max[:, N - 2]
+    f_rfc[:, 0, N - 2] = f_min[:, N - 2]
+    S2 = tail_sums(f_rfc)
+    for d in range(N - 2, 0, -1):
+        # The block of f_rfc[:, r, c] is rows r:a and columns c:b
+        r = np.arange(1, d)
+        c = d - r
+        a, b = N - 1 - c, N - 1 - r
+        SA = SM[:, r, c] - SM[:, a, c] - SM[:, r, b] + SM[:, a, b]
+        SRA = S2[:, r, c] - S2[:, a, c] - S2[:, r, b] + S2[:, a, b]
+        col = S2[:, r + 1, c] - S2[:, r + 1, c + 1]
+        row_sum = S2[:, r, c + 1] - S2[:, r + 1, c + 1]
+        MA0 = f_max[:, r]
+        mA0 = f_min[:, c]
+        NT = np.maximum(np.minimum(mA0 - col, MA0 - row_sum), 0)  # ??check
+        tol = 1e-6 * np.maximum(MA0, mA0)
+        D = zeros((nb, d + 1, d + 1))
+        D[:, r, c] = np.where(NT > tol, FX[:, r, c] + SA - SRA, 0.0)
+        if d < N - 2:
+            m0 = np.maximum(0, f_min[:, 0] - S2[:, d + 2, 0] +
+                            S2[:, d + 2, 1])
+            M0 = np.maximum(0, f_max[:, d] - S2[:, d, 1] + S2[:, d + 1, 1])
+            D[:, d, 0] = np.minimum(m0, M0)
+        f_rfc[:, :d + 1, :d + 1] += D
+        S2[:, :d + 2, :d + 2] += tail_sums(D)
 
     for k in range(1, N):
-        M0 = max(0, f_max[0] - np.sum(f_rfc[0, N - k:N]))
-        m0 = max(0, f_min[N - 1 - k] - np.sum(f_rfc[1:k + 1, N - 1 - k]))
-        f_rfc[0, N - 1 - k] = min(m0, M0)
-    # end
-
-#    %clf
-#    %subplot(1,2,2)
-#    %pcolor(levels(paramm),levels(paramM),flipud(f_mM))
-#    %  title('Markov matrix')
-#    %  ylabel('max'), xlabel('min')
-#    %axis([paramm(1) paramm(2) paramM(1) paramM(2)])
-#    %axis('square')
-#
-#    %subplot(1,2,1)
-#    %pcolor(levels(paramm),levels(paramM),flipud(f_rfc))
-#    %  title('Rainflow matrix')
-#    %  ylabel('max'), xlabel('rfc-min')
-#    %axis([paramm(1) paramm(2) paramM(1) paramM(2)])
-#    %axis('square')
-
-    return f_rfc
+        M0 = np.maximum(0, f_max[:, 0] - f_rfc[:, 0, N - k:N].sum(axis=1))
+        m0 = np.maximum(0, f_min[:, N - 1 - k] -
+                        f_rfc[:, 1:k + 1, N - 1 - k].sum(axis=1))
+        f_rfc[:, 0, N - 1 - k] = np.minimum(m0, M0)
+    return f_rfc.reshape(fmM.shape)
+
+
+def _markov_corrections(f_mM, f_Mm, f_max, f_min, chunk_size=2 ** 21,
+                        num_delay=16):
+    """Return the Markov corrections FX[:, r, c] of mctp2rfc.
+
+    The matrices A and B of the block of f_rfc[:, r, c] are the leading
+    i x i parts, i = N - 1 - r - c, of fixed matrices starting at row and
+    column r. For each r the inverse G of I - B_i * A_i is therefore grown
+    one row and column at a time (Sherman-Morrison and bordering) in
+    O(i**2) operations, and each step is done for all r and all Markov
+    matrices at once. The rank-2 updates of G are collected in U and V,
+    G + U * V, and added to G after num_delay steps. The blocks are
+    processed in chunks of about chunk_size elements per array.
+    """
+    nb, N = f_mM.shape[:2]
+    n = N - 2
+    FX = zeros((nb, N, N))
+    if n < 2:
+        return FX
+    # P[:, l, m] = f_mM[:, l, N - 2 - m]
+    P = f_mM[:, :n, n:0:-1]
+    MA = zeros((nb, 2 * n))  # padded with zeros for the blocks
+    mA = zeros((nb, 2 * n))
+    MA[:, :n] = f_max[:, :n]
+    mA[:, :n] = f_min[:, n:0:-1]
+    norm_M = np.where(MA != 0, MA, 1)
+    norm_m = np.where(mA != 0, mA, 1)
+    A = f_Mm[:, :n, n:0:-1] / norm_M[:, :n, None]
+    # B[:, l, m] = P[:, m, l] / norm_m[:, l], i.e., rot90(AA) normalized
+    B = P.transpose(0, 2, 1) / norm_m[:, :n, None]
+    # In the block starting at row r the sums over g of
+    # BA_col[:, l, t] = B[:, l, g] * A[:, g, t], g <= t, (B_i * A_i)[l, t]
+    # BA_row[:, t, l] = B[:, t, g] * A[:, g, l], g <= t, (B_i * A_i)[t, l]
+    # AtP[:, l, t] = A[:, g, l] * P[:, g, t], g < t,
+    # for i = t + 1 start at g = r. They are the sums over all g below minus
+    # the sums over g < r in S_BA and S_AP.
+    tri = np.tri(n)
+    BA_col0 = np.matmul(B, A * tri.T)
+    BA_row0 = np.matmul(B * tri, A)
+    AtP0 = np.matmul(A.transpose(0, 2, 1), P * (1 - tri))
+    S_BA = zeros((nb, n, n))
+    S_AP = zeros((nb, n, n))
+    num_done = 0
+
+    def region(M, start, size):
+        """Return M[:, start:start + size, start:start + size], padded with
+        zeros"""
+        out = zeros((nb, size, size))
+        sub = M[:, start:start + size, start:start + size]
+        out[:, :sub.shape[1], :sub.shape[2]] = sub
+        return out
+
+    rows = np.repeat(np.arange(1, n), nb)  # sorted by decreasing block size
+    mats = np.tile(np.arange(nb), n - 1)
+    start = 0
+    while start < len(rows):
+        m = n - rows[start]
+        stop = min(start + max(chunk_size // m ** 2, 1), len(rows))
+        r, j = rows[start:stop], mats[start:stop]
+        sizes = n - r
+        r0 = r[0]
+        o = r - r0
+        K = o[-1] + 1
+        size = m + K - 1
+        S_BA += np.matmul(B[:, :, num_done:r0], A[:, num_done:r0])
+        S_AP += np.matmul(A[:, num_done:r0].transpose(0, 2, 1),
+                          P[:, num_done:r0])
+        num_done = r0
+
+        ix = r[:, None] + np.arange(m)
+        jx = j[:, None]
+        MAc, mAc, norm_mc = MA[jx, ix], mA[jx, ix], norm_m[jx, ix]
+        Pw, Aw = region(P, r0, size), region(A, r0, size)
+        Pc = _sliding_blocks(Pw, j, o, (m, m))
+        Ac = _sliding_blocks(Aw, j, o, (m, m))
+        # the sums over r0 <= g < r
+        Ak = (_sliding_blocks(Aw, j, o, (K, m), step=(0, 1)) *
+              (np.arange(K) < o[:, None])[:, :, None])
+        Bk = _sliding_blocks(region(B, r0, size), j, o, (m, K), step=(1, 0))
+        Pk = _sliding_blocks(Pw, j, o, (K, m), step=(0, 1))
+        SBAk = np.matmul(Bk, Ak)
+        S = region(S_BA, r0, size)
+        BA_col = _sliding_blocks(region(BA_col0, r0, size) - S, j, o,
+                                 (m, m)) - SBAk
+        BA_row = _sliding_blocks(region(BA_row0, r0, size) - S, j, o,
+                                 (m, m)) - SBAk
+        S = region(S_AP, r0, size)
+        AtP = (_sliding_blocks(region(AtP0, r0, size) - S, j, o, (m, m)) -
+               np.matmul(Ak.transpose(0, 2, 1), Pk))
+        del Ak, Bk, Pk, SBAk, S
+
+        G = zeros((len(r), m, m))  # G[:, :i, :i] = inv(I - B_i * A_i)
+        E = zeros((len(r), m))  # E of the block of size i, normalized
+        NN = zeros((len(r), m))  # NN of the block of size i
+        NNA = zeros((len(r), m))  # NN_i * A_i
+        FXc = zeros((len(r), m))
+        ok = np.zeros((len(r), m), dtype=bool)
+        U = zeros((len(r), m, 2 * num_delay))
+        V = zeros((len(r), 2 * num_delay, m))
+        num_u = 0
+        for t in range(m):
+            i = t + 1
+            act = np.sum(sizes > t)
+            Pa, Aa, Ga = Pc[:act], Ac[:act], G[:act]
+            norm = norm_mc[:act]
+            b = Pa[:, t, :t] / norm[:, :t]  # B[:, :t, t]
+            a = Aa[:, t, :t]
+            p = BA_col[:act, :t, t]
+            q = BA_row[:act, t, :t]
+            E[:act, :t] -= b
+            E[:act, t] = ((mAc[:act, t] - Pa[:, :i, t].sum(axis=1)) /
+                          norm[:, t])
+            NN[:act, :t] -= Pa[:, :t, t]
+            NN[:act, t] = MAc[:act, t] - Pa[:, t, :i].sum(axis=1)
+            NNA[:act, :t] += NN[:act, t, None] * a - AtP[:act, :t, t]
+            NNA[:act, t] = (NN[:act, :i] * Aa[:, :i, t]).sum(axis=1)
+            ok[:act, t] = ((np.abs(E[:act, :i]).max(axis=1) > 1e-6) &
+                           (np.abs(NN[:act, :i]).max(axis=1) > 1e-6 *
+                            np.maximum(MAc[:act, 0], mAc[:act, t])))
+
+            e = E[:act, :t]
+            Gt = Ga[:, :t, :t]
+            Ua, Va = U[:act, :t, :num_u], V[:act, :num_u, :t]
+            X = np.stack((b, p, e), axis=-1)
+            Y = np.stack((a, q), axis=1)
+            GX = np.matmul(Gt, X) + np.matmul(Ua, np.matmul(Va, X))
+            YG = np.matmul(Y, Gt) + np.matmul(np.matmul(Y, Ua), Va)
+            Gb, Gp, Ge = GX[:, :, 0], GX[:, :, 1], GX[:, :, 2]
+            aG, qG = YG[:, 0], YG[:, 1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Sherman-Morrison update of the leading block with b * a,
+                # giving G1 = Gt + Gb * aG / denom, followed by bordering
+                # with the new row q and column p of B_i * A_i
+                denom = 1 - (a * Gb).sum(axis=1)
+                w1 = Gp + Gb * ((aG * p).sum(axis=1) / denom)[:, None]
+                w2 = qG + aG * ((q * Gb).sum(axis=1) / denom)[:, None]
+                schur = 1 - BA_row[:act, t, t] - (q * w1).sum(axis=1)
+                xt = ((w2 * e).sum(axis=1) + E[:act, t]) / schur
+                x = (Ge + Gb * ((aG * e).sum(axis=1) / denom)[:, None] +
+                     w1 * xt[:, None])  # G_i * E_i
+                FXc[:act, t] = ((NNA[:act, :t] * x).sum(axis=1) +
+                                NNA[:act, t] * xt)
+                U[:act, :t, num_u] = Gb / denom[:, None]
+                U[:act, :t, num_u + 1] = w1 / schur[:, None]
+                V[:act, num_u, :t] = aG
+                V[:act, num_u + 1, :t] = w2
+                num_u += 2
+                Ga[:, :t, t] = w1 / schur[:, None]
+                Ga[:, t, :t] = w2 / schur[:, None]
+                Ga[:, t, t] = 1. / schur
+            bad = ~(np.isfinite(denom) & np.isfinite(schur) &
+                    (denom != 0) & (schur != 0))
+            for ib in np.flatnonzero(bad):  # (near) singular, start afresh
+                Bi = (Pa[ib, :i, :i] / norm[ib, :i]).T
+                Ga[ib, :i, :i] = linalg.pinv(np.eye(i) -
+                                             np.dot(Bi, Aa[ib, :i, :i]))
+                U[ib], V[ib] = 0, 0
+                FXc[ib, t] = np.dot(NNA[ib, :i],
+                                    np.dot(Ga[ib, :i, :i], E[ib, :i]))
+            if num_u == 2 * num_delay:
+                Ga[:, :t, :t] += np.matmul(U[:act, :t], V[:act, :, :t])
+                U[:act], V[:act] = 0, 0
+                num_u = 0
+        ib, it = np.nonzero(np.arange(m) < sizes[:, None])
+        FX[j[ib], r[ib], sizes[ib] - it] = np.where(ok, FXc, 0.0)[ib, it]
+        start = stop
+    return FX
+
+
+def _sliding_blocks(M, mats, offsets, shape, step=(1, 1)):
+    """Return blocks of M, i.e., M[mats, a:a + shape[0], b:b + shape[1]]
+    with a, b = step[0] * offsets, step[1] * offsets.
+    """
+    s0, s1, s2 = M.strides
+    num = max(offsets) + 1
+    view = as_strided(M, (len(M), num) + tuple(shape),
+                      (s0, step[0] * s1 + step[1] * s2, s1, s2))
+    return view[mats, offsets]
 
 
 def rfcfilter(x, h, method=0):
@@ -1447,7 +1764,7 @@ def findtc(x_in, v=None, kind=None):
 
         if (2 * n_tc + 1 < n_c) and (kind in (None, 'tw')):
             # trough
-            ind[n_c - 2] = x[v_ind[n_c - 2] + 1:v_ind[n_c - 1]].argmin()
+            ind[n_c - 2] = x[v_ind[n_c - 2] + 1:v_ind[n_c - 1] + 1].argmin()
 
     else:  # the first is a up-crossing
         for i in xrange(n_tc):
@@ -1459,7 +1776,7 @@ def findtc(x_in, v=None, kind=None):
 
         if (2 * n_tc + 1 < n_c) and (kind in (None, 'cw')):
             # crest
-            ind[n_c - 2] = x[v_ind[n_c - 2] + 1:v_ind[n_c - 1]].argmax()
+            ind[n_c - 2] = x[v_ind[n_c - 2] + 1:v_ind[n_c - 1] + 1].argmax()
 
     return v_ind[:n_c - 1] + ind + 1, v_ind
 
@@ -2986,75 +3303,133 @@ def tranproc(x, f, x0, *xi):
 
     See also
     --------
-    trangood.
+    trangood, PreparedTransform
     """
-    xo, fo, x0 = atleast_1d(x, f, x0)
-    xi = atleast_1d(*xi)
-    if not isinstance(xi, list):
-        xi = [xi, ]
+    xo, fo = atleast_1d(x, f)
     N = len(xi)  # N = number of derivatives
-    nmax = ceil((xo.ptp()) * 10 ** (7. / max(N, 1)))
-    xo, fo = trangood(xo, fo, min_x=min(x0), max_x=max(x0), max_n=nmax)
+    if N > 4:
+        warnings.warn('Transformation of derivatives of order>4 not ' +
+                      'supported.')
+    return PreparedTransform(xo, fo, order=min(N, 4))(x0, *xi[:4])
 
-    n = f.shape[0]
-    # y  = x0.copy()
-    xu = (n - 1) * (x0 - xo[0]) / (xo[-1] - xo[0])
 
-    fi = asarray(floor(xu), dtype=int)
-    fi = where(fi == n - 1, fi - 1, fi)
+class PreparedTransform(object):
 
-    xu = xu - fi
-    y0 = fo[fi] + (fo[fi + 1] - fo[fi]) * xu
+    """
+    Transformation f prepared for repeated use by tranproc.
 
-    y = y0
+    The transform is made efficient by trangood and the numerical
+    derivatives of f are tabulated on the uniform grid once. Each call is
+    then a vectorized table lookup, which is O(1) per sample and works on
+    arrays of any shape, e.g., many series at once.
 
-    if N > 0:
-        y = [y0]
+    Parameters
+    ----------
+    x, f : array-like
+        [x,f(x)], transform function, y = f(x).
+    order : int
+        highest time derivative to transform, 0 <= order <= 4 (default 4).
+        The grid is resampled as in tranproc with the same number of
+        derivatives.
+
+    Calling the object with (x0, x1,...,xn), n <= order, returns the same as
+    tranproc(x, f, x0, x1,...,xn). Outside the range of x, f is extrapolated
+    linearly.
+
+    Example
+    --------
+    >>> import wafo.misc as wm
+    >>> import wafo.transform.models as wtm
+    >>> tr = wtm.TrHermite()
+    >>> x = linspace(-5,5,501)
+    >>> g = tr(x)
+    >>> gtr = wm.PreparedTransform(x, g, order=1)
+    >>> x0 = np.random.randn(3, 100)
+    >>> y0, y1 = gtr(x0, ones(x0.shape))
+    >>> y0.shape
+    (3, 100)
+    >>> np.allclose(y1[0], wm.tranproc(x, g, x0[0], ones(100))[1])
+    True
+
+    See also
+    --------
+    tranproc, trangood
+    """
+
+    def __init__(self, x, f, order=4):
+        if not 0 <= order <= 4:
+            raise ValueError('order must be 0, 1, 2, 3 or 4.')
+        xo, fo = atleast_1d(x, f)
+        nmax = ceil((xo.ptp()) * 10 ** (7. / max(order, 1)))
+        xo, fo = trangood(xo, fo, max_n=nmax)
         hn = xo[1] - xo[0]
-        if hn ** N < sqrt(_EPS):
+        if order > 0 and hn ** order < sqrt(_EPS):
             msg = ('Numerical problems may occur for the derivatives in ' +
                    'tranproc.\n' +
                    'The sampling of the transformation may be too small.')
             warnings.warn(msg)
+        self.order = order
+        self.x = xo
+        self.f = fo
+        self.dx = hn
+        # Extrapolate f linearly by order+1 points so that the derivatives
+        # are also correct in the first and last intervals. Beyond the
+        # tables the derivatives are constant.
+        k = arange(1, order + 2)
+        fder = hstack((fo[0] - k[::-1] * (fo[1] - fo[0]), fo,
+                       fo[-1] + k * (fo[-1] - fo[-2])))
+        start = xo[0] - (order + 1) * hn
+        self.fder = []
+        # Derivation of f(x) using a difference method.
+        for _k in range(order):
+            fder = diff(fder) / hn
+            start = start + hn / 2.
+            self.fder.append((start, start + (len(fder) - 1) * hn, fder))
+
+    @staticmethod
+    def _interp(x0, start, stop, values, extrapolate=True):
+        n = len(values)
+        xu = (n - 1) * (x0 - start) / (stop - start)
+        if not extrapolate:
+            xu = np.clip(xu, 0, n - 1)
+        fi = np.clip(floor(where(isnan(xu), 0, xu)), 0, n - 2).astype(int)
+        return values[fi] + (values[fi + 1] - values[fi]) * (xu - fi)
+
+    def __call__(self, x0, *xi):
+        x0 = atleast_1d(x0)
+        xi = [atleast_1d(xk) for xk in xi]
+        N = len(xi)  # N = number of derivatives
+        if N > self.order:
+            raise ValueError('The transform is prepared for at most %d '
+                             'derivatives.' % self.order)
+        y0 = self._interp(x0, self.x[0], self.x[-1], self.f)
+        if N == 0:
+            return y0
 
         # Transform X with the derivatives of  f.
-        fxder = zeros((N, x0.size))
-        fder = vstack((xo, fo))
-        for k in range(N):  # Derivation of f(x) using a difference method.
-            n = fder.shape[-1]
-            fder = vstack([(fder[0, 0:n - 1] + fder[0, 1:n]) / 2,
-                           diff(fder[1, :]) / hn])
-            fxder[k] = tranproc(fder[0], fder[1], x0)
+        fxder = [self._interp(x0, start, stop, values, extrapolate=False)
+                 for start, stop, values in self.fder[:N]]
 
         # Calculate the transforms of the derivatives of X.
         # First time derivative of y: y1 = f'(x)*x1
-
-        y1 = fxder[0] * xi[0]
-        y.append(y1)
+        y = [y0, fxder[0] * xi[0]]
         if N > 1:
-
             # Second time derivative of y:
             # y2 = f''(x)*x1.^2+f'(x)*x2
-            y2 = fxder[1] * xi[0] ** 2. + fxder[0] * xi[1]
-            y.append(y2)
-            if N > 2:
-                # Third time derivative of y:
-                # y3 = f'''(x)*x1.^3+f'(x)*x3 +3*f''(x)*x1*x2
-                y3 = fxder[2] * xi[0] ** 3 + fxder[0] * xi[2] + \
-                    3 * fxder[1] * xi[0] * xi[1]
-                y.append(y3)
-                if N > 3:
-                    # Fourth time derivative of y:
-                    # y4 = f''''(x)*x1.^4+f'(x)*x4
-                    #    +6*f'''(x)*x1^2*x2+f''(x)*(3*x2^2+4x1*x3)
-                    y4 = (fxder[3] * xi[0] ** 4. + fxder[0] * xi[3] +
-                          6. * fxder[2] * xi[0] ** 2. * xi[1] +
-                          fxder[1] * (3. * xi[1] ** 2. + 4. * xi[0] * xi[1]))
-                    y.append(y4)
-                    if N > 4:
-                        warnings.warn('Transformation of derivatives of ' +
-                                      'order>4 not supported.')
-    return y  # y0,y1,y2,y3,y4
+            y.append(fxder[1] * xi[0] ** 2. + fxder[0] * xi[1])
+        if N > 2:
+            # Third time derivative of y:
+            # y3 = f'''(x)*x1.^3+f'(x)*x3 +3*f''(x)*x1*x2
+            y.append(fxder[2] * xi[0] ** 3 + fxder[0] * xi[2] +
+                     3 * fxder[1] * xi[0] * xi[1])
+        if N > 3:
+            # Fourth time derivative of y:
+            # y4 = f''''(x)*x1.^4+f'(x)*x4
+            #    +6*f'''(x)*x1^2*x2+f''(x)*(3*x2^2+4x1*x3)
+            y.append(fxder[3] * xi[0] ** 4. + fxder[0] * xi[3] +
+                     6. * fxder[2] * xi[0] ** 2. * xi[1] +
+                     fxder[1] * (3. * xi[1] ** 2. + 4. * xi[0] * xi[2]))
+        return y  # y0,y1,y2,y3,y4
 
 
 def good_bins(data=None, range=None, num_bins=None,  # @ReservedAssignment
@@ -17,12 +17,15 @@ from wafo.transform.core import TrData
 from wafo.transform.estimation import TransformEstimator
 from wafo.stats import distributions
 from wafo.misc import (nextpow2, findtp, findrfc, findtc, findcross,
-                       ecross, JITImport, DotDict, gravity, findrfc_astm)
+                       ecross, JITImport, DotDict, gravity, findrfc_astm,
+                       check_random_state, parallel_map)
 from wafo.interpolate import stineman_interp
+from wafo.fatigue import SNCurves, _cell_index
 from wafo.containers import PlotData
-from scipy.integrate import trapz
+from scipy.integrate import trapz, simps
 from scipy.signal import welch, lfilter
 from scipy.signal.windows import get_window  # @UnusedImport
+from scipy.signal.windows import parzen
 from scipy import special
 from scipy.interpolate.interpolate import interp1d
 from scipy.special import ndtr as cdfnorm
@@ -33,8 +36,8 @@ from numpy import (inf, pi, zeros, ones, sqrt, where, log, exp, cos, sin,
                    linspace, arange, sort, all, abs, vstack, hstack,
                    atleast_1d, finfo, polyfit, r_, nonzero,
                    cumsum, ravel, isnan, ceil, diff, array)
-from numpy.fft import fft  # @UnusedImport
-from numpy.random import randn
+from numpy.fft import fft, rfft, irfft  # @UnusedImport
+from numpy.lib.stride_tricks import as_strided
 import matplotlib
 from matplotlib.mlab import psd, detrend_mean
 from plotbackend import plotbackend
@@ -46,7 +49,8 @@ _wafocov_estimation = JITImport('wafo.covariance.estimation')
 _wafospec = JITImport('wafo.spectrum')
 
 __all__ = ['TimeSeries', 'LevelCrossings', 'CyclePairs', 'TurningPoints',
-           'sensortypeid', 'sensortype']
+           'RainflowMatrix', 'cc2rfm', 'load_rfm', 'merge_level_crossings',
+           'extrapolate_level_crossings', 'sensortypeid', 'sensortype']
 
 
 def _invchi2(q, df):
@@ -182,7 +186,8 @@ class LevelCrossings(PlotData):
 
         See also
         --------
-        cmat2extralc, rfmextrapolate, lc2rfmextreme, extralc, fitgenpar
+        extrapolate_level_crossings, cmat2extralc, rfmextrapolate,
+        lc2rfmextreme, extralc, fitgenpar
 
         References
         ----------
@@ -191,24 +196,38 @@ class LevelCrossings(PlotData):
         Preprint 2000:82, Mathematical statistics, Chalmers, pp. 18.
         '''
 
-        i_max = self.data.argmax()
-        c_max = self.data[i_max]
-        lc_max = self.args[i_max]
+        u_min, u_max = self._tail_levels(u_min, u_max)
+        return self._extrapolated(*self._extrapolate_tails(
+            u_min, u_max, method, dist, plotflag=plotflag))
 
+    def _extrapolated(self, f, x, phat_high, phat_low):
+        lc_out = LevelCrossings(f, x, sigma=self.sigma, mean=self.mean)
+        lc_out.phat_high = phat_high
+        lc_out.phat_low = phat_low
+        return lc_out
+
+    def _tail_levels(self, u_min=None, u_max=None):
         if u_min is None or u_max is None:
-            fraction = sqrt(c_max)
+            fraction = sqrt(self.data.max())
             i = np.flatnonzero(self.data > fraction)
             if u_min is None:
                 u_min = self.args[i.min()]
             if u_max is None:
                 u_max = self.args[i.max()]
+        return u_min, u_max
+
+    def _extrapolate_tails(self, u_min, u_max, method, dist,
+                           starts=(None, None), plotflag=0):
+        lc_max = self.args[self.data.argmax()]
         lcf, lcx = self.data, self.args
         # Extrapolate LC for high levels
         [lc_High, phat_high] = self._extrapolate(lcx, lcf, u_max,
-                                                 u_max - lc_max, method, dist)
+                                                 u_max - lc_max, method, dist,
+                                                 starts[0])
         # Extrapolate LC for low levels
         [lcEst1, phat_low] = self._extrapolate(-lcx[::-1], lcf[::-1], -u_min,
-                                               lc_max - u_min, method, dist)
+                                               lc_max - u_min, method, dist,
+                                               starts[1])
         lc_Low = lcEst1[::-1, :]  # [-lcEst1[::-1, 0], lcEst1[::-1, 1::]]
         lc_Low[:, 0] *= -1
 
@@ -219,29 +238,29 @@ class LevelCrossings(PlotData):
         i_mask = (u_min < lcx) & (lcx < u_max)
         f = np.hstack((lc_Low[:, 1], lcf[i_mask], lc_High[:, 1]))
         x = np.hstack((lc_Low[:, 0], lcx[i_mask], lc_High[:, 0]))
-        lc_out = LevelCrossings(f, x, sigma=self.sigma, mean=self.mean)
-        lc_out.phat_high = phat_high
-        lc_out.phat_low = phat_low
-        return lc_out
-
-    def _extrapolate(self, lcx, lcf, u, offset, method, dist):
-        # Extrapolate the level crossing spectra for high levels
-
-        method = method.lower()
-        dist = dist.lower()
+        return f, x, phat_high, phat_low
 
+    def _exceedances(self, lcx, lcf, u):
         # Excedences over level u
         Iu = lcx > u
         lcx1, lcf1 = lcx[Iu], lcf[Iu]
         lcf2, lcx2 = self._make_increasing(lcf1[::-1], lcx1[::-1])
+        return np.repeat(lcx2, np.diff(r_[0, lcf2]).astype(int)) - u
 
-        nim1 = 0
-        x = []
-        for xk, ni in zip(lcx2.tolist(), lcf2.tolist()):
-            x.append(ones(ni - nim1) * xk)
-            nim1 = ni
+    def _extrapolate(self, lcx, lcf, u, offset, method, dist, start=None):
+        # Extrapolate the level crossing spectra for high levels
 
-        x = np.hstack(x) - u
+        method = method.lower()
+        dist = dist.lower()
+
+        x = self._exceedances(lcx, lcf, u)
+        if start is None:
+            start = _tail_fitstart([x], dist)[0]
+        fit_kwds = dict(floc=0, method=method)
+        if start is not None:
+            fit_kwds.update(loc=0, scale=start[-1])
+            if dist.startswith('exp') and method == 'ml':
+                fit_kwds.update(search=False)  # start is the ML estimate
 
         df = 0.01
         xF = np.arange(0.0, 4 + df / 2, df)
@@ -249,7 +268,7 @@ class LevelCrossings(PlotData):
         # Estimate tail
         if dist.startswith('gen'):
             genpareto = distributions.genpareto
-            phat = genpareto.fit2(x, floc=0, method=method)
+            phat = genpareto.fit2(x, *start[:-1], **fit_kwds)
             SF = phat.sf(xF)
 
             covar = phat.par_cov[::2, ::2]
@@ -290,7 +309,7 @@ class LevelCrossings(PlotData):
                                lcEstCl.min(axis=1), lcEstCu.max(axis=1))).T
         elif dist.startswith('exp'):
             expon = distributions.expon
-            phat = expon.fit2(x, floc=0, method=method)
+            phat = expon.fit2(x, **fit_kwds)
             SF = phat.sf(xF)
             lcEst = np.vstack((xF + u, lcu * (SF))).T
 
@@ -311,21 +330,15 @@ class LevelCrossings(PlotData):
 
     def _make_increasing(self, f, t=None):
         # Makes the signal f strictly increasing.
-
-        n = len(f)
+        f = np.asarray(f)
         if t is None:
-            t = np.arange(n)
-        ff = [f[0], ]
-        tt = [t[0], ]
-
-        for i in xrange(1, n):
-            if f[i] > ff[-1]:
-                ff.append(f[i])
-                tt.append(t[i])
+            t = np.arange(len(f))
+        t = np.asarray(t)
+        # Keep the values exceeding all previous values.
+        keep = f > r_[-inf, np.maximum.accumulate(f)[:-1]]
+        return f[keep], t[keep]
 
-        return np.asarray(ff), np.asarray(tt)
-
-    def sim(self, ns, alpha):
+    def sim(self, ns, alpha, random_state=None):
         """
         Simulates process with given irregularity factor and crossing spectrum
 
@@ -336,6 +349,8 @@ class LevelCrossings(PlotData):
         alpha : real scalar
             irregularity factor, 0<alpha<1, small  alpha  gives
             irregular process.
+        random_state : None, int, RandomState or Generator
+            random number generator (default the global np.random generator)
 
         Returns
         --------
@@ -396,7 +411,7 @@ class LevelCrossings(PlotData):
         r1 = -a1 / (1. + a2)
         r2 = (a1 ** 2 - a2 - a2 ** 2) / (1 + a2)
         sigma2 = r0 + a1 * r1 + a2 * r2
-        # randn = np.random.randn
+        randn = check_random_state(random_state).standard_normal
         e = randn(ns) * sqrt(sigma2)
         e[:2] = 0.0
         L0 = randn(1)
@@ -550,7 +565,7 @@ class LevelCrossings(PlotData):
         >>> int(S.tr.dist2gauss()*100)
         141
         >>> int(g0emp.dist2gauss()*100)
-        380995
+        277518
         >>> int(g0.dist2gauss()*100)
         143
         >>> int(g1.dist2gauss()*100)
@@ -590,6 +605,109 @@ def test_levelcrossings_extrapolate():
     lc_gpd = lc.extrapolate(-2 * s, 2 * s, dist='rayleigh')  # @UnusedVariable
 
 
+def _tail_fitstart(xs, dist):
+    """Return starting values for the tail fits of the exceedances in xs.
+
+    The probability weighted moment estimators of the generalized Pareto
+    distribution (Hosking and Wallis, 1987) are evaluated for all samples at
+    once. Returns (shape, scale) for 'genpar', (scale,) for 'expon' and None
+    otherwise.
+    """
+    dist = dist.lower()
+    if not (dist.startswith('gen') or dist.startswith('exp')):
+        return [None] * len(xs)
+    n = np.array([len(x) for x in xs])
+    group = np.repeat(arange(len(xs)), n)
+    x = np.hstack([np.sort(x) for x in xs] + [zeros(0)])
+    rank = arange(len(x)) - np.repeat(cumsum(n) - n, n)
+    nk = np.maximum(n, 1).astype(float)
+    a0 = np.bincount(group, weights=x, minlength=len(xs)) / nk
+    if dist.startswith('exp'):
+        return [(scale,) for scale in a0]
+    weights = (n[group] - 1 - rank) / np.maximum(n[group] - 1, 1)
+    a1 = np.bincount(group, weights=x * weights, minlength=len(xs)) / nk
+    d = a0 - 2 * a1
+    ok = (d > 0) & (n > 1)
+    d = where(ok, d, 1)
+    shape = where(ok, 2 - a0 / d, 0)  # shape = -k in Hosking's notation
+    scale = where(ok, 2 * a0 * a1 / d, a0)
+    return list(zip(shape, scale))
+
+
+def _extrapolate_task(args):
+    data, lc_args, sigma, mean, u_min, u_max, method, dist, starts = args
+    lc = LevelCrossings(data, lc_args, sigma=sigma, mean=mean)
+    # The fitted distributions are returned, not the LevelCrossings object,
+    # since the latter holds a reference to the plot backend.
+    return lc._extrapolate_tails(u_min, u_max, method, dist, starts)
+
+
+def extrapolate_level_crossings(lcs, u_min=None, u_max=None, method='ml',
+                                dist='genpar', n_jobs=1):
+    '''
+    Return extrapolated level crossing spectra of many records.
+
+    Parameters
+    ----------
+    lcs : sequence of LevelCrossings objects
+        e.g., one for each record or structural detail.
+    u_min, u_max : real scalars or sequences, optional
+        extrapolate below u_min and above u_max (one value for all or one
+        value for each object). See LevelCrossings.extrapolate.
+    method, dist : string
+        estimation method and tail distribution, see
+        LevelCrossings.extrapolate.
+    n_jobs : int
+        number of worker processes for the tail fits (default 1).
+
+    Returns
+    -------
+    lc_out : list of LevelCrossings objects
+        the same as [lc.extrapolate(...) for lc in lcs].
+
+    Notes
+    -----
+    The probability weighted moment estimators of all tails are computed
+    in one vectorized pass and used as starting values, so the search for
+    the ML (or MPS) estimates only needs a few iterations. The fits are
+    then distributed over n_jobs processes.
+
+    Example
+    -------
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> x = wafo.data.sea()
+    >>> tp = wo.mat2timeseries(x).turning_points()
+    >>> lcs = [wo.TurningPoints(tp.data[i:i + 400], tp.args[i:i + 400]
+    ...        ).cycle_pairs().level_crossings() for i in (0, 300, 600)]
+    >>> s = x[:, 1].std()
+    >>> lc_out = wo.extrapolate_level_crossings(lcs, -2 * s, 2 * s)
+    >>> lc0 = lcs[0].extrapolate(-2 * s, 2 * s)
+    >>> np.allclose(lc_out[0].phat_high.par, lc0.phat_high.par, atol=1e-3)
+    True
+
+    See also
+    --------
+    LevelCrossings.extrapolate
+    '''
+    lcs = list(lcs)
+    n = len(lcs)
+    u_mins = [u_min] * n if u_min is None or np.isscalar(u_min) else u_min
+    u_maxs = [u_max] * n if u_max is None or np.isscalar(u_max) else u_max
+    bounds = [lc._tail_levels(lo, hi)
+              for lc, lo, hi in zip(lcs, u_mins, u_maxs)]
+    x_high = [lc._exceedances(lc.args, lc.data, hi)
+              for lc, (_lo, hi) in zip(lcs, bounds)]
+    x_low = [lc._exceedances(-lc.args[::-1], lc.data[::-1], -lo)
+             for lc, (lo, _hi) in zip(lcs, bounds)]
+    starts = _tail_fitstart(x_high + x_low, dist)
+    tasks = [(lc.data, lc.args, lc.sigma, lc.mean, lo, hi, method, dist,
+              (starts[i], starts[n + i]))
+             for i, (lc, (lo, hi)) in enumerate(zip(lcs, bounds))]
+    results = parallel_map(_extrapolate_task, tasks, n_jobs)
+    return [lc._extrapolated(*res) for lc, res in zip(lcs, results)]
+
+
 class CyclePairs(PlotData):
     '''
     Container class for Cycle Pairs data objects in WAFO
@@ -664,10 +782,11 @@ class CyclePairs(PlotData):
 
         See also
         --------
-        SurvivalCycleCount
+        SurvivalCycleCount, wafo.fatigue.SNCurves
         """
-        amp = abs(self.amplitudes())
-        return atleast_1d([K * np.sum(amp ** betai) for betai in beta])
+        amp = abs(self.amplitudes()).ravel()
+        beta = atleast_1d(beta).ravel()
+        return K * (amp ** beta[:, None].astype(float)).sum(axis=1)
 
     def get_minima_and_maxima(self):
         index, = nonzero(self.args <= self.data)
@@ -680,7 +799,7 @@ class CyclePairs(PlotData):
             M = self.data[index]
         return m, M
 
-    def level_crossings(self, kind='uM', intensity=False):
+    def level_crossings(self, kind='uM', intensity=False, levels=None):
         """ Return level crossing spectrum from a cycle count.
 
         Parameters
@@ -694,6 +813,11 @@ class CyclePairs(PlotData):
         intensity : bool
             True if level crossing intensity spectrum
             False if level crossing count spectrum
+        levels : int or array-like, optional
+            If given the crossings are counted on this fixed grid of levels
+            (or on `levels` equidistant levels between the smallest minimum
+            and largest maximum) so that the size of the output is bounded.
+            By default every distinct extreme value is a level.
         Return
         ------
         lc : level crossing object
@@ -711,60 +835,409 @@ class CyclePairs(PlotData):
         >>> h = mm.plot(marker='.')
         >>> lc = mm.level_crossings()
         >>> h2 = lc.plot()
+        >>> [np.allclose(mm.level_crossings(kind, levels=lc.args).data,
+        ...              mm.level_crossings(kind).data) for kind in range(4)]
+        [True, True, True, True]
 
         See also
         --------
         TurningPoints
         LevelCrossings
+        merge_level_crossings
         """
+        m, M = self.get_minima_and_maxima()
+        return _cycles2lc(m, M, kind, intensity, levels, self.time,
+                          mean=self.mean, sigma=self.sigma)
+
+
+def _crossing_kind(kind):
+    if isinstance(kind, str):
+        t = dict(u=0, uM=1, umM=2, um=3)
+        defnr = t.get(kind, 1)
+    else:
+        defnr = kind
+    if ((defnr < 0) or (defnr > 3)):
+        raise ValueError('kind must be one of (0,1,2,3).')
+    return defnr
+
+
+def _crossing_counts(m, M, defnr, levels=None, weights=None):
+    """Return levels and number of crossings of min to max cycles."""
+    if levels is None:
+        levels, index = np.unique(np.hstack((m, M)), return_inverse=True)
+        nl = len(levels)
+        nmin = np.bincount(index[:len(m)], weights=weights, minlength=nl)
+        nmax = np.bincount(index[len(m):], weights=weights, minlength=nl)
+        upcross = cumsum(nmin - nmax)  # min <= u < max
+        if defnr == 0:  # This are upcrossings + minima
+            dcount = upcross
+        elif defnr == 1:  # This are only upcrossings
+            dcount = upcross - nmin
+        elif defnr == 2:  # This are upcrossings + maxima
+            dcount = upcross + nmax - nmin
+        else:  # This are upcrossings + minima + maxima
+            dcount = upcross + nmax
+        return levels, dcount
+    if np.isscalar(levels):
+        levels = linspace(np.min(m), np.max(M), int(levels))
+    levels = np.asarray(levels, dtype=float)
+    side_min = 'left' if defnr in (1, 2) else 'right'
+    side_max = 'right' if defnr in (0, 1) else 'left'
+    if weights is None:
+        weights = ones(len(m))
+    # The counts are differences of the cumulative weights of the sorted
+    # minima and maxima below the levels.
+    dcount = 0
+    for x, side, sign in ((m, side_min, 1), (M, side_max, -1)):
+        order = np.argsort(x)
+        cumw = r_[0, cumsum(np.asarray(weights, dtype=float)[order])]
+        dcount = dcount + sign * cumw[np.searchsorted(x[order], levels,
+                                                      side=side)]
+    return levels, dcount
+
+
+def _cycles2lc(m, M, kind, intensity, levels, time, weights=None, **kwds):
+    levels, dcount = _crossing_counts(m, M, _crossing_kind(kind), levels,
+                                      weights)
+    return _counts2lc(levels, dcount, intensity, time, **kwds)
+
+
+def _counts2lc(levels, dcount, intensity, time, **kwds):
+    dcount = dcount.astype(float)
+    ylab = 'Count'
+    if intensity:
+        dcount = dcount / time
+        ylab = 'Intensity [count/sec]'
+    return LevelCrossings(dcount, levels, ylab=ylab, intensity=intensity,
+                          **kwds)
+
+
+def merge_level_crossings(cycle_pairs, kind='uM', intensity=False,
+                          levels=None):
+    """ Return level crossing spectrum of several cycle counts.
+
+    Parameters
+    ----------
+    cycle_pairs : sequence of CyclePairs objects
+        e.g., rainflow cycles from different records.
+    kind, intensity : see CyclePairs.level_crossings
+    levels : int or array-like, optional
+        fixed grid of levels (or number of equidistant levels between the
+        overall smallest minimum and largest maximum). The counts of each
+        object are then evaluated on the grid and summed, so the work space
+        does not grow with the total number of cycles. By default every
+        distinct extreme value is a level.
+
+    Returns
+    -------
+    lc : LevelCrossings object
+        The intensity is the total count divided by the total time.
+
+    Example
+    -------
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> x = wafo.data.sea()
+    >>> tp = wo.mat2timeseries(x).turning_points()
+    >>> mm = tp.cycle_pairs()
+    >>> tp1 = wo.TurningPoints(tp.data[:301], tp.args[:301])
+    >>> tp2 = wo.TurningPoints(tp.data[300:], tp.args[300:])
+    >>> mms = [tp1.cycle_pairs(), tp2.cycle_pairs()]
+    >>> lc = wo.merge_level_crossings(mms, levels=51)
+    >>> lc0 = mm.level_crossings(levels=lc.args)
+    >>> np.allclose(lc.data, lc0.data)
+    True
+    """
+    cycle_pairs = list(cycle_pairs)
+    defnr = _crossing_kind(kind)
+    extremes = [cp.get_minima_and_maxima() for cp in cycle_pairs]
+    time = np.sum([cp.time for cp in cycle_pairs])
+    if levels is None:
+        m = np.hstack([mi for mi, _Mi in extremes])
+        M = np.hstack([Mi for _mi, Mi in extremes])
+        return _cycles2lc(m, M, defnr, intensity, None, time)
+    if np.isscalar(levels):
+        lo = np.min([np.min(mi) for mi, _Mi in extremes])
+        hi = np.max([np.max(Mi) for _mi, Mi in extremes])
+        levels = linspace(lo, hi, int(levels))
+    dcount = 0
+    for mi, Mi in extremes:
+        dcount = dcount + _crossing_counts(mi, Mi, defnr, levels)[1]
+    return _counts2lc(levels, dcount, intensity, time)
+
+
+def _rfm_param(param):
+    param = tuple(param)
+    if np.ndim(param[0]) == 0:
+        param = (param, param)
+    return tuple((float(a), float(b), int(n)) for a, b, n in param)
+
+
+class RainflowMatrix(object):
+
+    '''
+    Rainflow (cycle) matrix with compact storage.
+
+    Only the non-empty cells of the 2-D histogram of the cycles are stored.
+    The size is therefore bounded by the grid and not by the number of
+    cycles, and matrices counted from different records or sea states can be
+    added and scaled to a design life.
+
+    Parameters
+    ----------
+    data : array-like, shape (n1, n2), optional
+        dense cycle matrix, e.g., from wafo.fatigue.cc2cmat or
+        wafo.misc.mctp2rfc. Use cc2rfm to count cycles directly.
+    param : (a, b, n) or ((a1, b1, n1), (a2, b2, n2))
+        discretization levels u1 = linspace(a1, b1, n1) and
+        u2 = linspace(a2, b2, n2) of the two axes. A single tuple defines
+        both.
+    kind : 'minmax' or 'rangemean'
+        'minmax' : cell (i, j) holds cycles with minimum u1[i] and maximum
+                   u2[j] (default).
+        'rangemean' : cell (i, j) holds cycles with range u1[i] and mean
+                   u2[j].
+    time : scalar
+        duration of the load history the cycles were counted from
+        (default 1).
+
+    Member variables
+    ----------------
+    index : ndarray of ints
+        sorted flat index, i * n2 + j, of the non-empty cells.
+    counts : ndarray
+        number of cycles in the non-empty cells.
 
-        if isinstance(kind, str):
-            t = dict(u=0, uM=1, umM=2, um=3)
-            defnr = t.get(kind, 1)
+    Examples
+    --------
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> ts = wo.mat2timeseries(wafo.data.sea())
+    >>> mm = ts.turning_points().cycle_pairs()
+    >>> rfm = wo.cc2rfm((-2, 2, 41), mm)
+    >>> rfm.counts.sum() == len(mm.data)
+    True
+    >>> np.allclose((rfm + rfm).counts, 2 * rfm.counts)
+    True
+    >>> rfm30 = rfm.rescale(30 * 365.25 * 24 * 3600)
+    >>> np.allclose(rfm30.damage([3]) / rfm.damage([3]), rfm30.time / mm.time)
+    True
+    >>> lc = rfm.level_crossings()
+
+    See also
+    --------
+    cc2rfm, load_rfm, CyclePairs, wafo.fatigue.SNCurves
+    '''
+
+    def __init__(self, data=None, param=(0, 1, 2), kind='minmax', time=1):
+        if kind not in ('minmax', 'rangemean'):
+            raise ValueError("kind must be 'minmax' or 'rangemean'.")
+        self.param = _rfm_param(param)
+        self.kind = kind
+        self.time = time
+        if data is None:
+            self.index = np.zeros(0, dtype=int)
+            self.counts = np.zeros(0)
         else:
-            defnr = kind
+            data = np.asarray(data, dtype=float)
+            if data.shape != self.shape:
+                raise ValueError('data must have shape %s' % (self.shape,))
+            self.index = np.flatnonzero(data)
+            self.counts = data.ravel()[self.index]
+
+    @property
+    def shape(self):
+        return (self.param[0][2], self.param[1][2])
+
+    @property
+    def levels(self):
+        return tuple(linspace(*p) for p in self.param)
+
+    def _new(self, index, counts, time):
+        rfm = RainflowMatrix(None, self.param, self.kind, time)
+        rfm.index, rfm.counts = index, counts
+        return rfm
+
+    def todense(self):
+        '''Return the cycle matrix as a dense array.'''
+        data = zeros(self.shape)
+        data.flat[self.index] = self.counts
+        return data
+
+    def __add__(self, other):
+        if np.isscalar(other) and other == 0:  # allows sum(matrices)
+            return self._new(self.index, self.counts, self.time)
+        if (not isinstance(other, RainflowMatrix) or
+                other.param != self.param or other.kind != self.kind):
+            raise ValueError('Only rainflow matrices with the same levels '
+                             'and kind can be added.')
+        index, inverse = np.unique(r_[self.index, other.index],
+                                   return_inverse=True)
+        counts = np.bincount(inverse, weights=r_[self.counts, other.counts])
+        return self._new(index, counts, self.time + other.time)
+
+    __radd__ = __add__
+
+    def __mul__(self, factor):
+        '''Return the matrix with counts and duration scaled by factor.'''
+        return self._new(self.index, self.counts * factor, self.time * factor)
+
+    __rmul__ = __mul__
+
+    def rescale(self, duration):
+        '''
+        Return the rainflow matrix scaled to the given duration.
 
-        if ((defnr < 0) or (defnr > 3)):
-            raise ValueError('kind must be one of (1,2,3,4).')
+        The counts are multiplied by duration / self.time, e.g., to
+        extrapolate a measured load spectrum to the design life.
+        '''
+        return self * (duration / self.time)
+
+    def minima_and_maxima(self):
+        '''Return minimum, maximum and counts of the non-empty cells.'''
+        u1, u2 = self.levels
+        i, j = divmod(self.index, self.shape[1])
+        if self.kind == 'minmax':
+            return u1[i], u2[j], self.counts
+        return u2[j] - u1[i] / 2., u2[j] + u1[i] / 2., self.counts
+
+    def amplitudes_and_means(self):
+        '''Return amplitude, mean and counts of the non-empty cells.'''
+        if self.kind == 'minmax':
+            m, M, counts = self.minima_and_maxima()
+            return abs(M - m) / 2., (M + m) / 2., counts
+        u1, u2 = self.levels
+        i, j = divmod(self.index, self.shape[1])
+        return u1[i] / 2., u2[j], self.counts
+
+    def level_crossings(self, kind='uM', intensity=False, levels=None):
+        """ Return level crossing spectrum of the counted cycles.
 
-        m, M = self.get_minima_and_maxima()
+        Parameters
+        ----------
+        kind, intensity, levels :
+            see CyclePairs.level_crossings. By default the levels are the
+            distinct extremes of the cells.
 
-        ncc = len(m)
-        minima = vstack((m, ones(ncc), zeros(ncc), ones(ncc)))
-        maxima = vstack((M, -ones(ncc), ones(ncc), zeros(ncc)))
-
-        extremes = hstack((maxima, minima))
-        index = extremes[0].argsort()
-        extremes = extremes[:, index]
-
-        ii = 0
-        n = extremes.shape[1]
-        extr = zeros((4, n))
-        extr[:, 0] = extremes[:, 0]
-        for i in xrange(1, n):
-            if extremes[0, i] == extr[0, ii]:
-                extr[1:4, ii] = extr[1:4, ii] + extremes[1:4, i]
-            else:
-                ii += 1
-                extr[:, ii] = extremes[:, i]
-
-        nx = extr[0].argmax() + 1
-        levels = extr[0, 0:nx]
-        if defnr == 2:  # This are upcrossings + maxima
-            dcount = cumsum(extr[1, 0:nx]) + extr[2, 0:nx] - extr[3, 0:nx]
-        elif defnr == 4:  # This are upcrossings + minima
-            dcount = cumsum(extr[1, 0:nx])
-            dcount[nx - 1] = dcount[nx - 2]
-        elif defnr == 1:  # This are only upcrossings
-            dcount = cumsum(extr[1, 0:nx]) - extr[3, 0:nx]
-        elif defnr == 3:  # This are upcrossings + minima + maxima
-            dcount = cumsum(extr[1, 0:nx]) + extr[2, 0:nx]
-        ylab = 'Count'
-        if intensity:
-            dcount = dcount / self.time
-            ylab = 'Intensity [count/sec]'
-        return LevelCrossings(dcount, levels, mean=self.mean, sigma=self.sigma,
-                              ylab=ylab, intensity=intensity)
+        Returns
+        -------
+        lc : LevelCrossings object
+        """
+        m, M, counts = self.minima_and_maxima()
+        return _cycles2lc(m, M, kind, intensity, levels, self.time, counts)
+
+    def damage(self, beta, K=1):
+        """
+        Return the total Palmgren-Miner damage of the counted cycles.
+
+        Parameters
+        ----------
+        beta : array-like, size m, or SNCurves object
+            Beta-values, material parameter, or S-N curves for which the
+            damage is evaluated.
+        K : scalar, optional
+            K-value, material parameter (ignored for SNCurves).
+
+        Returns
+        -------
+        D : ndarray, size m
+            Damage, D[i] = sum(counts * K * a**beta[i]) where a is the
+            amplitude of the cells.
+        """
+        amp, mean, counts = self.amplitudes_and_means()
+        if isinstance(beta, SNCurves):
+            return beta.cycle_damage(amp, mean, counts)
+        beta = atleast_1d(beta).ravel().astype(float)
+        return K * (amp ** beta[:, None]).dot(counts)
+
+    def save(self, filename):
+        '''Save the rainflow matrix to a compressed .npz file.
+
+        See also
+        --------
+        load_rfm
+        '''
+        np.savez_compressed(filename, index=self.index, counts=self.counts,
+                            param=np.array(self.param), kind=self.kind,
+                            time=self.time)
+
+
+def load_rfm(filename):
+    '''Return RainflowMatrix object saved with RainflowMatrix.save.'''
+    data = np.load(filename)
+    try:
+        rfm = RainflowMatrix(None, [tuple(p) for p in data['param']],
+                             str(data['kind']), float(data['time']))
+        rfm.index = data['index']
+        rfm.counts = data['counts']
+    finally:
+        data.close()
+    return rfm
+
+
+def cc2rfm(param, cc, kind='minmax', weights=None, time=None):
+    '''
+    Return RainflowMatrix object from a cycle count.
+
+    Parameters
+    ----------
+    param : (a, b, n) or ((a1, b1, n1), (a2, b2, n2))
+        discretization levels, see RainflowMatrix.
+    cc : CyclePairs object or array-like, shape (nc, 2) or (nc, 3)
+        cycle count. An (nc, 2) array holds minima in column 0 and maxima in
+        column 1. An (nc, 3) array holds amplitude, mean value and cycle
+        type, half (=0.5) or full (=1.0), as returned by
+        TurningPoints.cycle_astm.
+    kind : 'minmax' or 'rangemean'
+        axes of the matrix, see RainflowMatrix.
+    weights : array-like, shape (nc,), optional
+        weight of each cycle (default 1, or the cycle type of an (nc, 3)
+        array).
+    time : scalar, optional
+        duration of the load history (default cc.time for CyclePairs and 1
+        otherwise).
+
+    Returns
+    -------
+    rfm : RainflowMatrix object
+        Each extreme is rounded to the nearest level. Only the indices of
+        the cycles are formed, so the work space is proportional to the
+        number of cycles and the result to the number of non-empty cells.
+
+    Example
+    -------
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> from wafo.fatigue import cc2cmat
+    >>> ts = wo.mat2timeseries(wafo.data.sea())
+    >>> mm = ts.turning_points().cycle_pairs()
+    >>> rfm = wo.cc2rfm((-2, 2, 41), mm)
+    >>> m, M = mm.get_minima_and_maxima()
+    >>> np.allclose(rfm.todense(), cc2cmat((-2, 2, 41), np.c_[m, M]))
+    True
+    >>> sig_rfc = ts.turning_points(wavetype='astm').cycle_astm()
+    >>> rfm2 = wo.cc2rfm(((0, 4, 41), (-1, 1, 21)), sig_rfc, 'rangemean')
+    '''
+    if hasattr(cc, 'get_minima_and_maxima'):
+        if time is None:
+            time = cc.time
+        cc = np.column_stack(cc.get_minima_and_maxima())
+    cc = np.atleast_2d(np.asarray(cc, dtype=float))
+    if cc.shape[1] == 3:
+        amp, mean = cc[:, 0], cc[:, 1]
+        if weights is None:
+            weights = cc[:, 2]
+        cc = np.column_stack((mean - amp, mean + amp))
+    if kind == 'rangemean':
+        cc = np.column_stack((abs(cc[:, 1] - cc[:, 0]),
+                              (cc[:, 1] + cc[:, 0]) / 2.))
+    rfm = RainflowMatrix(None, param, kind, 1 if time is None else time)
+    param1, param2 = rfm.param
+    flat = (_cell_index(param1, cc[:, 0]) * param2[2] +
+            _cell_index(param2, cc[:, 1]))
+    rfm.index, inverse = np.unique(flat, return_inverse=True)
+    rfm.counts = np.bincount(inverse, weights=weights).astype(float)
+    return rfm
 
 
 class TurningPoints(PlotData):
@@ -958,6 +1431,143 @@ def mat2timeseries(x):
     return TimeSeries(x[:, 1::], x[:, 0].ravel())
 
 
+def _findrwin(x, valid, lag, L=None):
+    '''
+    Return Parzen windowed ACF of x estimated from the valid values only
+
+    The lag size, L, of the window is the lag where the ACF is less than 2
+    standard deviations unless given.
+    '''
+    xm = where(valid, x - x[valid].mean(), 0)
+    n = len(xm)
+    acf = array([xm[:n - k].dot(xm[k:]) for k in range(lag + 1)])
+    acf = acf / valid.sum()
+    if L is None:
+        stdev = sqrt((acf[0] ** 2 + 2 * np.sum(acf[1:] ** 2)) / valid.sum())
+        k = np.flatnonzero(abs(acf) > 2 * stdev)
+        if len(k) == 0:
+            L = lag
+        else:
+            L = int(min(4 * (k[-1] + 2) // 3, lag))
+    win = parzen(2 * L - 1)
+    return acf[:L] * win[L - 1:], L
+
+
+class _CrossingCounter(object):
+
+    '''
+    Level crossing spectrum of a record where only the values at the
+    changing points differ between calls.
+
+    The number of upcrossings of level u is the number of consecutive values
+    (x[i], x[i+1]) with x[i] < u <= x[i+1]. The counts from the pairs of
+    fixed values are computed once, hence each call only costs
+    O(#changing points + nlevels).
+    '''
+
+    def __init__(self, x, valid, changing, nlevels=10000):
+        pair = valid[:-1] & valid[1:]
+        fixed = pair & ~changing[:-1] & ~changing[1:]
+        x_known = x[valid & ~changing]
+        self.levels = linspace(x_known.min(), x_known.max(), nlevels)
+        self._fixed_counts = self._count(x[:-1][fixed], x[1:][fixed])
+        self._fixed_moments = (len(x_known), x_known.sum(),
+                               (x_known ** 2).sum())
+        self._i_pairs = np.flatnonzero(pair & ~fixed)
+        self._i_changing = np.flatnonzero(valid & changing)
+
+    def _count(self, lo, hi):
+        up = lo < hi
+        lo, hi = sort(lo[up]), sort(hi[up])
+        return (np.searchsorted(lo, self.levels) -
+                np.searchsorted(hi, self.levels))
+
+    def __call__(self, x=None):
+        '''
+        Return LevelCrossings of x. If x is None only the fixed values are
+        used.
+        '''
+        counts = self._fixed_counts
+        num, sum1, sum2 = self._fixed_moments
+        if x is not None:
+            i = self._i_pairs
+            counts = counts + self._count(x[i], x[i + 1])
+            x_new = x[self._i_changing]
+            num, sum1 = num + len(x_new), sum1 + x_new.sum()
+            sum2 = sum2 + (x_new ** 2).sum()
+        mean = sum1 / num
+        sigma = sqrt(max(sum2 / num - mean ** 2, 0))
+        return LevelCrossings(counts.astype(float), self.levels, mean=mean,
+                              sigma=sigma)
+
+
+_CHARACTERISTIC_NAMES = ('Hm0', 'Tm01', 'Tm02', 'Tm24', 'Tm_10', 'Tp', 'Ss',
+                         'Sp', 'Ka', 'Rs', 'Tp1', 'Alpha', 'Eps2', 'Eps4',
+                         'Qp')
+
+
+def _spectral_characteristics(S, w, g=9.81):
+    '''
+    Return spectral characteristics of spectra S(w) along the last axis
+
+    This is a vectorized version of SpecData1D.characteristic for spectra
+    on a common angular frequency grid, w. The characteristics are returned
+    in the order given by _CHARACTERISTIC_NAMES along the first axis.
+    '''
+    S = np.atleast_2d(S)
+    m = [simps(S * w ** k, w, axis=-1) / (2 * pi) ** k for k in range(5)]
+    ind = np.flatnonzero(w > 0)
+    m_1 = simps(S[..., ind] / w[ind], w[ind], axis=-1) * 2. * pi
+    Hm0 = 4. * sqrt(m[0])
+    Tm01 = m[0] / m[1]
+    Tm02 = sqrt(m[0] / m[2])
+    Tm24 = sqrt(m[2] / m[4])
+    Tm_10 = m_1 / m[0]
+    Tm12 = m[1] / m[2]
+
+    imax = S.argmax(axis=-1)
+    maxS = S.max(axis=-1)
+    Tp = 2. * pi / w[imax]  # peak period /length
+    Ss = 2. * pi * Hm0 / g / Tm02 ** 2  # Significant wave steepness
+    Sp = 2. * pi * Hm0 / g / Tp ** 2  # Average wave steepness
+    # groupiness factor
+    Ka = abs(simps(S * exp(1J * w * Tm02[..., None]), w, axis=-1)) / m[0]
+
+    # Quality control parameter, linear interpolation of S at 3 frequencies
+    wq = r_[0.0146, 0.0195, 0.0244] * 2 * pi
+    iq = np.clip(np.searchsorted(w, wq) - 1, 0, len(w) - 2)
+    aq = np.clip((wq - w[iq]) / (w[iq + 1] - w[iq]), 0, 1)
+    Sq = S[..., iq] * (1 - aq) + S[..., iq + 1] * aq
+    Rs = np.sum(Sq, axis=-1) / 3. / maxS
+    Tp1 = 2 * pi * simps(S ** 4, w, axis=-1) / simps(w * S ** 4, w, axis=-1)
+
+    alpha1 = Tm24 / Tm02
+    eps2 = sqrt(Tm01 / Tm12 - 1.)
+    eps4 = sqrt(1. - alpha1 ** 2)
+    Qp = 2. / m[0] ** 2 * simps(w * S ** 2, w, axis=-1)
+    return np.array([Hm0, Tm01, Tm02, Tm24, Tm_10, Tp, Ss, Sp, Ka, Rs, Tp1,
+                     alpha1, eps2, eps4, Qp])
+
+
+def _sea_state_window(args):
+    '''
+    Return wave statistics and optionally the departure from the Gaussian
+    model of the data in one window
+    '''
+    t, x, tr_method, g = args
+    ts = TimeSeries(x, t)
+    waves = ts.wave_statistics(g=g)
+    Hd = sort(waves['Hd'])
+    nw = len(Hd)
+    Hs = Hd[nw - max(nw // 3, 1):].mean() if nw else np.nan
+    Hmax = Hd[-1] if nw else np.nan
+    Tz = waves['Td'].mean() if nw else np.nan
+    test = np.nan
+    if tr_method is not None:
+        test = ts.trdata(method=tr_method)[0].dist2gauss()
+    return Hs, Hmax, Tz, nw, test
+
+
 class TimeSeries(PlotData):
     '''
     Container class for 1D TimeSeries data objects in WAFO
@@ -1119,6 +1729,19 @@ class TimeSeries(PlotData):
         w = fact * f
         return _wafospec.SpecData1D(S / fact, w)
 
+    def _get_channels(self, tr=None, detrend=None):
+        '''Returns data with each channel transformed and detrended
+        '''
+        yy = np.asarray(self.data, dtype=float)
+        if not (tr is None):
+            yy = tr.dat2gauss(yy.ravel()).reshape(yy.shape)
+        if hasattr(detrend, '__call__'):
+            if yy.ndim == 1:
+                yy = detrend(yy)
+            else:
+                yy = np.column_stack([detrend(y) for y in yy.T])
+        return yy
+
     def _get_bandwidth_and_dof(self, wname, n, L, dt):
         '''Returns bandwidth (rad/sec) and degrees of freedom
             used in chi^2 distribution
@@ -1203,10 +1826,7 @@ class TimeSeries(PlotData):
         rate = 2  # interpolationrate for frequency
         dt = self.sampling_period()
 
-        yy = self.data.ravel()
-        if not (tr is None):
-            yy = tr.dat2gauss(yy)
-        yy = detrend(yy) if hasattr(detrend, '__call__') else yy
+        yy = self._get_channels(tr, detrend)
         n = len(yy)
         L = min(L, n - 1)
 
@@ -1224,7 +1844,9 @@ class TimeSeries(PlotData):
             pad_to = rate * nfft  # Interpolate the spectrum with rate
             f, S = welch(yy, fs=1.0 / dt, window=window, nperseg=nfft,
                          noverlap=noverlap, nfft=pad_to, detrend=detrend,
-                         return_onesided=True, scaling='density', axis=-1)
+                         return_onesided=True, scaling='density', axis=0)
+            if S.ndim > 1:  # average over channels
+                S = S.mean(axis=1)
 #             S, f = psd(yy, Fs=1. / dt, NFFT=nfft, detrend=detrend,
 #                        window=win, noverlap=noverlap, pad_to=pad_to,
 #                        scale_by_freq=True)
@@ -1252,6 +1874,106 @@ class TimeSeries(PlotData):
         spec.note = 'method=%s' % method
         return spec
 
+    def tocrossspecdata(self, L=None, tr=None, method='cov',
+                        detrend=detrend_mean, window='parzen', noverlap=0):
+        '''
+        Estimate one-sided auto and cross spectral densities from data.
+
+        Parameters
+        ----------
+        L : scalar integer
+            maximum lag size of the window function (see tospecdata).
+        tr : transformation object
+            the transformation assuming that the channels are samples of a
+            transformed Gaussian process (default None)
+        method : string
+            defining estimation method. Options are
+            'cov' :  Frequency smoothing using the window function
+                    on the estimated auto and cross covariances. (default)
+            'psd' : Welch's averaged cross periodogram method.
+        detrend : function
+            defining detrending performed on the signal before estimation.
+            (default detrend_mean)
+        window : string or tuple
+            name of window function, see scipy.signal.get_window.
+        noverlap : scalar int
+             gives the length of the overlap between segments ('psd' only).
+
+        Returns
+        -------
+        Sxy : complex array, shape (nf, m, m)
+            cross spectral density matrix of the m channels, where
+            Sxy[:, i, j] is the cross spectrum between channel i and j and
+            Sxy[:, i, i] are the auto spectra. Sxy[k] is Hermitian.
+        w : array, shape (nf,)
+            angular frequencies [rad/s]
+
+        Notes
+        -----
+        All channels and segments are transformed in one batched FFT and the
+        work space grows linearly with the number of channels. The
+        result is the input needed for estimating directional spectra from
+        e.g. heave, pitch and roll buoy records.
+
+        Example
+        -------
+        >>> import wafo.data
+        >>> import wafo.objects as wo
+        >>> x = wafo.data.sea()
+        >>> ts = wo.TimeSeries(np.c_[x[:, 1], -x[:, 1]], x[:, 0])
+        >>> Sxy, w = ts.tocrossspecdata(L=150)
+        >>> Sxy.shape == (len(w), 2, 2)
+        True
+        >>> np.allclose(Sxy[:, 0, 1], -Sxy[:, 0, 0])
+        True
+
+        See also
+        --------
+        tospecdata, wafo.covariance.estimation.CovarianceEstimator.tocrosscov
+        '''
+        rate = 2  # interpolationrate for frequency
+        dt = self.sampling_period()
+        yy = self._get_channels(tr, detrend)
+        if yy.ndim == 1:
+            yy = yy[:, None]
+        n, m = yy.shape
+        L = min(L, n - 1)
+        tsy = TimeSeries(yy, self.args)
+
+        if method == 'cov':
+            estimate_cov = _wafocov_estimation.CovarianceEstimator(
+                lag=L, window=window)
+            R, _t = estimate_cov.tocrosscov(tsy)
+            L = len(R) - 1
+            nfft = rate * 2 ** nextpow2(2 * L)
+            c = zeros((nfft, m, m))
+            c[:L + 1] = R
+            c[nfft - L:] = R[L:0:-1].transpose(0, 2, 1)  # negative lags
+            Sxy = fft(c, axis=0)[:nfft // 2 + 1] * (dt / pi)
+        elif method == 'psd':
+            if L is None:
+                L = len(tsy.tocovdata(window=window).data) - 1
+            nperseg = min(2 ** nextpow2(L), n)
+            nfft = rate * nperseg
+            step = nperseg - noverlap
+            nseg = (n - noverlap) // step
+            x = np.ascontiguousarray(yy.T)
+            segments = as_strided(x, shape=(m, nseg, nperseg),
+                                  strides=(x.strides[0], step * x.strides[1],
+                                           x.strides[1]))
+            win = get_window(window, nperseg)
+            X = rfft(segments * win, nfft, axis=-1)
+            scale = 2 * dt / ((win ** 2).sum() * nseg)  # one-sided density
+            Sxy = np.einsum('isf,jsf->fij', X.conj(), X) * scale
+            Sxy[0] /= 2
+            if nfft % 2 == 0:
+                Sxy[-1] /= 2
+            Sxy /= 2 * pi  # density per rad/s
+        else:
+            raise ValueError('Unknown method (%s)' % method)
+        w = arange(nfft // 2 + 1) * (2 * pi / (nfft * dt))
+        return Sxy, w
+
     def trdata(self, method='nonlinear', **options):
         '''
         Estimate transformation, g, from data.
@@ -1363,6 +2085,127 @@ class TimeSeries(PlotData):
         estimate = TransformEstimator(method=method, **options)
         return estimate.trdata(self)
 
+    def rolling_analysis(self, window=1800, overlap=0, L=None,
+                         method='cov', tr_method=None, n_jobs=1, g=9.81):
+        '''
+        Return a table of sea state parameters in consecutive windows
+
+        Parameters
+        ----------
+        window : scalar
+            length of each window in the units of the sampling times, i.e.,
+            seconds (default 1800, i.e., 30 minutes).
+        overlap : scalar
+            overlap between consecutive windows in the same units.
+        L : scalar integer
+            maximum lag size of the window function used in the spectral
+            estimation. Default is estimated once from the whole record, see
+            tospecdata.
+        method : string
+            'cov' : Frequency smoothing using the Parzen window function on
+                    the estimated autocovariance function (default)
+            'psd' : Welch's averaged periodogram method with no overlapping
+                    batches of length 2**nextpow2(L)
+        tr_method : string or None
+            if given, method used for estimating the transformation, g, in
+            each window, see trdata. Its departure from the Gaussian model
+            is returned in the field 'test'.
+        n_jobs : scalar integer
+            number of processes used for the wave statistics and
+            transformation of each window (default 1). n_jobs <= 0 uses all
+            cpus.
+        g : scalar
+            acceleration of gravity [m/s^2]
+
+        Returns
+        -------
+        table : numpy.recarray
+            with one record per window and the fields
+            t : start time of the window
+            Hm0, Tm01, Tm02, Tm24, Tm_10, Tp, Ss, Sp, Ka, Rs, Tp1, Alpha,
+            Eps2, Eps4, Qp : spectral characteristics, see
+                SpecData1D.characteristic
+            Hs, Hmax : mean of the highest third and maximum zero-downcrossing
+                wave height, respectively.
+            Tz : mean zero-downcrossing wave period
+            Nw : number of waves
+            test : int (g(u)-u)^2 du, nan if tr_method is None.
+
+        Notes
+        -----
+        The windows are strided views into the data, and the spectra of all
+        windows are estimated at once with batched FFTs. Hence the cost is
+        dominated by the wave by wave analysis which may be run in parallel.
+
+        Example
+        -------
+        >>> import wafo.data
+        >>> import wafo.objects as wo
+        >>> ts = wo.mat2timeseries(wafo.data.sea())
+        >>> table = ts.rolling_analysis(window=300, overlap=60)
+        >>> len(table), table.dtype.names[:3]
+        (9, ('t', 'Hm0', 'Tm01'))
+
+        See also
+        --------
+        tospecdata, wave_statistics, SpecData1D.characteristic
+        '''
+        dt = self.sampling_period()
+        t = np.asarray(self.args)
+        x = np.ascontiguousarray(self.data, dtype=float).ravel()
+        nw = int(round(window / dt))
+        step = nw - int(round(overlap / dt))
+        if not 0 < step <= nw <= len(x):
+            raise ValueError('Window must be positive, longer than the ' +
+                             'overlap and shorter than the record!')
+        num_windows = (len(x) - nw) // step + 1
+        stride = x.strides[0]
+        segments = as_strided(x, shape=(num_windows, nw),
+                              strides=(step * stride, stride))
+        if L is None:
+            L = len(self.tocovdata(window='parzen').data) - 1
+        L = min(L, nw - 2)
+
+        rate = 2  # interpolationrate for frequency
+        if method == 'cov':
+            y = segments - segments.mean(axis=-1)[:, None]
+            nfft = 2 ** nextpow2(2 * nw)
+            R = irfft(abs(rfft(y, nfft, axis=-1)) ** 2, nfft,
+                      axis=-1)[:, :L + 1] / nw
+            R[:, :L] *= get_window('parzen', 2 * L - 1)[L - 1:]
+            R[:, L] = 0
+            R[:, 0] += 1e-12  # nugget
+            # embedding a circulant vector and Fourier transform, see
+            # CovData1D.tospecdata
+            nfft = 2 ** nextpow2(2 * L) * rate
+            acf = np.hstack((R, zeros((num_windows, nfft - 2 * L)),
+                             R[:, L - 1:0:-1]))
+            Rper = rfft(acf, axis=-1).real.clip(0)
+            Rper = where(Rper < 1e-5 * Rper.max(axis=-1)[:, None], 0, Rper)
+            S = Rper * dt / pi
+            w = linspace(0, pi / dt, nfft // 2 + 1)
+        elif method == 'psd':
+            nfft = 2 ** nextpow2(L)
+            f, S = welch(segments, fs=1.0 / dt, window='parzen',
+                         nperseg=nfft, noverlap=0, nfft=rate * nfft,
+                         detrend='constant', return_onesided=True,
+                         scaling='density', axis=-1)
+            w = 2 * pi * f
+            S = S / (2 * pi)
+        else:
+            raise ValueError('Unknown method (%s)' % method)
+        characteristics = _spectral_characteristics(S, w, g)
+
+        starts = np.arange(num_windows) * step
+        results = parallel_map(_sea_state_window,
+                               [(t[i:i + nw], segments[k], tr_method, g)
+                                for k, i in enumerate(starts)], n_jobs)
+        names = ('t',) + _CHARACTERISTIC_NAMES + ('Hs', 'Hmax', 'Tz', 'Nw',
+                                                   'test')
+        columns = [t[starts]] + list(characteristics) + [
+            np.array(column) for column in zip(*results)]
+        return np.rec.fromarrays(columns, names=names)
+
     def turning_points(self, h=0.0, wavetype=None):
         '''
         Return turning points (tp) from data, optionally rainflowfiltered.
@@ -1493,34 +2336,11 @@ class TimeSeries(PlotData):
 
         See also
         --------
-        wafo.definitions
+        wave_statistics, wafo.definitions
         '''
-        dT = self.sampling_period()
-        if rate > 1:
-            dT = dT / rate
-            t0, tn = self.args[0], self.args[-1]
-            n = len(self.args)
-            ti = linspace(t0, tn, int(rate * n))
-            xi = interp1d(self.args, self.data.ravel(), kind='cubic')(ti)
-        else:
-            ti, xi = self.args, self.data.ravel()
-
-        tc_ind, z_ind = findtc(xi, v=0, kind='tw')
-        tc_a = xi[tc_ind]
-        tc_t = ti[tc_ind]
-        Ac = tc_a[1::2]  # crest amplitude
-        At = -tc_a[0::2]  # trough  amplitude
-        Hu = Ac + At[1:]
-        Hd = Ac + At[:-1]
-        tu = ecross(ti, xi, z_ind[1::2], v=0)
-        Tu = diff(tu)  # Period zero-upcrossing waves
-        td = ecross(ti, xi, z_ind[::2], v=0)
-        Td = diff(td)  # Period zero-downcrossing waves
-        Tcf = tc_t[1::2] - tu[:-1]
-        Tcf[(Tcf == 0)] = dT  # avoiding division by zero
-        Tcb = td[1:] - tc_t[1::2]
-        Tcb[(Tcb == 0)] = dT  # avoiding division by zero
-        return dict(Ac=Ac, At=At, Hu=Hu, Hd=Hd, Tu=Tu, Td=Td, Tcf=Tcf, Tcb=Tcb)
+        waves = self.wave_statistics(rate)
+        return dict((name, waves[name]) for name in ['Ac', 'At', 'Hu', 'Hd',
+                                                     'Tu', 'Td', 'Tcf', 'Tcb'])
 
     def wave_height_steepness(self, method=1, rate=1, g=None):
         '''
@@ -1581,81 +2401,141 @@ class TimeSeries(PlotData):
 
         See also
         --------
-        wafo.definitions
+        wave_statistics, wafo.definitions
         '''
 
+        waves = self.wave_statistics(rate, g)
+        if method == 0:
+            # max(Vcf, Vcr) and the corresponding wave height Hd or Hu in H
+            is_front = waves['Tcf'] < waves['Tcb']
+            S = np.where(is_front, waves['Vcf'], waves['Vcb'])
+            H = np.where(is_front, waves['Hd'], waves['Hu'])
+            return S, H
+        name_s, name_h = {1: ('Vcf', 'Hd'), -1: ('Vcb', 'Hu'),
+                          2: ('Scf', 'Hd'), -2: ('Scb', 'Hu'),
+                          3: ('Sd', 'Hd'), -3: ('Su', 'Hu')}[method]
+        return waves[name_s], waves[name_h]
+
+    def _interpolate(self, rate=1):
+        '''
+        Return times, values and sampling period of data interpolated with a
+        cubic spline if rate is greater than one.
+        '''
         dT = self.sampling_period()
-        if g is None:
-            g = gravity()  # % acceleration of gravity
-
+        ti, xi = np.asarray(self.args), self.data.ravel()
         if rate > 1:
             dT = dT / rate
-            t0, tn = self.args[0], self.args[-1]
-            n = len(self.args)
-            ti = linspace(t0, tn, int(rate * n))
-            xi = interp1d(self.args, self.data.ravel(), kind='cubic')(ti)
+            n = len(ti)
+            t_i = linspace(ti[0], ti[-1], int(rate * n))
+            ti, xi = t_i, interp1d(ti, xi, kind='cubic')(t_i)
+        return ti, xi, dT
 
-        else:
-            ti, xi = self.args, self.data.ravel()
+    def wave_statistics(self, rate=1, g=None):
+        '''
+        Returns wave by wave parameters from data in one pass.
+
+        Parameters
+        ----------
+        rate : scalar integer
+            interpolation rate. Interpolates with spline if greater than one.
+        g : scalar
+            acceleration of gravity (default see gravity)
+
+        Returns
+        -------
+        waves : dict
+            with the following wave parameters for the zero separated
+            troughs and crests:
+            Ac, At : Crest and trough amplitude, respectively
+            Hu, Hd : zero-up- and down-crossing wave height, respectively.
+            Tu, Td : zero-up- and down-crossing wave period, respectively.
+            Tc, Tt : Crest and trough period, respectively.
+            Tcc, Ttt : Crest2crest and trough2trough period, respectively.
+            Tcf, Tcb : Crest front and crest back period, respectively.
+            Ttf, Ttb : Trough front and trough back period, respectively.
+            Tct, Ttc : Crest2trough and trough2crest period, respectively.
+            TmM, TMm, Tmm, TMM : min2Max, Max2min, min2min and Max2Max
+                periods between all turning points, respectively.
+            Vcf, Vcb : Crest front and crest back speed, respectively.
+            Scf, Scb : Crest front and crest back steepness, respectively.
+            Sd, Su : Total wave steepness of zero-down- and up-crossing
+                waves, respectively.
+
+        Ac[i], Hu[i], Hd[i], Tu[i], Td[i], Tc[i], Tcf[i], Tcb[i], Tct[i],
+        Ttc[i] and the speeds and steepnesses belong to the i'th crest, while
+        At, Tt, Ttf and Ttb belong to the troughs which enclose the crests,
+        i.e., they have one more element. Zero Tcf and Tcb are set to the
+        sampling period in order to avoid division by zero.
+
+        The crossings and turning points are found and interpolated only
+        once, hence this is much faster than calling wave_parameters,
+        wave_height_steepness and wave_periods for each parameter.
+        The parameters are calculated as follows:
+          Crest front speed (velocity) = Vcf = Ac/Tcf
+          Crest back speed  (velocity) = Vcb = Ac/Tcb
+          Crest front steepness  = Scf = 2*pi*Ac./Td/Tcf/g
+          Crest back steepness   = Scb = 2*pi*Ac./Tu/Tcb/g
+          Total wave steepness (zero-downcrossing wave) = Sd = 2*pi*Hd./Td.^2/g
+          Total wave steepness (zero-upcrossing wave)   = Su = 2*pi*Hu./Tu.^2/g
+
+        Example
+        -------
+        >>> import wafo.data as wd
+        >>> import wafo.objects as wo
+        >>> x = wd.sea()
+        >>> ts = wo.mat2timeseries(x)
+        >>> waves = ts.wave_statistics()
+        >>> for name in ['Ac', 'Hd', 'Td', 'Vcf', 'Sd']:
+        ...    print('%s' % name, waves[name][:2])
+        ('Ac', array([ 0.25950546,  0.34950546]))
+        ('Hd', array([ 0.42,  0.78]))
+        ('Td', array([ 3.84377468,  6.35707656]))
+        ('Vcf', array([ 0.60835634,  0.60930197]))
+        ('Sd', array([ 0.01821413,  0.01236672]))
+
+        See also
+        --------
+        wafo.definitions
+        '''
+        if g is None:
+            g = gravity()  # % acceleration of gravity
+        ti, xi, dT = self._interpolate(rate)
 
         tc_ind, z_ind = findtc(xi, v=0, kind='tw')
         tc_a = xi[tc_ind]
         tc_t = ti[tc_ind]
+        t_t, t_c = tc_t[0::2], tc_t[1::2]  # times of troughs and crests
+        tz = ecross(ti, xi, z_ind, v=0)
+        t_d, t_u = tz[0::2], tz[1::2]  # times of down- and up-crossings
+
         Ac = tc_a[1::2]  # crest amplitude
         At = -tc_a[0::2]  # trough  amplitude
+        Hu = Ac + At[1:]
+        Hd = Ac + At[:-1]
+        Tu = diff(t_u)  # Period zero-upcrossing waves
+        Td = diff(t_d)  # Period zero-downcrossing waves
+        Tcf = t_c - t_u[:-1]
+        Tcf[(Tcf == 0)] = dT  # avoiding division by zero
+        Tcb = t_d[1:] - t_c
+        Tcb[(Tcb == 0)] = dT  # avoiding division by zero
 
-        if (0 <= method and method <= 2):
-            # time between zero-upcrossing and  crest  [s]
-            tu = ecross(ti, xi, z_ind[1:-1:2], v=0)
-            Tcf = tc_t[1::2] - tu
-            Tcf[(Tcf == 0)] = dT  # avoiding division by zero
-        if (0 >= method and method >= -2):
-            # time between  crest and zero-downcrossing [s]
-            td = ecross(ti, xi, z_ind[2::2], v=0)
-            Tcb = td - tc_t[1::2]
-            Tcb[(Tcb == 0)] = dT
-            # % avoiding division by zero
-
-        if method == 0:
-            # max(Vcf, Vcr) and the corresponding wave height Hd or Hu in H
-            Hu = Ac + At[1:]
-            Hd = Ac + At[:-1]
-            T = np.where(Tcf < Tcb, Tcf, Tcb)
-            S = Ac / T
-            H = np.where(Tcf < Tcb, Hd, Hu)
-        elif method == 1:  # extracting crest front velocity [m/s] and
-            # Zero-downcrossing wave height [m]
-            H = Ac + At[:-1]  # Hd
-            S = Ac / Tcf
-        elif method == -1:  # extracting crest rear velocity [m/s] and
-            # Zero-upcrossing wave height [m]
-            H = Ac + At[1:]  # Hu
-            S = Ac / Tcb
-        # crest front steepness in S and the wave height Hd in H.
-        elif method == 2:
-            H = Ac + At[:-1]  # Hd
-            Td = diff(ecross(ti, xi, z_ind[::2], v=0))
-            S = 2 * pi * Ac / Td / Tcf / g
-        # crest back steepness in S and the wave height Hu in H.
-        elif method == -2:
-            H = Ac + At[1:]
-            Tu = diff(ecross(ti, xi, z_ind[1::2], v=0))
-            S = 2 * pi * Ac / Tu / Tcb / g
-        elif method == 3:  # total steepness in S and the wave height Hd in H
-            # for zero-doewncrossing waves.
-            H = Ac + At[:-1]
-            # Period zero-downcrossing waves
-            Td = diff(ecross(ti, xi, z_ind[::2], v=0))
-            S = 2 * pi * H / Td ** 2 / g
-        # total steepness in S and the wave height Hu in H for
-        elif method == -3:
-            # zero-upcrossing waves.
-            H = Ac + At[1:]
-            # Period zero-upcrossing waves
-            Tu = diff(ecross(ti, xi, z_ind[1::2], v=0))
-            S = 2 * pi * H / Tu ** 2 / g
-
-        return S, H
+        tp_ind = findtp(xi, 0)
+        t_tp = ti[tp_ind]
+        # index to the first minimum and maximum
+        i_m, i_M = (0, 1) if xi[tp_ind[0]] < xi[tp_ind[1]] else (1, 0)
+        dt_tp = diff(t_tp)
+        return dict(Ac=Ac, At=At, Hu=Hu, Hd=Hd, Tu=Tu, Td=Td,
+                    Tc=t_d[1:] - t_u[:-1], Tt=t_u - t_d,
+                    Tcc=diff(t_c), Ttt=diff(t_t),
+                    Tcf=Tcf, Tcb=Tcb, Ttf=t_t - t_d, Ttb=t_u - t_t,
+                    Tct=t_t[1:] - t_c, Ttc=t_c - t_t[:-1],
+                    TmM=dt_tp[i_m::2], TMm=dt_tp[i_M::2],
+                    Tmm=diff(t_tp[i_m::2]), TMM=diff(t_tp[i_M::2]),
+                    Vcf=Ac / Tcf, Vcb=Ac / Tcb,
+                    Scf=2 * pi * Ac / Td / Tcf / g,
+                    Scb=2 * pi * Ac / Tu / Tcb / g,
+                    Sd=2 * pi * Hd / Td ** 2 / g,
+                    Su=2 * pi * Hu / Tu ** 2 / g)
 
     def wave_periods(self, vh=None, pdef='d2d', wdef=None, index=None, rate=1):
         """
@@ -1831,296 +2711,189 @@ class TimeSeries(PlotData):
         return T, index
 
     def reconstruct(self, inds=None, Nsim=20, L=None, def_='nonlinear',
-                    **options):
+                    n_jobs=1, random_state=None, **options):
         '''
-        function [y,g,g2,test,tobs,mu1o, mu1oStd] = reconstruct(x,)
-        RECONSTRUCT reconstruct the spurious/missing points of timeseries
-
-         CALL: [y,g,g2,test,tobs,mu1o,mu1oStd]=
-             reconstruct(x,inds,Nsim,L,def,options)
+        Reconstruct the spurious/missing points of timeseries
 
         Returns
         -------
-        y   = reconstructed signal
-        g,g2 = smoothed and empirical transformation, respectively
-        test, tobs = test observator int(g(u)-u)^2 du and
-                     int(g_new(u)-g_old(u))^2 du,
-                     respectively, where int limits is given by param in lc2tr.
-                     Test is a measure of departure from the Gaussian model for
-                     the data. Tobs is a measure of the convergence of the
-                     estimation of g.
-        mu1o = expected surface elevation of the Gaussian model process.
-        mu1o_std = standarddeviation of mu1o.
+        y : TimeSeries object
+            reconstructed signal
+        g, g2 : TrData objects
+            smoothed and empirical transformation, respectively
+        test, tobs : real scalars
+            test observator int(g(u)-u)^2 du and int(g_new(u)-g_old(u))^2 du,
+            respectively, where int limits is given by param in lc2tr.
+            Test is a measure of departure from the Gaussian model for the
+            data. Tobs is a measure of the convergence of the estimation of g.
+        mu1o : ndarray
+            expected surface elevation of the Gaussian model process.
+        mu1o_std : ndarray
+            standarddeviation of mu1o.
 
         Parameters
         ----------
-        x : 2 column timeseries
-            first column sampling times [sec]
-            second column surface elevation [m]
         inds : integer array
-            indices to spurious points of x
-        Nsim = the maximum # of iterations before we stop
-
-        L = lag size of the Parzen window function.
-                     If no value is given the lag size is set to
-                     be the lag where the auto correlation is less than
-                     2 standard deviations. (maximum 200)
-        def :
+            indices to spurious points of the timeseries. NaN values are
+            also treated as spurious.
+        Nsim : scalar integer
+            the maximum # of iterations before we stop
+        L : scalar integer
+            lag size of the Parzen window function. If no value is given the
+            lag size is set to be the lag where the auto correlation is less
+            than 2 standard deviations. (maximum 200 seconds)
+        def_ : string
             'nonlinear' : transform from smoothed crossing intensity (default)
             'mnonlinear': transform from smoothed marginal distribution
             'linear'    : identity.
-        options = options structure defining how the estimation of g is
-                     done, see troptset.
+        n_jobs : scalar integer
+            number of processes used for the conditional simulation of the
+            gaps (default 1). n_jobs <= 0 uses all cpus.
+        random_state : None, int, tuple or numpy.random.RandomState
+            source of the random numbers, see wafo.misc.check_random_state.
+        options : keywords
+            defining how the estimation of g is done, see TransformEstimator.
+
+        In order to reconstruct the data a transformed Gaussian random process
+        is used for modelling and simulation of the missing/removed data
+        conditioned on the other known observations. Each gap is simulated
+        from the known values at less than L lags from it, hence the gaps are
+        reconstructed independently of each other (see
+        CovData1D.simcond_gaps). The conditional distributions are reused
+        between the iterations as long as the estimated ACF does not change,
+        and the crossing spectrum used to estimate g is only updated for the
+        reconstructed values. The known values are left untouched.
+
+        Estimates of standarddeviations of y is obtained by
+                Std = g.gauss2dat(mu1o+/-mu1o_std)
 
-         In order to reconstruct the data a transformed Gaussian random process
-         is used for modelling and simulation of the missing/removed data
-         conditioned on the other known observations.
+        Example
+        -------
+        >>> import wafo.spectrum.models as sm
+        >>> import wafo.objects as wo
+        >>> S = sm.Jonswap().tospecdata()
+        >>> ts = wo.mat2timeseries(S.sim(ns=5000, random_state=0))
+        >>> inds = np.r_[100:110, 1000:1020, 3000:3005]
+        >>> y, g, g2, test, tobs, mu1o, mu1o_std = ts.reconstruct(
+        ...     inds, Nsim=5, random_state=1)
+        >>> np.isnan(y.data).any()
+        False
 
-         Estimates of standarddeviations of y is obtained by a call to tranproc
-                Std = tranproc(mu1o+/-mu1oStd,fliplr(g));
+        See also
+        --------
+        TransformEstimator, CovData1D.simcond_gaps
 
-         See also
-         --------
-         troptset, findoutliers, cov2csdat, dat2cov, dat2tr, detrendma
-
-         Reference
-         ---------
-         Brodtkorb, P, Myrhaug, D, and Rue, H (2001)
-         "Joint distribution of wave height and wave crest velocity from
-         reconstructed data with application to ringing"
-         Int. Journal of Offshore and Polar Engineering, Vol 11, No. 1,
-         pp 23--32
-
-         Brodtkorb, P, Myrhaug, D, and Rue, H (1999)
-         "Joint distribution of wave height and wave crest velocity from
-         reconstructed data
-         in Proceedings of 9th ISOPE Conference, Vol III, pp 66-73
+        Reference
+        ---------
+        Brodtkorb, P, Myrhaug, D, and Rue, H (2001)
+        "Joint distribution of wave height and wave crest velocity from
+        reconstructed data with application to ringing"
+        Int. Journal of Offshore and Polar Engineering, Vol 11, No. 1,
+        pp 23--32
+
+        Brodtkorb, P, Myrhaug, D, and Rue, H (1999)
+        "Joint distribution of wave height and wave crest velocity from
+        reconstructed data
+        in Proceedings of 9th ISOPE Conference, Vol III, pp 66-73
         '''
 
         opt = DotDict(chkder=True, plotflag=False, csm=0.9, gsm=.05,
                       param=(-5, 5, 513), delay=2, linextrap=True, ntr=10000,
                       ne=7, gvar=1)
         opt.update(options)
+        rng = check_random_state(random_state)
 
-        xn = self.data.copy().ravel()
+        xn = np.array(self.data, dtype=float).ravel()
         n = len(xn)
 
         if n < 2:
             raise ValueError('The vector must have more than 2 elements!')
 
         param = opt.param
-        plotflags = dict(none=0, off=0, final=1, iter=2)
-        plotflag = plotflags.get(opt.plotflag, opt.plotflag)
-
-        olddef = def_
-        method = 'approx'
-        ptime = opt.delay  # pause for ptime sec if plotflag=2
-
-        expect1 = 1  # first reconstruction by expectation? 1=yes 0=no
-        expect = 1   # reconstruct by expectation? 1=yes 0=no
         tol = 0.001  # absolute tolerance of e(g_new-g_old)
 
-        cmvmax = 100 # if number of consecutive missing values (cmv) are longer they
-                     # are not used in estimation of g, due to the fact that the
-                     # conditional expectation approaches zero as the length to
-                     # the closest known points increases, see below in the for loop 
+        cmvmax = 100  # if number of consecutive missing values (cmv) are
+        # longer they are not used in estimation of g, due to the fact that
+        # the conditional expectation approaches zero as the length to the
+        # closest known points increases.
         dT = self.sampling_period()
 
-        Lm = np.minimum([n, 200, int(200/dT)])  # Lagmax 200 seconds
+        Lm = int(min(n, 200, 200 / dT))  # Lagmax 200 seconds
         if L is not None:
             Lm = max(L, Lm)
-        # Lma: size of the moving average window used for detrending the
-        #     reconstructed signal
-        Lma = 1500
         if inds is not None:
             xn[inds] = np.nan
 
-        inds = isnan(xn)
-        if not inds.any():
+        mask = isnan(xn)
+        if not mask.any():
             raise ValueError('No spurious data given')
-
-        endpos = np.diff(inds)
-        strtpos = np.flatnonzero(endpos > 0)
-        endpos = np.flatnonzero(endpos < 0)
-
-        indg = np.flatnonzero(1-inds)  # indices to good points
-        inds = np.flatnonzero(inds)  # indices to spurious points
-
-        indNaN = []  # indices to points omitted in the covariance estimation
-        indr = np.arange(n)  # indices to point used in the estimation of g
-
-        # Finding more than cmvmax consecutive spurios points.
-        # They will not be used in the estimation of g and are thus removed
-        # from indr.
-
-        if strtpos.size > 0 and (endpos.size == 0 or endpos[-1] < strtpos[-1]):
-            if (n - strtpos[-1]) > cmvmax:
-                indNaN = indr[strtpos[-1]+1:n]
-                indr = indr[:strtpos[-1]+1]
-            strtpos = strtpos[:-1]
-
-        if endpos.size > 0 and (strtpos.size == 0 or endpos[0] < strtpos[0]):
-            if endpos[0] > cmvmax:
-                indNaN = np.hstack((indNaN, indr[:endpos[0]]))
-                indr = indr[endpos[0]:]
-
-            strtpos = strtpos-endpos[0]
-            endpos = endpos-endpos[0]
-            endpos = endpos[1:]
-
-        for ix in range(len(strtpos)-1, -1, -1):
-            if (endpos[ix]-strtpos[ix] > cmvmax):
-                indNaN = np.hstack((indNaN, indr[strtpos[ix]+1:endpos[ix]]))
-                # remove this when estimating the transform
-                del indr[strtpos[ix]+1:endpos[ix]]
-
-        if len(indr) < 0.1*n:
+        inds = np.flatnonzero(mask)
+
+        # Finding more than cmvmax consecutive spurious points. They will not
+        # be used in the estimation of g.
+        edges = diff(r_[0, mask.view(np.int8), 0])
+        strtpos, endpos = np.flatnonzero(edges > 0), np.flatnonzero(edges < 0)
+        is_long = (endpos - strtpos) > cmvmax
+        edges = zeros(n + 1)
+        edges[strtpos[is_long]] += 1
+        edges[endpos[is_long]] -= 1
+        indr = cumsum(edges[:n]) == 0  # points used in the estimation of g
+
+        if indr.sum() < 0.1 * n:
             raise ValueError('Not possible to reconstruct signal')
 
-        if indNaN.any():
-            indNaN = np.sort(indNaN)
-
-        # initial reconstruction attempt
-        # xn(indg,2) = detrendma(xn(indg,2),1500);
-#         [g, test, cmax, irr, g2]  = dat2tr(xn(indg,:),def,opt);
-#         xnt=xn;
-#         xnt(indg,:)=dat2gaus(xn(indg,:),g);
-#         xnt(inds,2)=NaN;
-#         rwin=findrwin(xnt,Lm,L);
-#         disp(['First reconstruction attempt,    e(g-u)=', num2str(test)] )
-#         # old simcgauss
-#         [samp ,mu1o, mu1oStd]  = cov2csdat(xnt(:,2),rwin,1,method,inds);
-#         if expect1,# reconstruction by expectation
-#           xnt(inds,2) =mu1o;
-#         else
-#           xnt(inds,2) =samp;
-#         end
-#         xn=gaus2dat(xnt,g);
-#         xn(:,2)=detrendma(xn(:,2),Lma); # detrends the signal with a moving
-#                                          # average of size Lma
-#         g_old=g;
-#
-#         bias = mean(xn(:,2));
-#         xn(:,2)=xn(:,2)-bias; # bias correction
-
-#         if plotflag==2
-#           clf
-#           mind=1:min(1500,n);
-#           waveplot(xn(mind,:),x(inds(mind),:), 6,1)
-#           subplot(111)
-#           pause(ptime)
-#         end
-#
-#         test0=0;
-#         for ix=1:Nsim,
-#         #   if 0,#ix==2,
-#         #     rwin=findrwin(xn,Lm,L);
-#         #     xs=cov2sdat(rwin,[n 100 dT]);
-#         #     [g0 test0 cmax irr g2]  = dat2tr(xs,def,opt);
-#         #     [test0 ind0]=sort(test0);
-#         #   end
-
-#            if 1, #test>test0(end-5),
-#              # 95# sure the data comes from a non-Gaussian process
-#              def = olddef; #Non Gaussian process
-#            else
-#              def = 'linear'; # Gaussian process
-#            end
-#            # used for isope article
-#            # indr =[1:27000 30000:39000];
-#            # Too many consecutive missing values will influence the estimation of
-#            # g. By default do not use consecutive missing values if there are more 
-#            # than cmvmax. 
-#
-#            [g test cmax irr g2]  = dat2tr(xn(indr,:),def,opt);
-#           if plotflag==2,
-#             pause(ptime)
-#           end
-# 
-#           #tobs=sqrt((param(2)-param(1))/(param(3)-1)*sum((g_old(:,2)-g(:,2)).^2))
-#           # new call
-#           tobs=sqrt((param(2)-param(1))/(param(3)-1)....
-#             *sum((g(:,2)-interp1(g_old(:,1)-bias, g_old(:,2),g(:,1),'spline')).^2));
-#
-#           if ix>1 
-#             if tol>tobs2 && tol>tobs,
-#               break, #estimation of g converged break out of for loop    
-#             end
-#           end
-#
-#           tobs2=tobs;
-#
-#           xnt=dat2gaus(xn,g);
-#           if ~isempty(indNaN),    xnt(indNaN,2)=NaN;  end
-#           rwin=findrwin(xnt,Lm,L);    
-#           disp(['Simulation nr: ', int2str(ix), ' of ' num2str(Nsim),'   e(g-g_old)=', num2str(tobs), ',  e(g-u)=', num2str(test)])
-#           [samp ,mu1o, mu1oStd]  = cov2csdat(xnt(:,2),rwin,1,method,inds);
-#           
-#           if expect,
-#             xnt(inds,2) =mu1o;
-#           else
-#             xnt(inds,2) =samp;
-#           end
-#           
-#           xn=gaus2dat(xnt,g);
-#           if ix<Nsim
-#             bias=mean(xn(:,2));
-#             xn(:,2) = (xn(:,2)-bias); # bias correction
-#           end
-#           g_old=g;# saving the last transform
-#           if plotflag==2
-#             waveplot(xn(mind,:),x(inds(mind),:),6,1,[])
-#             subplot(111)
-#             pause(ptime)
-#           end
-#         end # for loop
-#         
-#         if 1, #test>test0(end-5) 
-#           xnt=dat2gaus(xn,g);
-#           [samp ,mu1o, mu1oStd]  = cov2csdat(xnt(:,2),rwin,1,method,inds);
-#           xnt(inds,2) =samp;
-#           xn=gaus2dat(xnt,g);
-#           bias=mean(xn(:,2));
-#           xn(:,2) = (xn(:,2)-bias); # bias correction
-#           g(:,1)=g(:,1)-bias;
-#           g2(:,1)=g2(:,1)-bias;
-#           gn=trangood(g);
-#          
-#           #mu1o=mu1o-tranproc(bias,gn);
-#           muUStd=tranproc(mu1o+2*mu1oStd,fliplr(gn));#
-#           muLStd=tranproc(mu1o-2*mu1oStd,fliplr(gn));#
-#         else
-#           muLStd=mu1o-2*mu1oStd;
-#           muUStd=mu1o+2*mu1oStd;
-#         end
-#         
-#         if  plotflag==2 && length(xn)<10000,
-#           waveplot(xn,[xn(inds,1) muLStd ;xn(inds,1) muUStd ], 6,round(n/3000),[])
-#           legend('reconstructed','2 stdev')
-#           #axis([770 850 -1 1])
-#           #axis([1300 1325 -1 1])
-#         end
-#         y=xn;
-#         toc
-#
-#         return
-#
-#         function r=findrwin(xnt,Lm,L)
-#           r=dat2cov(xnt,Lm);#computes  ACF
-#           #finding where ACF is less than 2 st. deviations .
-#           # in order to find a better L  value
-#           if nargin<3||isempty(L)
-#             L=find(abs(r.R)>2*r.stdev)+1;
-#             if isempty(L), # pab added this check 09.10.2000
-#               L = Lm;
-#             else
-#               L = min([floor(4/3*L(end)) Lm]);
-#             end
-#           end
-#           win=parzen(2*L-1);
-#           r.R(1:L)=win(L:2*L-1).*r.R(1:L);
-#           r.R(L+1:end)=0;
-#           return
+        estimator = TransformEstimator(method=def_, **opt)
+        if def_.startswith('n'):
+            crossings = _CrossingCounter(xn, indr, mask, nlevels=opt.ntr)
+
+            def estimate_tr(x=None):
+                return estimator._trdata_lc(crossings(x))
+        else:
+            t = np.asarray(self.args)
+
+            def estimate_tr(x=None):
+                valid = indr if x is not None else indr & ~mask
+                x = xn if x is None else x
+                return estimator(TimeSeries(x[valid], t[valid]))
+
+        # initial reconstruction attempt from the known values only
+        g, g2 = estimate_tr()
+        xnt = np.empty(n)
+        xnt[~mask] = g.dat2gauss(xn[~mask])
+        xnt[mask] = 0
+        acf, L = _findrwin(xnt, ~mask, Lm, L)
+        lags = arange(len(acf)) * dT
+        test = g.dist2gauss()
+        tobs = tobs2 = inf
+        for _ix in range(Nsim):
+            R = _wafocov.CovData1D(acf, lags)
+            _sample, mu1o, mu1o_std = R.simcond_gaps(xnt, inds,
+                                                     n_jobs=n_jobs,
+                                                     random_state=rng)
+            xn[inds] = g.gauss2dat(mu1o)  # reconstruction by expectation
+
+            g_old = g
+            g, g2 = estimate_tr(xn)
+            test = g.dist2gauss()
+            x = g.sigma * linspace(*param) + g.mean
+            tobs = sqrt((param[1] - param[0]) / (param[2] - 1) *
+                        np.sum((g.dat2gauss(x) - g_old.dat2gauss(x)) ** 2))
+            if tol > tobs2 and tol > tobs:
+                break  # estimation of g converged
+            tobs2 = tobs
+
+            xnt = g.dat2gauss(xn)
+            acf_new, L = _findrwin(xnt, indr, Lm, L)
+            if np.abs(acf_new - acf).max() > tol * acf[0]:
+                acf = acf_new  # otherwise reuse the conditional distributions
+
+        xnt = g.dat2gauss(xn)
+        R = _wafocov.CovData1D(acf, lags)
+        sample, mu1o, mu1o_std = R.simcond_gaps(xnt, inds, n_jobs=n_jobs,
+                                                random_state=rng)
+        xn[inds] = g.gauss2dat(sample)
+        y = TimeSeries(xn, self.args)
+        return y, g, g2, test, tobs, mu1o, mu1o_std
 
     def plot_wave(self, sym1='k.', ts=None, sym2='k+', nfig=None, nsub=None,
                   sigma=None, vfact=3):
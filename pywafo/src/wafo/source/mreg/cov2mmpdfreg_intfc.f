@@ -64,6 +64,7 @@ Cf2py integer, optional :: NIT = 2
 Cf2py real*8, intent(out), depend(Nu,Nv) :: UVdens
 Cf2py depend(Ng)  Xg
 Cf2py depend(Nt,5)  COV
+Cf2py threadsafe
       real*8 Q0,SQ0,Q1,SQ1, U,V,VV, XL0, XL2, XL4
       REAL*8 VDERI, CDER,SDER, DER, CONST1, F, HHHH, FM, VALUE
 C     INTEGER, PARAMETER :: MMAX = 5, NMAX = 101, RDIM = 10201
@@ -18,6 +18,7 @@ Cf2py integer, optional :: IERC =0
 Cf2py double precision, intent(out) :: PRB
 Cf2py double precision, intent(out) :: BOUND
 Cf2py integer, intent(out) :: IFAULT
+Cf2py threadsafe
 
 CCf2py intent(in) N,IERC
 CCf2py intent(in) HINC,EPS
@@ -80,6 +81,7 @@ Cf2py double precision, optional :: abseps = 0.001
 Cf2py double precision, optional :: releps = 0.001
 Cf2py logical, optional :: useBreakPoints =1
 Cf2py logical, optional :: useSimpson = 1 
+Cf2py threadsafe
 	
       CALL mvnprodcorrprb(rho,a,b,abseps,releps,useBreakPoints,
      &  useSimpson,abserr,IFT,prb) 
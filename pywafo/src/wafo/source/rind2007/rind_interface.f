@@ -181,6 +181,7 @@ Cf2py depend(Mb,Nb)  Bup
 Cf2py double precision, intent(out), depend(Nx) ::  VALS
 Cf2py double precision, intent(out), depend(Nx) ::  ERR
 Cf2py double precision, intent(out), depend(Nx) ::  TERR
+Cf2py threadsafe
 
 C     print *, 'Ntdc=', Ntdc,' Nt=',Nt,' Nc=',Nc
 C     print *, 'Nx=', Nx, 'Mb=', Mb, ' Nb=', Nb, ' Ni=',Ni 
@@ -220,3 +221,73 @@ C     Nx = max(Nx1,1)
       RETURN
       END SUBROUTINE rind
 
+
+      SUBROUTINE rindb(VALS,ERR,TERR,Big,Ex,Xc,Nt,INDI,Blo,Bup,
+     & INFIN,seed1,Ntdc,Nc,Nx,Ni,Mb,Nb,Nx1,Nk)
+! RINDB Computes RIND for a stack of Nk sets of means, conditioning values 
+!       and barriers sharing the same covariance matrix, Big.
+!
+!    Ex  = expectations                     size Ntdc x Nk
+!    Xc  = values to condition on           size Nc x Nx x Nk
+! Blo,Bup = barrier coefficients            size Mb x Nb x Nk
+!  INFIN = integration limits flags         size Nb x Nk
+! VALS,ERR,TERR = as in RIND                size Nx x Nk
+      USE rindmod
+      USE rind71mod, only : rind71
+      IMPLICIT NONE
+      INTEGER :: Ntd,K
+      INTEGER :: seed1
+      integer :: Nx,Nx1,Nt, Nc,Ntdc,Ni,Nb,Mb,Nk
+      DOUBLE PRECISION, dimension(Ntdc,Ntdc) :: BIG
+      DOUBLE PRECISION, dimension(Ntdc,Nk) :: Ex
+      DOUBLE PRECISION, dimension(Nc,Nx1,Nk) :: Xc
+      DOUBLE PRECISION, dimension(Mb,Nb,Nk) :: Blo,Bup
+      DOUBLE PRECISION, dimension(Nx,Nk) :: VALS, ERR,TERR
+      INTEGER, dimension(Ni)  :: IndI
+      INTEGER, DIMENSION(Nb,Nk) :: INFIN
+      INTEGER, ALLOCATABLE  :: seed(:)
+      INTEGER               :: seed_size
+Cf2py integer, intent(hide), depend(Ex) :: Ntdc = shape(Ex,0)
+Cf2py integer, intent(hide), depend(Ex) :: Nk = shape(Ex,1)
+Cf2py integer, intent(hide), depend(Xc) :: Nc = shape(Xc,0)
+Cf2py integer, intent(hide), depend(Xc) :: Nx1 = shape(Xc,1) 
+Cf2py integer, intent(hide), depend(Xc) :: Nx = max(shape(Xc,1),1) 
+Cf2py integer, intent(hide), depend(Blo) :: Mb = shape(Blo,0), Nb = shape(Blo,1), 
+Cf2py integer, intent(hide), depend(Indi) :: Ni = len(Indi)
+Cf2py depend(Ntdc)  Big
+Cf2py depend(Nb,Nk)  INFIN 
+Cf2py depend(Mb,Nb,Nk)  Bup
+Cf2py double precision, intent(out), depend(Nx,Nk) ::  VALS
+Cf2py double precision, intent(out), depend(Nx,Nk) ::  ERR
+Cf2py double precision, intent(out), depend(Nx,Nk) ::  TERR
+Cf2py threadsafe
+
+      if (Ni.NE.Nb+1) then
+         print *, '(ni==nb+1) failed: rindb:ni=', Ni, ', nb=',Nb
+         return
+      endif
+      
+      Ntd = Ntdc - Nc;
+      
+      IF (Ntd.EQ.INDI(Ni)) THEN
+        IF (mMethod.gt.0) THEN
+          CALL random_seed(SIZE=seed_size) 
+          ALLOCATE(seed(seed_size))
+          seed(1:seed_size)=seed1 ! change seed
+          CALL random_seed(PUT=seed(1:seed_size)) 
+          DEALLOCATE(seed)
+          CALL RINDDB(VALS,ERR,TERR,Big,Ex,Xc,Nt,INDI,Blo,Bup,INFIN)
+        ELSE
+          DO K = 1, Nk
+             CALL RIND71(VALS(:,K),Big,Ex(:,K),Xc(:,:,K),Nt,INDI,
+     &            Blo(:,:,K),Bup(:,:,K))
+          ENDDO
+          ERR(:,:) = -1
+          TERR(:,:) = -1
+        ENDIF
+      ELSE
+         print *,'INDI(Ni) must equal Nt+Nd!'
+      ENDIF
+      
+      RETURN
+      END SUBROUTINE rindb
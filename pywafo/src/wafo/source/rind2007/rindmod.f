@@ -161,16 +161,20 @@
 !      USE PRINTMOD  ! used for debugging only
       IMPLICIT NONE
       PRIVATE
-      PUBLIC :: RINDD, SetConstants
+      PUBLIC :: RINDD, RINDDB, SetConstants
 	PUBLIC :: mCovEps, mAbsEps,mRelEps, mXcutOff, mXcScale
       PUBLIC :: mNc1c2, mNIT, mMaxPts,mMinPts, mMethod, mSmall
       private :: preInit
       private :: initIntegrand
       private :: initfun,mvnfun,cvsrtxc,covsrt1,covsrt,rcscale,rcswap
-      private :: cleanUp
+      private :: cleanUp, rindIntegrate
 
 	INTERFACE RINDD
       MODULE PROCEDURE RINDD
+      END INTERFACE
+
+      INTERFACE RINDDB
+      MODULE PROCEDURE RINDDB
       END INTERFACE
       
 	INTERFACE SetConstants
@@ -869,12 +873,6 @@
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
       SUBROUTINE RINDD(VALS,ERR,TERR,Big,Ex,Xc,Nt,
      &               indI,Blo,Bup,INFIN)  
-      USE RCRUDEMOD
-      USE KRBVRCMOD
-      USE ADAPTMOD
-      USE KROBOVMOD
-      USE DKBVRCMOD
-      USE SSOBOLMOD
       IMPLICIT NONE  
       DOUBLE PRECISION, DIMENSION(:  ), INTENT(out):: VALS, ERR ,TERR
       DOUBLE PRECISION, DIMENSION(:,:), INTENT(in) :: BIG
@@ -885,9 +883,8 @@
       INTEGER,                          INTENT(in) :: Nt 
 !      DOUBLE PRECISION,                 INTENT(in) :: XcScale
 ! local variables
-      INTEGER :: ix, INFORM, NDIM, MAXPTS, MINPTS
+      INTEGER :: ix, INFORM, NDIM
       DOUBLE PRECISION :: VALUE,fxc,absERR,absERR2
-      double precision :: LABSEPS,LRELEPS
       
 
       VALS(:) = gZERO    
@@ -909,61 +906,143 @@
         
          IF (INFORM.GT.0) GO TO 100 
          
-         MAXPTS  = mMAXPTS
-         MINPTS  = mMINPTS
-         LABSEPS = max(mABSEPS-abserr,0.2D0*mABSEPS)       !*fxc
-         LRELEPS = mRELEPS
-         ABSERR2 = mSmall
-         
-         SELECT CASE (mMethod)
-         CASE (:1)
-            IF (NDIM < 9) THEN
-               CALL SADAPT(NDIM,MAXPTS,MVNFUN,LABSEPS,
+         CALL rindIntegrate(NDIM,abserr,VALUE,ABSERR2,INFORM)
+
+!     IF (INFORM.gt.0) print *,'RIND, INFORM,error =',inform,error
+ 100     VALS(ix) = VALUE*fxc 
+         IF (SIZE(ERR, DIM = 1).EQ.mNx) ERR(ix)   = abserr2*fxc  
+         IF (SIZE(TERR, DIM = 1).EQ.mNx) TERR(ix) = abserr*fxc       
+      ENDDO                     !ix
+
+ 110  CONTINUE
+      call cleanUp
+      RETURN                                                            
+      END SUBROUTINE RINDD
+      
+      SUBROUTINE rindIntegrate(NDIM,abserr,VALUE,ABSERR2,INFORM)
+!     Integrate MVNFUN with the method given by mMethod.
+!     The integrand must be initialized by initIntegrand.
+      USE RCRUDEMOD
+      USE KRBVRCMOD
+      USE ADAPTMOD
+      USE KROBOVMOD
+      USE DKBVRCMOD
+      USE SSOBOLMOD
+      IMPLICIT NONE
+      INTEGER,          INTENT(in)  :: NDIM
+      DOUBLE PRECISION, INTENT(in)  :: abserr
+      DOUBLE PRECISION, INTENT(out) :: VALUE, ABSERR2
+      INTEGER,          INTENT(out) :: INFORM
+! local variables
+      INTEGER :: MAXPTS, MINPTS
+      double precision :: LABSEPS,LRELEPS
+
+      MAXPTS  = mMAXPTS
+      MINPTS  = mMINPTS
+      LABSEPS = max(mABSEPS-abserr,0.2D0*mABSEPS)       !*fxc
+      LRELEPS = mRELEPS
+      ABSERR2 = mSmall
+      
+      SELECT CASE (mMethod)
+      CASE (:1)
+         IF (NDIM < 9) THEN
+            CALL SADAPT(NDIM,MAXPTS,MVNFUN,LABSEPS,
      &              LRELEPS,ABSERR2,VALUE,INFORM)
-               VALUE = MAX(VALUE,gZERO)
-            ELSE
-               CALL KRBVRC(NDIM, MINPTS, MAXPTS, MVNFUN,LABSEPS,LRELEPS,
+            VALUE = MAX(VALUE,gZERO)
+         ELSE
+            CALL KRBVRC(NDIM, MINPTS, MAXPTS, MVNFUN,LABSEPS,LRELEPS,
      &              ABSERR2, VALUE, INFORM )
-            ENDIF
-         CASE (2)               
+         ENDIF
+      CASE (2)               
 !        Call the subregion adaptive integration subroutine
-            IF ( NDIM .GT. 19.) THEN
+         IF ( NDIM .GT. 19.) THEN
 !     print *, 'Ndim too large for SADMVN => Calling KRBVRC'
-               CALL KRBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
+            CALL KRBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
      &              LRELEPS, ABSERR2, VALUE, INFORM )
-            ELSE
-               CALL SADAPT(NDIM,MAXPTS,MVNFUN,LABSEPS,
+         ELSE
+            CALL SADAPT(NDIM,MAXPTS,MVNFUN,LABSEPS,
      &              LRELEPS,ABSERR2,VALUE,INFORM)
-               VALUE = MAX(VALUE,gZERO)
-            ENDIF
-         CASE (3)               !       Call the Lattice rule integration procedure
-            CALL KRBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
+            VALUE = MAX(VALUE,gZERO)
+         ENDIF
+      CASE (3)               !       Call the Lattice rule integration procedure
+         CALL KRBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
      &           LRELEPS, ABSERR2, VALUE, INFORM )
-         CASE (4)               !       Call the Lattice rule
-                                !       integration procedure 
-            CALL KROBOV( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
+      CASE (4)               !       Call the Lattice rule
+                             !       integration procedure 
+         CALL KROBOV( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS,
      &           LRELEPS,ABSERR2, VALUE, INFORM )
-         CASE (5)    ! Call Crude Monte Carlo integration procedure
-            CALL RANMC( NDIM, MAXPTS, MVNFUN, LABSEPS, 
+      CASE (5)    ! Call Crude Monte Carlo integration procedure
+         CALL RANMC( NDIM, MAXPTS, MVNFUN, LABSEPS, 
      &           LRELEPS, ABSERR2, VALUE, INFORM )           
-         CASE (6)       !       Call the scrambled Sobol sequence rule integration procedure
-           CALL SOBNIED( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS, LRELEPS,
+      CASE (6)       !       Call the scrambled Sobol sequence rule integration procedure
+        CALL SOBNIED( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS, LRELEPS,
      &           ABSERR2, VALUE, INFORM )
-         CASE (7:)
-           CALL DKBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS, LRELEPS,
+      CASE (7:)
+        CALL DKBVRC( NDIM, MINPTS, MAXPTS, MVNFUN, LABSEPS, LRELEPS,
      &           ABSERR2, VALUE, INFORM )
-         END SELECT   
+      END SELECT   
+      RETURN
+      END SUBROUTINE rindIntegrate
 
-!     IF (INFORM.gt.0) print *,'RIND, INFORM,error =',inform,error
- 100     VALS(ix) = VALUE*fxc 
-         IF (SIZE(ERR, DIM = 1).EQ.mNx) ERR(ix)   = abserr2*fxc  
-         IF (SIZE(TERR, DIM = 1).EQ.mNx) TERR(ix) = abserr*fxc       
-      ENDDO                     !ix
+      SUBROUTINE RINDDB(VALS,ERR,TERR,Big,Ex,Xc,Nt,
+     &               indI,Blo,Bup,INFIN)  
+!     RINDDB is the batch version of RINDD: 
+!     It computes RINDD for K different sets of means, conditioning
+!     values and barriers which all share the same covariance matrix BIG.
+!     The sorting and conditional Cholesky factorization of the Xc 
+!     variables (CVSRTXC) is done only once for all the K sets.
+!
+!     VALS,ERR,TERR = as in RINDD                size Nx x K  (out)
+!     Ex            = the expectations           size Ntdc x K
+!     Xc            = values to condition on     size Nc x Nx x K
+!     Blo,Bup       = barrier coefficients       size Mb x Nb x K
+!     INFIN         = integration limits flags   size Nb x K
+      IMPLICIT NONE  
+      DOUBLE PRECISION, DIMENSION(:,:), INTENT(out):: VALS, ERR ,TERR
+      DOUBLE PRECISION, DIMENSION(:,:), INTENT(in) :: BIG
+      DOUBLE PRECISION, DIMENSION(:,:,:), INTENT(in) :: Xc 
+      DOUBLE PRECISION, DIMENSION(:,:), INTENT(in) :: Ex            
+      DOUBLE PRECISION, DIMENSION(:,:,:), INTENT(in) :: Blo, Bup  
+      INTEGER,          DIMENSION(:), INTENT(in) :: indI
+      INTEGER,          DIMENSION(:,:), INTENT(in) :: INFIN
+      INTEGER,                          INTENT(in) :: Nt 
+! local variables
+      INTEGER :: I, K, ix, INFORM, NDIM
+      DOUBLE PRECISION :: VALUE,fxc,absERR,absERR2
+
+      VALS(:,:) = gZERO    
+      ERR(:,:)  = gONE  
+      TERR(:,:) = gONE  
+     
+      call preInit(BIG,Xc(:,:,1),Nt,inform)      
+      IF (INFORM.GT.0) GOTO 110 ! degenerate case exit VALS=0 for all  
+
+      IF (.NOT.ALLOCATED(mBIG2)) THEN
+!     Keep a copy of the sorted matrix for the next sets
+         ALLOCATE(mBIG2(mNtdc,mNtdc))
+         do i = 1,mNtdc
+            mBIG2(1:i,i) = mBIG(1:i,i) 
+         end do
+      ENDIF
+      
+      DO K = 1, SIZE(Xc, DIM = 3)
+         DO ix = 1, mNx
+            call initIntegrand(ix,Xc(:,:,K),Ex(:,K),indI,Blo(:,:,K),
+     &           Bup(:,:,K),INFIN(:,K),fxc,value,abserr,NDIM,inform)
+            ABSERR2 = mSmall
+            IF (INFORM.EQ.0) THEN
+               CALL rindIntegrate(NDIM,abserr,VALUE,ABSERR2,INFORM)
+            ENDIF
+            VALS(ix,K) = VALUE*fxc 
+            ERR(ix,K)  = abserr2*fxc  
+            TERR(ix,K) = abserr*fxc       
+         ENDDO                  !ix
+      ENDDO                     !K
 
  110  CONTINUE
       call cleanUp
       RETURN                                                            
-      END SUBROUTINE RINDD
+      END SUBROUTINE RINDDB
       
       SUBROUTINE setIntLimits(xc,indI,Blo,Bup,INFIN,inform)     
       IMPLICIT NONE
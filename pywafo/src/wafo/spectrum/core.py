@@ -3,14 +3,16 @@ from wafo.misc import meshgrid, gravity, cart2polar, polar2cart
 from wafo.objects import TimeSeries, mat2timeseries
 import warnings
 import os
+import hashlib
+import threading
 import numpy as np
 from numpy import (pi, inf, zeros, ones, where, nonzero,
                    flatnonzero, ceil, sqrt, exp, log, arctan2,
-                   tanh, cosh, sinh, random, atleast_1d,
-                   minimum, diff, isnan, any, r_, conj, mod,
+                   tanh, cosh, sinh, atleast_1d,
+                   minimum, diff, isnan, any, r_, mod,
                    hstack, vstack, interp, ravel, finfo, linspace,
                    arange, array, nan, newaxis, sign)
-from numpy.fft import fft
+from numpy.fft import fft, irfft
 from scipy.integrate import simps, trapz
 from scipy.special import erf
 from scipy.linalg import toeplitz
@@ -20,7 +22,9 @@ from wafo.interpolate import stineman_interp
 from wafo.wave_theory.dispersion_relation import w2k  # , k2w
 from wafo.containers import PlotData, now
 # , tranproc
-from wafo.misc import sub_dict_select, nextpow2, discretize, JITImport
+from wafo.misc import (sub_dict_select, nextpow2, discretize, JITImport,
+                       LRUCache, spawn_seeds, parallel_map,
+                       check_random_state)
 # from wafo.graphutil import cltext
 from wafo.kdetools import qlevels
 from scipy.interpolate.interpolate import interp1d
@@ -43,6 +47,7 @@ except ImportError:
 
 # from wafo.transform import TrData
 from wafo.transform.models import TrLinear
+from wafo.transform.estimation import TransformEstimator
 from wafo.plotbackend import plotbackend
 
 
@@ -53,14 +58,83 @@ _WAFOCOV = JITImport('wafo.covariance')
 
 __all__ = ['SpecData1D', 'SpecData2D', 'plotspec']
 
+# cov2mod keeps the constants set by initinteg in module variables.
+_COV2MOD_LOCK = threading.Lock()
 
-def _set_seed(iseed):
-    '''Set seed of random generator'''
-    if iseed is not None:
-        try:
-            random.set_state(iseed)
-        except:
-            random.seed(iseed)
+# Covariance matrices from SpecData1D.tocov_matrix memoized by
+# (spectrum key, dt, nt, nr)
+_ACFMAT_CACHE = LRUCache(maxsize=32)
+
+
+def _spectrum_key(spec):
+    '''Return hashable key identifying the values and grid of a spectrum'''
+    sha = hashlib.sha1(np.ascontiguousarray(spec.data, dtype=float))
+    sha.update(np.ascontiguousarray(spec.args, dtype=float))
+    return (spec.type, spec.freqtype, sha.hexdigest())
+
+
+def _cov_derivatives(specn, w, nfft, nr, nt):
+    '''
+    Return covariance function and its derivatives by one real FFT
+
+    Parameters
+    ----------
+    specn : array-like, length n_f
+        one sided spectrum normalized so that sum(specn)/(n_f-1) = R(0)
+    w : array-like, length n_f
+        equidistant angular frequencies/wave numbers starting from zero.
+    nfft : scalar integer
+        length of the FFT, nfft >= 2 * n_f - 2
+    nr, nt : scalar integers
+        number of derivatives and time-lags, respectively.
+
+    Returns
+    -------
+    acfmat : ndarray, shape nt+1 x nr+1
+        C-contiguous matrix with [R0, R1, ..., Rnr] as columns.
+
+    Notes
+    -----
+    The i'th derivative is the Fourier transform of (-1j*w)**i * S(w). Since
+    all these periodograms are Hermitian, only their non-negative
+    frequency halves are needed and all derivatives are obtained from a
+    single irfft along the first axis.
+    '''
+    n_f = len(specn)
+    half = zeros((nfft // 2 + 1, nr + 1), dtype=complex)
+    half[:n_f, 0] = specn
+    if nfft > 2 * n_f - 2:
+        # the last frequency has no mirrored counterpart in the embedding
+        half[n_f - 1, 0] *= 0.5
+    for i in range(1, nr + 1):
+        # conj((-1j*w)**i * S) = (1j*w)**i * S
+        half[:n_f, i] = 1j * w * half[:n_f, i - 1]
+    acfmat = np.ascontiguousarray(irfft(half, nfft, axis=0)[:nt + 1])
+    acfmat *= nfft / (2 * n_f - 2)
+    return acfmat
+
+
+def _testgaussian_chunk(args):
+    '''
+    Return e(g)=int (g(u)-u)^2 du for one chunk of simulations from an ACF
+
+    args = (acf_data, lags, lagtype, tr, ns, cases, iseed, method, options),
+    see SpecData1D.testgaussian. The covariance object is rebuilt from plain
+    arrays here, because it can not be pickled to the worker processes.
+    '''
+    acf_data, lags, lagtype, tr, ns, cases, iseed, method, opt = args
+    acf = _WAFOCOV.CovData1D(acf_data, lags, lagtype=lagtype)
+    acf.tr = tr
+    # all the cases of the chunk are simulated and transformed in one call
+    xs = acf.sim(ns=ns, cases=cases, random_state=iseed)
+    t = xs[:, 0].ravel()
+    estimate = TransformEstimator(method=method, **opt)
+    # each case has its own levels and hence its own smoothing spline
+    test1 = zeros(cases)
+    for iy in range(cases):
+        g, _tmp = estimate.trdata(TimeSeries(xs[:, iy + 1], t))
+        test1[iy] = g.dist2gauss()
+    return test1
 
 
 def qtf(w, h=inf, g=9.81):
@@ -738,12 +812,8 @@ class SpecData1D(PlotData):
             nt = minimum(nt, rate * (n_f - 1))
 
         checkdt = 1.2 * min(diff(freq)) / 2. / pi
-        if ftype in 'k':
-            lagtype = 'x'
-        else:
-            lagtype = 't'
-            if ftype in 'f':
-                checkdt = checkdt * 2 * pi
+        if ftype in 'f':
+            checkdt = checkdt * 2 * pi
         msg1 = 'Step dt = %g in computation of the density is too small.' % dt
         msg2 = 'Step dt = %g is small, and may cause numerical inaccuracies.' % dt
 
@@ -755,17 +825,14 @@ class SpecData1D(PlotData):
 
         # Calculating covariances
         #~~~~~~~~~~~~~~~~~~~~~~~~
-        spec = self.copy()
-        spec.resample(dt)
-
-        acf = spec.tocovdata(nr, nt, rate=1)
-        acfmat = zeros((nt + 1, nr + 1), dtype=float)
-        acfmat[:, 0] = acf.data[0:nt + 1]
-        fieldname = 'R' + lagtype * nr
-        for i in range(1, nr + 1):
-            fname = fieldname[:i + 1]
-            r_i = getattr(acf, fname)
-            acfmat[:, i] = r_i[0:nt + 1]
+        key = (_spectrum_key(self), dt, int(nt), nr)
+        if key in _ACFMAT_CACHE:
+            acfmat = _ACFMAT_CACHE[key].copy()
+        else:
+            spec = self.copy()
+            spec.resample(dt)
+            acfmat = spec._tocov_matrix(nr, nt, rate=1)
+            _ACFMAT_CACHE[key] = acfmat.copy()
 
         eps0 = 0.0001
         if nt + 1 >= 5:
@@ -843,6 +910,32 @@ class SpecData1D(PlotData):
         cov2spec
         '''
 
+        lagtype = 'x' if self.freqtype in 'k' else 't'
+        time, acfmat = self._tocov_matrix(nr, nt, rate, return_lags=True)
+
+        acf = _WAFOCOV.CovData1D(acfmat[:, 0].copy(), time, lagtype=lagtype)
+        acf.tr = self.tr
+        acf.h = self.h
+        acf.norm = self.norm
+
+        fieldname = 'R' + lagtype * nr
+        for i in range(1, nr + 1):
+            setattr(acf, fieldname[0:i + 1], acfmat[:, i].copy())
+        return acf
+
+    def _tocov_matrix(self, nr=0, nt=None, rate=None, return_lags=False):
+        '''
+        Return covariance function and its derivatives as one matrix
+
+        Parameters are as for tocovdata.
+
+        Returns
+        -------
+        lags : ndarray, length nt+1
+            time/space lags (only returned if return_lags is True)
+        acfmat : ndarray, shape nt+1 x nr+1
+            matrix with autocovariance and its derivatives as columns.
+        '''
         freq = self.args
         n_f = len(freq)
 
@@ -867,46 +960,25 @@ class SpecData1D(PlotData):
             nt = rate * (n_f - 1)
         else:  # check if Nt is ok
             nt = minimum(nt, rate * (n_f - 1))
+        nt = int(nt)
 
-        spec = self.copy()
-
-        if self.freqtype in 'k':
-            lagtype = 'x'
-        else:
-            lagtype = 't'
-
-        d_t = spec.sampling_period()
+        d_t = self.sampling_period()
         # normalize spec so that sum(specn)/(n_f-1)=acf(0)=var(X)
-        specn = spec.data * freq[-1]
-        if spec.freqtype in 'f':
+        specn = self.data * freq[-1]
+        if self.freqtype in 'f':
             w = freq * 2 * pi
         else:
             w = freq
 
         nfft = rate * 2 ** nextpow2(2 * n_f - 2)
-
-        # periodogram
-        rper = r_[
-            specn, zeros(nfft - (2 * n_f) + 2), conj(specn[n_f - 2:0:-1])]
-        time = r_[0:nt + 1] * d_t * (2 * n_f - 2) / nfft
-
-        r = fft(rper, nfft).real / (2 * n_f - 2)
-        acf = _WAFOCOV.CovData1D(r[0:nt + 1], time, lagtype=lagtype)
-        acf.tr = spec.tr
-        acf.h = spec.h
-        acf.norm = spec.norm
-
-        if nr > 0:
-            w = r_[w, zeros(nfft - 2 * n_f + 2), -w[n_f - 2:0:-1]]
-            fieldname = 'R' + lagtype[0] * nr
-            for i in range(1, nr + 1):
-                rper = -1j * w * rper
-                d_acf = fft(rper, nfft).real / (2 * n_f - 2)
-                setattr(acf, fieldname[0:i + 1], d_acf[0:nt + 1])
-        return acf
+        acfmat = _cov_derivatives(specn, w, nfft, nr, nt)
+        if return_lags:
+            lags = r_[0:nt + 1] * d_t * (2 * n_f - 2) / nfft
+            return lags, acfmat
+        return acfmat
 
     def to_linspec(self, ns=None, dt=None, cases=20, iseed=None,
-                   fn_limit=sqrt(2), gravity=9.81):
+                   fn_limit=sqrt(2), gravity=9.81, random_state=None):
         '''
         Split the linear and non-linear component from the Spectrum
             according to 2nd order wave theory
@@ -928,6 +1000,8 @@ class SpecData1D(PlotData):
         iseed : scalar integer
             starting seed number for the random number generator
                   (default none is set)
+        random_state : None, int or RandomState
+            random number generator used instead of iseed if given.
         fnLimit : real scalar
             normalized upper frequency limit of spectrum for 2'nd order
             components. The frequency is normalized with
@@ -1015,9 +1089,6 @@ class SpecData1D(PlotData):
         Hm0 = self.characteristic('Hm0')
         Tm02 = self.characteristic('Tm02')
 
-        if iseed is not None:
-            _set_seed(iseed)  # set the the seed
-
         n = len(self.data)
         if ns is None:
             ns = max(n - 1, 5000)
@@ -1055,7 +1126,8 @@ class SpecData1D(PlotData):
         for ix in xrange(max_sim):
             x2, x1 = self.sim_nl(ns=np, cases=cases, dt=None, iseed=iseed,
                                  method=method, fnlimit=fn_limit,
-                                 output='timeseries')
+                                 output='timeseries',
+                                 random_state=random_state)
             x2.data -= x1.data  # x2(:,2:end) = x2(:,2:end) -x1(:,2:end)
             S2 = x2.tospecdata(L)
             S1 = x1.tospecdata(L)
@@ -1218,8 +1290,9 @@ class SpecData1D(PlotData):
         Tg = trdata.args
         Xg = trdata.data
 
-        cov2mod.initinteg(EPS, EPSS, EPS0, C, IAC, ISQ)
-        uvdens = cov2mod.cov2mmpdfreg(t, R, h, h, Tg, Xg, nit)
+        with _COV2MOD_LOCK:
+            cov2mod.initinteg(EPS, EPSS, EPS0, C, IAC, ISQ)
+            uvdens = cov2mod.cov2mmpdfreg(t, R, h, h, Tg, Xg, nit)
         uvdens = np.rot90(uvdens, -2)
 
         dh = h[1] - h[0]
@@ -2449,7 +2522,7 @@ class SpecData1D(PlotData):
         return S
 
     def sim(self, ns=None, cases=1, dt=None, iseed=None, method='random',
-            derivative=False):
+            derivative=False, random_state=None):
         ''' Simulates a Gaussian process and its derivative from spectrum
 
         Parameters
@@ -2470,6 +2543,9 @@ class SpecData1D(PlotData):
         derivative : bool
             if true : return derivative of simulated signal as well
             otherwise
+        random_state : None, int, RandomState or Generator
+            random number generator used instead of iseed if given,
+            see wafo.misc.spawn_random_states for parallel simulations.
 
         Returns
         -------
@@ -2557,9 +2633,10 @@ class SpecData1D(PlotData):
                 acf.data[i[0]::] = 0.0
 
             return acf.sim(ns=ns, cases=cases, iseed=iseed,
-                           derivative=derivative)
+                           derivative=derivative, random_state=random_state)
 
-        _set_seed(iseed)
+        rng = check_random_state(iseed if random_state is None
+                                 else random_state)
 
         ns = ns + mod(ns, 2)  # make sure it is even
 
@@ -2586,10 +2663,10 @@ class SpecData1D(PlotData):
         del(s_i, f_u)
 
         # Generate standard normal random numbers for the simulations
-        randn = random.randn
-        z_r = randn((ns / 2) + 1, cases)
-        z_i = vstack(
-            (zeros((1, cases)), randn((ns / 2) - 1, cases), zeros((1, cases))))
+        randn = rng.standard_normal
+        z_r = randn((ns // 2 + 1, cases))
+        z_i = vstack((zeros((1, cases)), randn((ns // 2 - 1, cases)),
+                      zeros((1, cases))))
 
         amp = zeros((ns, cases), dtype=complex)
         amp[0:(ns / 2 + 1), :] = z_r - 1j * z_i
@@ -2641,7 +2718,7 @@ class SpecData1D(PlotData):
 #                                truncationLimit)
     def sim_nl(self, ns=None, cases=1, dt=None, iseed=None, method='random',
                fnlimit=1.4142, reltol=1e-3, g=9.81, verbose=False,
-               output='timeseries'):
+               output='timeseries', random_state=None):
         """
         Simulates a Randomized 2nd order non-linear wave X(t)
 
@@ -2672,6 +2749,8 @@ class SpecData1D(PlotData):
         reltol : scalar
             relative tolerance defining where to truncate spectrum for the
             sum and difference frequency effects
+        random_state : None, int, RandomState or Generator
+            random number generator used instead of iseed if given.
 
 
         Returns
@@ -2779,7 +2858,8 @@ class SpecData1D(PlotData):
         # TODO % Check the methods: 'apdeterministic' and 'adeterministic'
         Hm0, Tm02 = self.characteristic(['Hm0', 'Tm02'])[0].tolist()
 
-        _set_seed(iseed)
+        rng = check_random_state(iseed if random_state is None
+                                 else random_state)
 
         spec = self.copy()
         if dt is not None:
@@ -2825,10 +2905,10 @@ class SpecData1D(PlotData):
         del(s_i, f_u)
 
         # Generate standard normal random numbers for the simulations
-        randn = random.randn
-        z_r = randn((ns / 2) + 1, cases)
+        randn = rng.standard_normal
+        z_r = randn((ns // 2 + 1, cases))
         z_i = vstack((zeros((1, cases)),
-                      randn((ns / 2) - 1, cases),
+                      randn((ns // 2 - 1, cases)),
                       zeros((1, cases))))
 
         amp = zeros((ns, cases), dtype=complex)
@@ -3112,7 +3192,7 @@ class SpecData1D(PlotData):
         return output
 
     def testgaussian(self, ns, test0=None, cases=100, method='nonlinear',
-                     verbose=False, **opt):
+                     verbose=False, random_state=None, n_jobs=1, **opt):
         '''
         TESTGAUSSIAN Test if a stochastic process is Gaussian.
 
@@ -3136,6 +3216,14 @@ class SpecData1D(PlotData):
             defines method of estimation of the transform
             nonlinear': from smoothed crossing intensity (default)
             'mnonlinear': from smoothed marginal distribution
+        random_state : None, int, RandomState or Generator
+            source of the random numbers, see wafo.misc.check_random_state.
+            The cases are simulated in chunks, each with its own random stream
+            spawned from random_state, so that the result does not depend on
+            n_jobs.
+        n_jobs : int
+            number of processes the chunks are distributed over (default 1).
+            If n_jobs <= 0 all cpus are used.
         options = options structure defining how the estimation of the
                     transformation is done. (default troptset('dat2tr'))
 
@@ -3163,9 +3251,13 @@ class SpecData1D(PlotData):
         >>> ys = wo.mat2timeseries(S.sim(ns=2**13))
         >>> g0, gemp = ys.trdata()
         >>> t0 = g0.dist2gauss()
-        >>> t1 = S0.testgaussian(ns=2**13, t0=t0, cases=50)
+        >>> t1 = S0.testgaussian(ns=2**13, cases=50, random_state=1)
         >>> sum(t1 > t0) < 5
         True
+        >>> t2 = S0.testgaussian(ns=2**13, cases=50, random_state=1,
+        ...                      n_jobs=2)
+        >>> np.allclose(t1, t2)
+        True
 
         See also
         --------
@@ -3181,26 +3273,24 @@ class SpecData1D(PlotData):
         if cases > 50:
             print('  ... be patient this may take a while')
 
-        rep = int(ns * cases / maxsize) + 1
-        Nstep = int(cases / rep)
+        # The chunking depends only on ns and cases, not on n_jobs, in order
+        # to make the result reproducible for any number of workers.
+        chunk = int(min(max(maxsize // ns, 1), cases))
+        sizes = [chunk] * (cases // chunk)
+        if cases % chunk:
+            sizes.append(cases % chunk)
+        rng = check_random_state(random_state)
+        # RandomState has randint, Generator has integers
+        randint = getattr(rng, 'integers', None) or rng.randint
+        seeds = spawn_seeds(randint(2 ** 31 - 1), len(sizes))
 
         acf = self.tocovdata()
-        test1 = []
-        for ix in range(rep):
-            xs = acf.sim(ns=ns, cases=Nstep)
-            for iy in range(1, xs.shape[-1]):
-                ts = TimeSeries(xs[:, iy], xs[:, 0].ravel())
-                g, _tmp = ts.trdata(method, **opt)
-                test1.append(g.dist2gauss())
-            if verbose:
-                print('finished %d of %d ' % (ix + 1, rep))
-
-        if rep > 1:
-            xs = acf.sim(ns=ns, cases=np.remainder(cases, rep))
-            for iy in range(1, xs.shape[-1]):
-                ts = TimeSeries(xs[:, iy], xs[:, 0].ravel())
-                g, _tmp = ts.trdata(method, **opt)
-                test1.append(g.dist2gauss())
+        tasks = [(acf.data, acf.args, acf.lagtype, acf.tr, ns, size, iseed,
+                  method, opt) for size, iseed in zip(sizes, seeds)]
+        test1 = parallel_map(_testgaussian_chunk, tasks, n_jobs)
+        if verbose:
+            print('finished %d chunks of %d cases' % (len(sizes), chunk))
+        test1 = hstack(test1)
 
         if plotflag:
             plotbackend.plot(test1, 'o')
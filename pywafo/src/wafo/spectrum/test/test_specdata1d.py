@@ -25,6 +25,27 @@ class TestSpectrum(unittest.TestCase):
         self.assertTrue((np.abs(vals - true_vals) < 1e-7).all())
 
 
+def test_tocovmatrix_cached():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    acfmat = S.tocov_matrix(nr=3, nt=256, dt=0.1)
+    acfmat[:] = 0  # must not change the memoized result
+    acfmat2 = S.tocov_matrix(nr=3, nt=256, dt=0.1)
+    true_vals = np.array([[3.06073383,  0.0000000, -1.67748256, 0.],
+                          [3.05235423, -0.1674357, -1.66811444, 0.18693242]])
+    assert((np.abs(acfmat2[:2, :] - true_vals) < 1e-7).all())
+
+
+def test_tocovdata_derivatives():
+    Sj = sm.Jonswap()
+    S = Sj.tospecdata()
+    acf = S.tocovdata(nr=2, nt=20)
+    acfmat = S._tocov_matrix(nr=2, nt=20)
+    assert((acf.data == acfmat[:, 0]).all())
+    assert((acf.Rt == acfmat[:, 1]).all())
+    assert((acf.Rtt == acfmat[:, 2]).all())
+
+
 def test_tocovdata():
     Sj = sm.Jonswap()
     S = Sj.tospecdata()
@@ -127,8 +148,10 @@ def test_testgaussian():
     ys = wo.mat2timeseries(S.sim(ns=2 ** 13))
     g0, _gemp = ys.trdata()
     t0 = g0.dist2gauss()
-    t1 = S0.testgaussian(ns=2 ** 13, t0=t0, cases=50)
+    t1 = S0.testgaussian(ns=2 ** 13, cases=50, random_state=1)
     assert(sum(t1 > t0) < 5)
+    t2 = S0.testgaussian(ns=2 ** 13, cases=50, random_state=1, n_jobs=2)
+    assert(np.allclose(t1, t2))
 
 
 def test_moment():
@@ -738,6 +738,23 @@ class FitDistribution(rv_frozen):
         self.LPSmax = -dist.nlogps(self.par, self.data)
         self.pvalue = self._pvalue(self.par, self.data, unknown_numpar=numpar)
 
+    def __getstate__(self):
+        # The distribution object is not picklable. Store it by name so that
+        # fitted objects can be returned from worker processes.
+        state = self.__dict__.copy()
+        state.pop('_fitfun', None)
+        state['dist'] = self.dist.name
+        return state
+
+    def __setstate__(self, state):
+        from . import distributions
+        self.__dict__.update(state)
+        self.dist = getattr(distributions, state['dist'])
+        if self.method.lower()[:].startswith('mps'):
+            self._fitfun = self.dist.nlogps
+        else:
+            self._fitfun = self.dist.nnlf
+
     def __repr__(self):
         params = ['alpha', 'method', 'LLmax', 'LPSmax', 'pvalue',
                   'par', 'par_lower', 'par_upper', 'par_fix', 'par_cov']
@@ -0,0 +1,68 @@
+'''
+Thread scaling benchmark of the Fortran integrators in wafo.gaussian.
+
+Run as a script:
+
+    python -m wafo.test.bench_gaussian [num_threads ...]
+
+The same fixed set of problems is split between the given numbers of
+threads (default 1, 2 and 4) and the wall time of each integrator is
+printed. prbnormtndpc runs without a lock, so its threads can use several
+cores. prbnormnd, prbnormndpc and Rind are serialized by the locks guarding
+the module variables of their extensions.
+'''
+from __future__ import division
+import sys
+import threading
+import time
+import numpy as np
+from wafo.gaussian import Rind, prbnormtndpc, prbnormndpc, prbnormnd
+
+
+def _problems(num_problems, n, seed=0):
+    rng = np.random.RandomState(seed)
+    rho = rng.uniform(-0.9, 0.9, (num_problems, n))
+    a = rng.uniform(-2, 0, (num_problems, n))
+    b = a + rng.uniform(0.5, 3, (num_problems, n))
+    return rho, a, b
+
+
+def _run_threads(fun, args, num_threads):
+    def work(k):
+        for arg in args[k::num_threads]:
+            fun(*arg)
+    threads = [threading.Thread(target=work, args=(k,))
+               for k in range(num_threads)]
+    t0 = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - t0
+
+
+def bench_threads(num_threads=(1, 2, 4), num_problems=400, n=6, seed=0):
+    '''Print wall times of the integrators for various numbers of threads.
+    '''
+    rho, a, b = _problems(num_problems, n, seed)
+    correl = rho[:, :, None] * rho[:, None, :]
+    correl[:, range(n), range(n)] = 1
+    rind = Rind(seed=seed)
+    rind_args = [(correl[k], np.zeros(n), a[k][None], b[k][None])
+                 for k in range(num_problems)]
+    cases = [('prbnormtndpc', lambda *args: prbnormtndpc(*args, df=4),
+              list(zip(rho, a, b))),
+             ('prbnormndpc', prbnormndpc, list(zip(rho, a, b))),
+             ('prbnormnd', prbnormnd, list(zip(correl, a, b))),
+             ('Rind', rind, rind_args)]
+    print('%12s' % 'threads' + ''.join('%10d' % k for k in num_threads))
+    for name, fun, args in cases:
+        times = [_run_threads(fun, args, k) for k in num_threads]
+        print('%12s' % name + ''.join('%10.3f' % t for t in times))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        bench_threads([int(arg) for arg in sys.argv[1:]])
+    else:
+        bench_threads()
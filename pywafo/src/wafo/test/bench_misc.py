@@ -0,0 +1,111 @@
+'''
+Benchmark of wafo.misc.mctp2rfc against the original loop implementation.
+
+Run as a script:
+
+    python -m wafo.test.bench_misc [N ...]
+
+For each number of levels N it prints the time of the loop implementation,
+of mctp2rfc for a single Markov matrix and for a stack of 20 matrices, and
+the largest difference between the two implementations.
+'''
+from __future__ import division
+import sys
+import time
+import numpy as np
+from numpy import linalg, zeros
+from wafo.misc import mctp2rfc
+
+
+def mctp2rfc_loop(f_mM, f_Mm=None):
+    '''Return rainflow matrix, original implementation with one solve per
+    block, for reference.
+    '''
+    if f_Mm is None:
+        f_Mm = f_mM.copy()
+    N = max(f_mM.shape)
+    f_max = np.sum(f_mM, axis=1)
+    f_min = np.sum(f_mM, axis=0)
+    f_rfc = zeros((N, N))
+    f_rfc[N - 2, 0] = f_max[N - 2]
+    f_rfc[0, N - 2] = f_min[N - 2]
+    for k in range(2, N - 1):
+        for i in range(1, k):
+            AA = f_mM[N - 1 - k:N - 1 - k + i, k - i:k]
+            AA1 = f_Mm[N - 1 - k:N - 1 - k + i, k - i:k]
+            RAA = f_rfc[N - 1 - k:N - 1 - k + i, k - i:k]
+            nA = max(AA.shape)
+            MA = f_max[N - 1 - k:N - 1 - k + i]
+            mA = f_min[k - i:k]
+            SA = AA.sum()
+            SRA = RAA.sum()
+            DRFC = SA - SRA
+            NT = min(mA[0] - sum(RAA[:, 0]), MA[0] - sum(RAA[0, :]))
+            NT = max(NT, 0)
+            if NT > 1e-6 * max(MA[0], mA[0]):
+                NN = MA - np.sum(AA, axis=1)
+                e = (mA - np.sum(AA, axis=0))
+                e = np.flipud(e)
+                PmM = np.rot90(AA.copy())
+                for j in range(nA):
+                    norm = mA[nA - 1 - j]
+                    if norm != 0:
+                        PmM[j, :] = PmM[j, :] / norm
+                        e[j] = e[j] / norm
+                fx = 0.0
+                if (max(abs(e)) > 1e-6 and
+                        max(abs(NN)) > 1e-6 * max(MA[0], mA[0])):
+                    PMm = AA1.copy()
+                    for j in range(nA):
+                        norm = MA[j]
+                        if norm != 0:
+                            PMm[j, :] = PMm[j, :] / norm
+                    PMm = np.fliplr(PMm)
+                    A = PMm
+                    B = PmM
+                    if nA == 1:
+                        fx = NN * (A / (1 - B * A) * e)
+                    else:
+                        rh = np.eye(A.shape[0]) - np.dot(B, A)
+                        fx = np.dot(NN, np.dot(A, linalg.solve(rh, e)))
+                f_rfc[N - 1 - k, k - i] = fx + DRFC
+            else:
+                f_rfc[N - 1 - k, k - i] = 0.0
+        m0 = max(0, f_min[0] - np.sum(f_rfc[N - k + 1:N, 0]))
+        M0 = max(0, f_max[N - 1 - k] - np.sum(f_rfc[N - 1 - k, 1:k]))
+        f_rfc[N - 1 - k, 0] = min(m0, M0)
+    for k in range(1, N):
+        M0 = max(0, f_max[0] - np.sum(f_rfc[0, N - k:N]))
+        m0 = max(0, f_min[N - 1 - k] - np.sum(f_rfc[1:k + 1, N - 1 - k]))
+        f_rfc[0, N - 1 - k] = min(m0, M0)
+    return f_rfc
+
+
+def _timeit(fun, *args):
+    t0 = time.time()
+    out = fun(*args)
+    return time.time() - t0, out
+
+
+def bench_mctp2rfc(levels=(32, 64, 128, 256), num_stack=20, seed=0):
+    '''Print timings of mctp2rfc for dense random Markov matrices.'''
+    rng = np.random.RandomState(seed)
+    print('%5s %10s %10s %12s %10s' % ('N', 'loop [s]', 'new [s]',
+                                         'stack%d [s]' % num_stack, 'maxdiff'))
+    for N in levels:
+        fmM = rng.rand(num_stack, N, N)
+        fmM /= fmM.sum(axis=(1, 2))[:, None, None]
+        t_loop, f_loop = _timeit(mctp2rfc_loop, fmM[0])
+        t_new, f_new = _timeit(mctp2rfc, fmM[0])
+        t_stack, f_stack = _timeit(mctp2rfc, fmM)
+        diff = max(np.abs(f_new - f_loop).max(),
+                   np.abs(f_stack[0] - f_loop).max())
+        print('%5d %10.3f %10.3f %12.3f %10.2g' % (N, t_loop, t_new, t_stack,
+                                                   diff))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        bench_mctp2rfc([int(arg) for arg in sys.argv[1:]])
+    else:
+        bench_mctp2rfc()
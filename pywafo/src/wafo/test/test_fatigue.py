@@ -0,0 +1,37 @@
+from numpy.testing import (run_module_suite, assert_array_almost_equal,
+                           assert_array_equal)
+import numpy as np
+from wafo.fatigue import cc2cmat, cmat2dam, sum_cmat, SNCurves
+
+
+def test_cc2cmat():
+    cc = np.array([[-1., 1.], [-1., 0.9], [0., 1.], [-0.1, 0.4]])
+    F = cc2cmat((-1, 1, 3), cc)
+    assert_array_equal(F, [[0, 0, 2], [0, 1, 1], [0, 0, 0]])
+    F2 = sum_cmat((-1, 1, 3), [cc[:1], (cc[1:], [1, 1, 0.5])])
+    assert_array_equal(F2, [[0, 0, 2], [0, 0.5, 1], [0, 0, 0]])
+
+
+def test_sncurves_damage():
+    param = (-2, 2, 41)
+    rng = np.random.RandomState(0)
+    m = -rng.rand(500)
+    cc = np.c_[m, m + rng.rand(500)]
+    F = cc2cmat(param, cc)
+    beta = [2, 3, 4]
+    sn = SNCurves(m=beta, K=1)
+    assert_array_almost_equal(sn.damage(param, F), cmat2dam(param, F, beta))
+
+    sn = SNCurves(m=3, K=1e12, m2=5, knee=50, endurance=[0, 60],
+                  ultimate=[np.inf, 500])
+    N = sn.cycles_to_failure([40, 100], mean=[0, 100])
+    assert_array_almost_equal(N[0] / 1e6, [1e12 * 50 ** 2 / 40 ** 5 / 1e6,
+                                           1.])
+    assert_array_almost_equal(N[1], [np.inf, 1e12 / 125. ** 3])
+
+    D = sn.damage(param, np.array([F, 2 * F]))
+    assert_array_almost_equal(D[:, 1], 2 * D[:, 0])
+
+
+if __name__ == '__main__':
+    run_module_suite()
@@ -7,7 +7,7 @@ import numpy as np  # @UnusedImport
 from numpy import pi, inf  # @UnusedImport
 # @UnusedImport
 from wafo.gaussian import (Rind, prbnormtndpc, prbnormndpc, prbnormnd,
-                           cdfnorm2d, prbnorm2d)
+                           prbnormndpc_batch, MvnQmc, cdfnorm2d, prbnorm2d)
 
 
 def test_rind():
@@ -54,9 +54,9 @@ def test_rind():
     >>> E2 = g2(rho2); E2   # exact value
     0.24137214191774381
 
-    >>> E3, err3, terr3 = rind(Sc2,m2,Blo2,Bup2,indI2,nt=0); E3;err3;terr3
-    array([ 0.24127499])
-    array([ 0.00013838])
+    >>> E3, err3, terr3 = rind(Sc2,m2,Blo2,Bup2,indI2,nt=0,seed=1); E3;err3;terr3
+    array([ 0.2412905])
+    array([ 0.00039374])
     array([  1.00000000e-10])
 
     >>> E4, err4, terr4 = rind2(Sc2,m2,Blo2,Bup2,indI2,nt=0); E4;err4;terr4
@@ -115,6 +115,24 @@ def test_prbnormndpc():
     '''
 
 
+def test_prbnormndpc_batch():
+    '''
+    >>> rho = np.array([0.2, -0.5, 0.8])
+    >>> a = np.array([[-1, -inf, 0.5], [0, 0, 0], [-2, -1, -inf]])
+    >>> b = np.array([[1, 2, inf], [inf, inf, inf], [0.5, 1, 1]])
+    >>> val, err = prbnormndpc_batch(rho, a, b)
+    >>> val0 = [prbnormndpc(rho, ai, bi, 1e-12, 1e-12)[0]
+    ...         for ai, bi in zip(a, b)]
+    >>> np.allclose(val, val0, atol=1e-10)
+    True
+    >>> val, err = prbnormndpc_batch(rho, a, b, df=4)
+    >>> val0 = [prbnormtndpc(rho, ai, bi, df=4, abseps=1e-8)[0]
+    ...         for ai, bi in zip(a, b)]
+    >>> np.allclose(val, val0, atol=1e-6)
+    True
+    '''
+
+
 def test_prbnormnd():
     '''
     >>> import numpy as np
@@ -133,6 +151,24 @@ def test_prbnormnd():
     '''
 
 
+def test_mvnqmc():
+    '''
+    >>> r12, r13, r23 = 0.5, -0.3, 0.2
+    >>> Sc = np.array([[1, r12, r13], [r12, 1, r23], [r13, r23, 1]])
+    >>> E3 = 1./8 + (np.arcsin(r12) + np.arcsin(r13) + np.arcsin(r23))/(4*pi)
+    >>> A = np.zeros(3); B = np.repeat(inf, 3)
+    >>> val, err, inform = prbnormnd(Sc, A, B)
+    >>> np.abs(val-E3) < err
+    True
+
+    >>> A = np.array([[0, 0, 0], [-inf, 0, 0]]); B = np.repeat(inf, 3)
+    >>> val, err = MvnQmc(4 * Sc)(2 * A, B, seed=0)
+    >>> E2 = 0.25 + np.arcsin(r23) / (2*pi)
+    >>> np.all(np.abs(val-[E3, E2]) < err)
+    True
+    '''
+
+
 def test_cdfnorm2d():
     '''
     >>> x = np.linspace(-3,3,3)
@@ -142,6 +178,20 @@ def test_cdfnorm2d():
     array([[  2.38515157e-05,   1.14504149e-03,   1.34987703e-03],
            [  1.14504149e-03,   2.98493342e-01,   4.99795143e-01],
            [  1.34987703e-03,   4.99795143e-01,   9.97324055e-01]])
+
+    >>> rs = [-0.95, 0.2, 0.5, 0.8, 0.99]
+    >>> F = cdfnorm2d(b1[:, :1], b2[:, :1], rs)
+    >>> np.allclose(F, [[cdfnorm2d(x1, x2, ri)[0] for ri in rs]
+    ...                 for x1, x2 in zip(b1[:, 0], b2[:, 0])])
+    True
+
+    Infinite limits
+
+    >>> from scipy.special import ndtr
+    >>> F = cdfnorm2d([inf, -1.48, inf, inf, -inf], [-1.48, inf, inf, inf, 2],
+    ...               [-0.93, 0.97, 0.95, -1, 0.3])
+    >>> np.allclose(F, [ndtr(-1.48), ndtr(-1.48), 1, 1, 0], atol=1e-15)
+    True
     '''
 
 
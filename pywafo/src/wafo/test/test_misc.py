@@ -10,7 +10,7 @@ from wafo.misc import (JITImport, Bunch, detrendma, DotDict, findcross, ecross,
                        findoutliers, common_shape, argsreduce, stirlerr,
                        getshipchar, betaloge, hygfz,
                        gravity, nextpow2, discretize, polar2cart,
-                       cart2polar, tranproc)
+                       cart2polar, tranproc, mctp2rfc)
 
 
 def test_JITImport():
@@ -470,5 +470,30 @@ def test_tranproc():
                   0.86643821, 0.83096482]))
 
 
+def test_mctp2rfc():
+    fmM = np.array([[0.0183, 0.0160, 0.0002, 0.0000, 0],
+                    [0.0178, 0.5405, 0.0952, 0, 0],
+                    [0.0002, 0.0813, 0, 0, 0],
+                    [0.0000, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0]])
+    f_rfc = mctp2rfc(fmM)
+    assert_array_almost_equal(
+        f_rfc,
+        np.array([[2.669981e-02, 7.799700e-03, 4.906077e-07, 0, 0],
+                  [9.599629e-03, 5.485009e-01, 9.539951e-02, 0, 0],
+                  [5.622974e-07, 8.149944e-02, 0, 0, 0],
+                  [0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0]]))
+
+    # A stack of Markov matrices gives the same as one at a time
+    rng = np.random.RandomState(0)
+    fmMs = rng.rand(3, 30, 30)
+    fMm = rng.rand(30, 30)
+    f_rfcs = mctp2rfc(fmMs, fMm)
+    assert_equal(f_rfcs.shape, (3, 30, 30))
+    for fmM, f_rfc in zip(fmMs, f_rfcs):
+        assert_array_almost_equal(mctp2rfc(fmM, fMm), f_rfc, decimal=12)
+
+
 if __name__ == '__main__':
     run_module_suite()
@@ -59,6 +59,122 @@ def test_timeseries_trdata():
     True
 
     '''
+
+
+def test_timeseries_reconstruct():
+    '''
+    >>> import wafo.spectrum.models as sm
+    >>> from wafo.objects import mat2timeseries
+    >>> S = sm.Jonswap().tospecdata()
+    >>> x = S.sim(ns=20000, random_state=0)
+    >>> ts = mat2timeseries(x)
+    >>> inds = np.r_[100:101, 500:520, 5000:5003, 15000:15300]
+    >>> y, g, g2, test, tobs, mu1o, mu1o_std = ts.reconstruct(
+    ...     inds, Nsim=5, random_state=1)
+    >>> np.isnan(y.data).any(), len(mu1o) == len(inds)
+    (False, True)
+    >>> np.allclose(np.delete(y.data, inds), np.delete(x[:, 1], inds))
+    True
+    >>> y2 = ts.reconstruct(inds, Nsim=5, random_state=1, n_jobs=2)[0]
+    >>> np.allclose(y2.data, y.data)
+    True
+    '''
+
+
+def test_timeseries_wave_statistics():
+    '''
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> ts = wo.mat2timeseries(wafo.data.sea())
+    >>> waves = ts.wave_statistics()
+    >>> wp = ts.wave_parameters()
+    >>> all(np.allclose(waves[name], wp[name]) for name in wp)
+    True
+    >>> S, H = ts.wave_height_steepness(method=-3)
+    >>> np.allclose(S, waves['Su']), np.allclose(H, waves['Hu'])
+    (True, True)
+    >>> len(waves['Ac']), len(waves['At']), len(waves['Tcc'])
+    (533, 534, 532)
+    '''
+
+
+def test_timeseries_rolling_analysis():
+    '''
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> ts = wo.mat2timeseries(wafo.data.sea())
+    >>> table = ts.rolling_analysis(window=300, overlap=60)
+    >>> std = [ts.data[i:i + 1200].std() for i in range(0, 9 * 960, 960)]
+    >>> np.allclose(table.Hm0, 4 * np.array(std), rtol=1e-3)
+    True
+    >>> table2 = ts.rolling_analysis(window=300, overlap=60, n_jobs=2)
+    >>> np.allclose(table2.Tm02, table.Tm02), np.all(table2.Nw == table.Nw)
+    (True, True)
+    '''
+
+
+def test_timeseries_crossspecdata():
+    '''
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> x = wafo.data.sea()
+    >>> ts = wo.TimeSeries(np.c_[x[:, 1], x[:, 1]], x[:, 0])
+    >>> Sxy, w = ts.tocrossspecdata(L=150, method='psd')
+    >>> S = wo.mat2timeseries(x).tospecdata(L=150, method='psd')
+    >>> np.allclose(Sxy[:, 0, 1].real, S.data, rtol=1e-3)
+    True
+    >>> rf = ts.tocovdata(lag=150)
+    >>> rf0 = wo.mat2timeseries(x).tocovdata(lag=150)
+    >>> np.allclose(rf.data, rf0.data)
+    True
+    '''
+
+
+def test_crossing_counts_kinds():
+    '''
+    >>> from wafo.objects import _crossing_counts
+    >>> m, M = np.array([0., 0.]), np.array([1., 1.])
+    >>> counts = [_crossing_counts(m, M, defnr)[1].tolist()
+    ...           for defnr in range(4)]
+    >>> counts
+    [[2, 0], [0, 0], [0, 2], [2, 2]]
+    >>> [np.allclose(_crossing_counts(m, M, defnr, levels=[0., 1.])[1], c)
+    ...  for defnr, c in enumerate(counts)]
+    [True, True, True, True]
+    '''
+
+
+def test_rainflow_matrix():
+    '''
+    >>> import os, tempfile
+    >>> import wafo.data
+    >>> import wafo.objects as wo
+    >>> from wafo.fatigue import SNCurves
+    >>> mm = wo.mat2timeseries(wafo.data.sea()).turning_points().cycle_pairs()
+    >>> rfm = wo.cc2rfm((-2, 2, 41), mm)
+    >>> m, M, counts = rfm.minima_and_maxima()
+    >>> n = counts.astype(int)
+    >>> mm2 = wo.CyclePairs(np.repeat(M, n), np.repeat(m, n), time=mm.time)
+    >>> lc = rfm.level_crossings(levels=41)
+    >>> np.allclose(lc.data, mm2.level_crossings(levels=lc.args).data)
+    True
+    >>> sn = SNCurves(m=[3, 4], K=1)
+    >>> np.allclose(rfm.damage(sn), mm2.damage([3, 4]))
+    True
+    >>> rm = wo.cc2rfm(((0, 4, 41), (-1, 1, 21)), mm, kind='rangemean')
+    >>> np.allclose(rm.damage([3, 4]), rfm.damage([3, 4]), rtol=0.05)
+    True
+    >>> total = sum([rfm, rfm.rescale(2 * rfm.time)])
+    >>> np.allclose(total.counts, 3 * rfm.counts), total.time == 3 * mm.time
+    (True, True)
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'rfm.npz')
+    >>> total.save(filename)
+    >>> rfm2 = wo.load_rfm(filename)
+    >>> np.allclose(rfm2.todense(), total.todense()), rfm2.param == total.param
+    (True, True)
+    '''
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
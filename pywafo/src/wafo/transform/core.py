@@ -4,7 +4,7 @@ from __future__ import division
 from numpy import trapz, sqrt, linspace  # @UnresolvedImport
 
 from wafo.containers import PlotData
-from wafo.misc import tranproc  # , trangood
+from wafo.misc import PreparedTransform  # , trangood
 
 __all__ = ['TrData', 'TrCommon']
 
@@ -200,11 +200,24 @@ class TrData(PlotData, TrCommon):
     def trdata(self):
         return self
 
+    def _prepared_transform(self, x, f, order):
+        # Cache the prepared transforms, since gauss2dat and dat2gauss are
+        # often called repeatedly, e.g., in simulations. The cache is
+        # renewed when data or args are replaced.
+        cache = self.__dict__.setdefault('_transforms', {})
+        key = (x is self.data, order)
+        x_f_tr = cache.get(key)
+        if x_f_tr is None or x_f_tr[0] is not x or x_f_tr[1] is not f:
+            x_f_tr = cache[key] = (x, f, PreparedTransform(x, f, order))
+        return x_f_tr[2]
+
     def _gauss2dat(self, y, *yi):
-        return tranproc(self.data, self.args, y, *yi)
+        tr = self._prepared_transform(self.data, self.args, len(yi))
+        return tr(y, *yi)
 
     def _dat2gauss(self, x, *xi):
-        return tranproc(self.args, self.data, x, *xi)
+        tr = self._prepared_transform(self.args, self.data, len(xi))
+        return tr(x, *xi)
 
 
 class EstimateTransform(object):
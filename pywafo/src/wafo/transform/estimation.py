@@ -14,6 +14,136 @@ import numpy as np
 floatinfo = np.finfo(float)
 
 
+class BinnedCounts(object):
+    '''
+    Level up-crossing counts and histogram on a fixed grid of levels.
+
+    The counts are updated incrementally as data arrives, e.g., one file or
+    one hour at a time, and only the counts are kept in memory.
+
+    Parameters
+    ----------
+    param : (a, b, n)
+        the levels are mean + sigma * linspace(a, b, n), see
+        TransformEstimator. (default (-5, 5, 513))
+    mean, sigma : real scalars
+        reference mean and standard deviation defining the levels.
+        (default estimated from the first data given to update)
+
+    Member variables
+    ----------------
+    levels : ndarray
+        the fixed grid of levels.
+    crossings : ndarray
+        number of up-crossings of each level.
+    below : ndarray
+        number of data values below each level.
+    n : int
+        number of data values.
+
+    Example
+    -------
+    >>> x = np.cos(np.linspace(0, 20 * np.pi, 2001))
+    >>> counts = BinnedCounts(param=(-2, 2, 9), mean=0, sigma=0.45)
+    >>> for chunk in np.array_split(x, 7):
+    ...     counts.update(chunk)
+    >>> counts.crossings
+    array([ 10.,  10.,  10.,  10.,  10.,  10.,  10.,  10.,  10.])
+    >>> counts.n
+    2001
+    >>> np.allclose([counts.mean, counts.sigma], [0, 0.5**0.5], atol=1e-3)
+    True
+
+    See also
+    --------
+    TransformEstimator
+    '''
+
+    def __init__(self, param=(-5, 5, 513), mean=None, sigma=None):
+        self.param = param
+        self.ref_mean = mean
+        self.ref_sigma = sigma
+        self.levels = None
+        n = int(param[2])
+        self.crossings = np.zeros(n)
+        self.below = np.zeros(n)
+        self.n = 0
+        self._power_sums = np.zeros(4)
+        self._last = None
+
+    def _level_index(self, x):
+        '''Return number of levels less than or equal to x.'''
+        a, b, n = self.param
+        n = int(n)
+        scale = (n - 1.) / (b - a)
+        un = ((x - self.ref_mean) / self.ref_sigma - a) * scale
+        return np.clip(np.floor(un) + 1, 0, n).astype(int)
+
+    def update(self, data):
+        '''
+        Add data to the counts.
+
+        Parameters
+        ----------
+        data : array-like
+            the next part of the record. Consecutive calls are treated as
+            one continuous record.
+        '''
+        data = np.asarray(data, dtype=float).ravel()
+        if len(data) == 0:
+            return
+        if self.ref_mean is None:
+            self.ref_mean = data.mean()
+        if self.ref_sigma is None:
+            self.ref_sigma = data.std()
+        if self.levels is None:
+            self.levels = self.ref_mean + self.ref_sigma * np.linspace(
+                *self.param)
+        n = len(self.levels)
+        index = self._level_index(data)
+        if self._last is not None:
+            index = np.hstack((self._last, index))
+        self._last = index[-1:]
+
+        # An up-crossing from index k0 to k1 > k0 crosses levels k0,...,k1-1
+        k0, k1 = index[:-1], index[1:]
+        up = k1 > k0
+        self.crossings += np.cumsum(np.bincount(k0[up], minlength=n + 1) -
+                                    np.bincount(k1[up], minlength=n + 1))[:n]
+        self.below += np.cumsum(np.bincount(index[-len(data):],
+                                            minlength=n + 1))[:n]
+        xn = (data - self.ref_mean) / self.ref_sigma
+        xn2 = xn * xn
+        self._power_sums += [xn.sum(), xn2.sum(), xn.dot(xn2), xn2.dot(xn2)]
+        self.n += len(data)
+
+    def _central_moments(self):
+        m1, m2, m3, m4 = self._power_sums / self.n
+        var = m2 - m1 ** 2
+        mu3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        mu4 = m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4
+        return m1, var, mu3, mu4
+
+    @property
+    def mean(self):
+        return self.ref_mean + self.ref_sigma * self._central_moments()[0]
+
+    @property
+    def sigma(self):
+        return self.ref_sigma * np.sqrt(self._central_moments()[1])
+
+    @property
+    def skew(self):
+        _m1, var, mu3, _mu4 = self._central_moments()
+        return mu3 / var ** 1.5
+
+    @property
+    def kurt(self):
+        '''Return Fisher kurtosis, i.e., zero for Gaussian data.'''
+        _m1, var, _mu3, mu4 = self._central_moments()
+        return mu4 / var ** 2 - 3
+
+
 class TransformEstimator(object):
     '''
     Estimate transformation, g, from ovserved data.
@@ -201,7 +331,7 @@ class TransformEstimator(object):
         >>> int(S.tr.dist2gauss()*100)
         141
         >>> int(g0emp.dist2gauss()*100)
-        380995
+        277518
         >>> int(g0.dist2gauss()*100)
         143
         >>> int(g1.dist2gauss()*100)
@@ -360,6 +490,13 @@ class TransformEstimator(object):
     def trdata(self, timeseries):
         '''
 
+        Parameters
+        ----------
+        timeseries : TimeSeries or BinnedCounts object
+            data to estimate the transformation from. BinnedCounts may be
+            updated as data arrives and gives a fast estimate for long
+            records.
+
         Returns
         -------
         tr, tr_emp : TrData objects
@@ -402,6 +539,10 @@ class TransformEstimator(object):
         >>> int(g2.dist2gauss()*100)
         84
 
+        >>> counts = BinnedCounts()
+        >>> counts.update(xs[:, 1])
+        >>> g3, g3emp = TransformEstimator(method='n')(counts)
+
         See also
         --------
         LevelCrossings.trdata
@@ -421,6 +562,8 @@ class TransformEstimator(object):
         in Proceedings of 9th ISOPE Conference, Vol III, pp 66-73
         '''
 
+        if isinstance(timeseries, BinnedCounts):
+            return self._trdata_binned(timeseries)
         data = np.atleast_1d(timeseries.data)
         ma = data.mean()
         sa = data.std()
@@ -437,12 +580,88 @@ class TransformEstimator(object):
         elif method == 'h':
             ga1 = skew(data)
             ga2 = kurtosis(data, fisher=True)  # kurt(xx(n+1:end))-3;
-            up = min(4 * (4 * ga1 / 3) ** 2, 13)
-            lo = (ga1 ** 2) * 3 / 2
-            kurt1 = min(up, max(ga2, lo)) + 3
-            return TrHermite(mean=ma, var=sa ** 2, skew=ga1, kurt=kurt1)
+            return self._trdata_hermite(ma, sa, ga1, ga2)
         elif method[0] == 'o':
             ga1 = skew(data)
             return TrOchi(mean=ma, var=sa ** 2, skew=ga1)
 
+    @staticmethod
+    def _trdata_hermite(ma, sa, ga1, ga2):
+        up = min(4 * (4 * ga1 / 3) ** 2, 13)
+        lo = (ga1 ** 2) * 3 / 2
+        kurt1 = min(up, max(ga2, lo)) + 3
+        return TrHermite(mean=ma, var=sa ** 2, skew=ga1, kurt=kurt1)
+
+    def _trdata_binned(self, counts):
+        '''
+        Estimate transformation, g, from binned counts.
+
+        The crossing intensity ('nonlinear') or the marginal CDF
+        ('mnonlinear') is taken at the fixed levels of counts, so the
+        smoothing spline system is the same from one call to the next and
+        is only factorized once. Levels with ne or fewer up-crossings, or
+        with ne or fewer data values below or above, are not smoothed over.
+        '''
+        ma, sa = counts.mean, counts.sigma
+        method = self.method[0]
+        if method == 'l':
+            return TrLinear(mean=ma, sigma=sa), TrLinear(mean=ma, sigma=sa)
+        elif method == 'h':
+            return self._trdata_hermite(ma, sa, counts.skew, counts.kurt)
+        elif method == 'o':
+            return TrOchi(mean=ma, var=sa ** 2, skew=counts.skew)
+
+        levels = counts.levels
+        u = (levels - counts.ref_mean) / counts.ref_sigma
+        Ne = self.ne
+        if method == 'n':
+            k = np.flatnonzero(counts.crossings > 0)
+            ind = slice(k[0], k[-1] + 1)
+            lc2 = counts.crossings[ind]
+            lc22 = np.hstack((0, cumtrapz(lc2, levels[ind])))
+            lc22 = (lc22 + 0.5) / (lc22[-1] + 1)
+            inds = lc2 > Ne
+            args = u[ind]
+        else:
+            below = counts.below
+            k = np.flatnonzero((0 < below) & (below < counts.n))
+            ind = slice(k[0], k[-1] + 1)
+            lc22 = below[ind] / counts.n
+            inds = (Ne < below[ind]) & (below[ind] < counts.n - Ne)
+            args = levels[ind]
+        lc1 = levels[ind]
+        lc22 = invnorm(lc22)
+
+        ncr = len(lc22)
+        ng = len(np.atleast_1d(self.gvar))
+        if ng == 1:
+            gvar = self.gvar * np.ones(ncr)
+        else:
+            gvar = np.interp(np.linspace(0, 1, ncr),
+                             np.linspace(0, 1, ng), self.gvar)
+        if self.ntr > 0:
+            # Same smoothing as for ntr interpolated points on the data range
+            gvar = gvar * ncr / self.ntr
+
+        uu = np.linspace(*self.param)
+        x = sa * uu + ma
+        if method == 'n':
+            xi = (x - counts.ref_mean) / counts.ref_sigma
+        else:
+            xi = x
+        pp_tr = SmoothSpline(args[inds], lc22[inds], self.gsm,
+                             self.linextrap, gvar[inds])
+        tr = TrData(pp_tr(xi), x, mean=ma, sigma=sa)
+        tr_emp = TrData(lc22, lc1, mean=ma, sigma=sa)
+        tr_emp.setplotter('step')
+
+        if self.chkder:
+            tr_raw = TrData(lc22[inds], lc1[inds], mean=ma, sigma=sa)
+            tr = self._check_tr(tr, tr_raw)
+
+        if self.plotflag > 0:
+            tr.plot()
+            tr_emp.plot()
+        return tr, tr_emp
+
     __call__ = trdata
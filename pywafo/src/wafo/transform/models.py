@@ -4,6 +4,8 @@ Transform Gaussian models
 TrHermite
 TrOchi
 TrLinear
+TrHermiteBatch
+TrOchiBatch
 '''
 # !/usr/bin/env python
 from __future__ import division
@@ -13,7 +15,8 @@ from numpy import (sqrt, atleast_1d, abs, imag, sign, where, cos, arccos, ceil,
 import numpy as np
 import warnings
 from core import TrCommon, TrData
-__all__ = ['TrHermite', 'TrLinear', 'TrOchi']
+__all__ = ['TrHermite', 'TrLinear', 'TrOchi', 'TrHermiteBatch',
+           'TrOchiBatch']
 
 _example = '''
     >>> import numpy as np
@@ -34,6 +37,45 @@ _example = '''
     '''
 
 
+def _hermite_coefficients(skew, kurt, pardef=1):
+    '''
+    Return coefficients c3 and c4 of the Hermite transformation model.
+
+    skew and kurt may be arrays. The coefficients are given elementwise,
+    see TrHermite for the definitions.
+    '''
+    skew = np.asarray(skew, dtype=float)
+    ga2 = np.asarray(kurt, dtype=float) - 3.0
+    softening = ga2 > 0
+    with np.errstate(all='ignore'):
+        if pardef == 2:
+            # Winterstein 1988 parametrization
+            if np.any(softening & (skew ** 2 > 8 * (ga2 + 3.) / 9.)):
+                warnings.warn('Kurtosis too low compared to the skewness')
+
+            c4 = (sqrt(1. + 1.5 * ga2) - 1.) / 18.
+            c3 = skew / (6. * (1 + 6. * c4))
+        else:
+            # Winterstein et. al. 1994 parametrization intended to
+            # apply for the range:  0 <= ga2 < 12 and 0<= skew^2 < 2*ga2/3
+            if np.any(softening & (skew ** 2 > 2 * (ga2) / 3)):
+                warnings.warn('Kurtosis too low compared to the skewness')
+
+            if np.any(softening & (12 < ga2)):
+                warnings.warn('Kurtosis must be between 0 and 12')
+
+            c3 = skew / 6 * \
+                (1 - 0.015 * abs(skew) + 0.3 * skew ** 2) / (1 + 0.2 * ga2)
+            expon = 1. - 0.1 * (ga2 + 3.) ** 0.8
+            c41 = (1. - 1.43 * skew ** 2. / ga2) ** (expon)
+            c4 = 0.1 * ((1. + 1.25 * ga2) ** (1. / 3.) - 1.) * c41
+    c4 = where(softening, c4, ga2 / 24.)
+    c3 = where(softening, c3, skew / 6.)
+    if not (np.all(np.isfinite(c3)) and np.all(np.isfinite(c4))):
+        raise ValueError('Unable to calculate the polynomial')
+    return c3, c4
+
+
 class TrCommon2(TrCommon):
     __doc__ = TrCommon.__doc__  # @ReservedAssignment
 
@@ -141,38 +183,9 @@ class TrHermite(TrCommon2):
         self.set_poly()
 
     def _poly_par_from_stats(self):
-        skew = self.skew
-        ga2 = self.kurt - 3.0
-        if ga2 <= 0:
-            self._c4 = ga2 / 24.
-            self._c3 = skew / 6.
-        elif self.pardef == 2:
-            # Winterstein 1988 parametrization
-            if skew ** 2 > 8 * (ga2 + 3.) / 9.:
-                warnings.warn('Kurtosis too low compared to the skewness')
-
-            self._c4 = (sqrt(1. + 1.5 * ga2) - 1.) / 18.
-            self._c3 = skew / (6. * (1 + 6. * self._c4))
-        else:
-            # Winterstein et. al. 1994 parametrization intended to
-            # apply for the range:  0 <= ga2 < 12 and 0<= skew^2 < 2*ga2/3
-            if skew ** 2 > 2 * (ga2) / 3:
-                warnings.warn('Kurtosis too low compared to the skewness')
-
-            if (ga2 < 0) or (12 < ga2):
-                warnings.warn('Kurtosis must be between 0 and 12')
-
-            self._c3 = skew / 6 * \
-                (1 - 0.015 * abs(skew) + 0.3 * skew ** 2) / (1 + 0.2 * ga2)
-            if ga2 == 0.:
-                self._c4 = 0.0
-            else:
-                expon = 1. - 0.1 * (ga2 + 3.) ** 0.8
-                c41 = (1. - 1.43 * skew ** 2. / ga2) ** (expon)
-                self._c4 = 0.1 * ((1. + 1.25 * ga2) ** (1. / 3.) - 1.) * c41
-
-        if not np.isfinite(self._c3) or not np.isfinite(self._c4):
-            raise ValueError('Unable to calculate the polynomial')
+        c3, c4 = _hermite_coefficients(self.skew, self.kurt, self.pardef)
+        self._c3 = float(c3)
+        self._c4 = float(c4)
 
     def set_poly(self):
         '''
@@ -535,6 +548,292 @@ class TrOchi(TrCommon2):
         return sigma * xn + mean
 
 
+def _row_groups(mask):
+    '''
+    Return indices to the rows where mask is True and False, respectively.
+
+    A full slice is returned for a group with all rows and None for an
+    empty group, which avoids copying the data block.
+    '''
+    if mask.all():
+        return slice(None), None
+    if not mask.any():
+        return None, slice(None)
+    return np.flatnonzero(mask), np.flatnonzero(~mask)
+
+
+class _TrBatch(object):
+    '''
+    Base class for transformation models of many processes, e.g., sea
+    states, evaluated jointly.
+
+    The moments are broadcast against each other and define one model per
+    element. Data are given as a 2-D block with one row per model. A 1-D
+    data vector is applied to all models.
+    '''
+
+    def __init__(self, mean=0.0, var=1.0, skew=0.16, kurt=3.04, sigma=None,
+                 ymean=0.0, ysigma=1.0):
+        if sigma is None:
+            sigma = sqrt(var)
+        (self.mean, self.sigma, self.skew, self.kurt, self.ymean,
+         self.ysigma) = [np.array(v, dtype=float) for v in np.broadcast_arrays(
+             *[atleast_1d(np.asarray(v, dtype=float)).ravel()
+               for v in (mean, sigma, skew, kurt, ymean, ysigma)])]
+
+    def __len__(self):
+        return len(self.mean)
+
+    def __call__(self, x):
+        return self.dat2gauss(x)
+
+    def dat2gauss(self, x):
+        '''
+        Transforms non-linear data, x, to Gaussian scale.
+
+        Parameters
+        ----------
+        x : array-like, shape (n,) or (len(self), n)
+            non-linear data values.
+
+        Returns
+        -------
+        y : ndarray, shape (len(self), n)
+        '''
+        xn = (np.atleast_2d(x) - self.mean[:, None]) / self.sigma[:, None]
+        if len(xn) != len(self):
+            xn = xn * np.ones((len(self), 1))
+        return self._dat2gauss(xn) * self.ysigma[:, None] + self.ymean[:, None]
+
+    def gauss2dat(self, y):
+        '''
+        Transforms Gaussian data, y, to non-linear scale.
+
+        Parameters
+        ----------
+        y : array-like, shape (n,) or (len(self), n)
+            Gaussian data values.
+
+        Returns
+        -------
+        x : ndarray, shape (len(self), n)
+        '''
+        yn = (np.atleast_2d(y) - self.ymean[:, None]) / self.ysigma[:, None]
+        if len(yn) != len(self):
+            yn = yn * np.ones((len(self), 1))
+        return self._gauss2dat(yn) * self.sigma[:, None] + self.mean[:, None]
+
+
+class TrHermiteBatch(_TrBatch):
+    '''
+    Hermite transformation models for many processes, e.g., sea states.
+
+    Parameters
+    ----------
+    mean, var, skew, kurt : array-like
+        mean, variance, skewness and kurtosis of the non-Gaussian processes.
+        (default mean=0, var=1, skew=0.16, kurt=3.04)
+    sigma : array-like, optional
+        standard deviations, overrides var.
+    ymean, ysigma : array-like
+        mean and standard deviation in the Gaussian world.
+    pardef : 1 or 2
+        parametrization of the softening model, see TrHermite.
+
+    Notes
+    -----
+    The polynomial coefficients and the constants of the depressed cubic
+    used for the inversion are computed once for all models in the
+    constructor. Both the forward and the inverse maps are then evaluated
+    for the whole data block by closed form expressions. Where the
+    polynomial is not monotonic the real root of smallest magnitude is
+    chosen, and values outside the range of a quadratic polynomial give nan.
+
+    Example
+    -------
+    >>> import wafo.transform.models as tm
+    >>> skew, kurt = [0.1, 0.2, 0.3], [2.9, 3.2, 3.6]
+    >>> gb = tm.TrHermiteBatch(skew=skew, kurt=kurt)
+    >>> x = np.linspace(-3, 3, 7)
+    >>> y = gb.dat2gauss(x)
+    >>> y.shape
+    (3, 7)
+    >>> g1 = tm.TrHermite(skew=skew[1], kurt=kurt[1])
+    >>> np.allclose(y[1], g1.dat2gauss(x))
+    True
+    >>> np.allclose(gb.gauss2dat(y), x)
+    True
+
+    See also
+    --------
+    TrHermite
+    '''
+
+    def __init__(self, mean=0.0, var=1.0, skew=0.16, kurt=3.04, sigma=None,
+                 ymean=0.0, ysigma=1.0, pardef=1):
+        super(TrHermiteBatch, self).__init__(mean, var, skew, kurt, sigma,
+                                             ymean, ysigma)
+        self.pardef = pardef
+        c3, c4 = _hermite_coefficients(self.skew, self.kurt, pardef)
+        c4 = where(abs(c4) < sqrt(np.finfo(float).eps), 0.0, c4)
+        # Forward polynomial g for hardening and backward G for softening
+        self._softening = self.kurt >= 3.0
+        Km1 = np.sqrt(1. + 2. * c3 ** 2 + 6 * c4 ** 2)
+        self._coefs = where(self._softening[:, None],
+                            np.c_[c4, c3, 1. - 3. * c4, -c3] / Km1[:, None],
+                            np.c_[-c4, -c3, 1. + 3. * c4, c3])
+        self._set_inverse()
+
+    def _set_inverse(self):
+        '''
+        Set constants of the depressed cubic z**3 + 3*p1*z + 2*q0 = 0 where
+        q0 = q00 + dq0 * v when solving p(u) = v with u = z - x0.
+        '''
+        p3, p2, p1, p0 = self._coefs.T
+        self._cubic = p3 != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = p2 / p3
+            b = p1 / p3
+            x0 = a / 3.
+            self._x0 = x0
+            self._p1 = b / 3 - x0 ** 2
+            self._q00 = x0 * (x0 ** 2 - b / 2) + p0 / p3 / 2
+            self._dq0 = -0.5 / p3
+        dp_has_roots = where(self._cubic, p2 ** 2 - 3 * p3 * p1 >= 0, p2 != 0)
+        if np.any(dp_has_roots):
+            warnings.warn('The polynomial is not a strictly increasing '
+                          'function for %d of the %d models.' %
+                          (dp_has_roots.sum(), len(self)))
+
+    def _poly(self, rows, u):
+        p3, p2, p1, p0 = [c[:, None] for c in self._coefs[rows].T]
+        return ((p3 * u + p2) * u + p1) * u + p0
+
+    def _poly_inv(self, rows, v):
+        out = np.empty_like(v)
+        cubic, quadratic = _row_groups(self._cubic[rows])
+        if quadratic is not None:
+            # Quadratic: Solve a*u**2+b*u+c = v for the smallest solution
+            _p3, a, b, c = [k[:, None] for k in self._coefs[rows][quadratic].T]
+            c = c - v[quadratic]
+            t = 0.5 * (b + sign(b) * sqrt(b ** 2 - 4 * a * c))
+            out[quadratic] = -c / t
+        if cubic is not None:
+            x0, p1, q00, dq0 = [k[rows][cubic][:, None] for k in
+                                (self._x0, self._p1, self._q00, self._dq0)]
+            q0 = q00 + dq0 * v[cubic]
+            disc = q0 * q0 + p1 ** 3
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Only one real root exist (stable form of Cardano's formula)
+                A0 = np.cbrt(-q0 - np.copysign(sqrt(disc), q0))
+                z = A0 - p1 / A0
+            z[A0 == 0] = 0
+            three = disc < 0
+            if three.any():
+                # Three real roots, choose the one of smallest magnitude
+                i = np.nonzero(three)[0]
+                d = sqrt(-p1[i, 0])
+                theta1 = arccos(np.clip(-q0[three] / d ** 3, -1, 1)) / 3
+                zs = np.array([2. * d * cos(theta1 + th)
+                               for th in (0, -2 * pi / 3, 2 * pi / 3)])
+                ix = np.argmin(np.abs(zs - x0[i, 0]), axis=0)
+                z[three] = np.choose(ix, zs)
+            out[cubic] = z - x0
+        return out
+
+    def _dat2gauss(self, xn):
+        yn = np.empty_like(xn)
+        soft, hard = _row_groups(self._softening)
+        if soft is not None:
+            yn[soft] = self._poly_inv(soft, xn[soft])
+        if hard is not None:
+            yn[hard] = self._poly(hard, xn[hard])
+        return yn
+
+    def _gauss2dat(self, yn):
+        xn = np.empty_like(yn)
+        soft, hard = _row_groups(self._softening)
+        if soft is not None:
+            xn[soft] = self._poly(soft, yn[soft])
+        if hard is not None:
+            xn[hard] = self._poly_inv(hard, yn[hard])
+        return xn
+
+
+class TrOchiBatch(_TrBatch):
+    '''
+    Ochi transformation models for many processes, e.g., sea states.
+
+    Parameters
+    ----------
+    mean, var, skew : array-like
+        mean, variance and skewness of the non-Gaussian processes.
+        (default mean=0, var=1, skew=0.16)
+    sigma : array-like, optional
+        standard deviations, overrides var.
+    ymean, ysigma : array-like
+        mean and standard deviation in the Gaussian world.
+
+    Notes
+    -----
+    The non-linear equations for the parameters, see TrOchi, reduce to the
+    cubic t**3 - 6*t + 2*abs(skew) = 0 in t = sqrt(2*(sigma2**2-1)), which is
+    solved in closed form for all models at once.
+
+    Example
+    -------
+    >>> import wafo.transform.models as tm
+    >>> skew = [0., 0.3, -0.5]
+    >>> gb = tm.TrOchiBatch(skew=skew, sigma=2)
+    >>> x = np.linspace(-6, 6, 7)
+    >>> y = gb.dat2gauss(x)
+    >>> g1 = tm.TrOchi(skew=skew[1], sigma=2)
+    >>> np.allclose(y[1], g1.dat2gauss(x))
+    True
+    >>> np.allclose(gb.gauss2dat(y), x)
+    True
+
+    See also
+    --------
+    TrOchi
+    '''
+
+    def __init__(self, mean=0.0, var=1.0, skew=0.16, sigma=None, ymean=0.0,
+                 ysigma=1.0):
+        super(TrOchiBatch, self).__init__(mean, var, skew, np.nan, sigma,
+                                          ymean, ysigma)
+        skew = self.skew
+        if np.any(abs(skew) > 2.82842712474619):
+            raise ValueError('Skewness must be less than 2.82842')
+        # Smallest root of t**3 - 6*t + 2*abs(skew) = 0 in [0, sqrt(2)]
+        phi = arccos(-abs(skew) / (2 * sqrt(2)))
+        t = 2 * sqrt(2) * cos(phi / 3 - 2 * pi / 3)
+        sig22 = 1 + t ** 2 / 2
+        a = sign(skew) * sqrt(abs(sig22 - 1) / 2) / sig22
+        with np.errstate(divide='ignore', invalid='ignore'):
+            my2 = (-1. - sqrt(1. - 4. * a ** 2 * sig22)) / a  # Largest mean
+            mean2 = where(a == 0, 0., a * sig22 / my2)  # the smallest mean
+        self._gam_a = 1.28 * a
+        self._gam_b = 3 * a
+        self._sigma2 = where(a == 0, 1., sqrt(sig22))
+        self._mean2 = mean2
+
+    def _gamma(self, xn):
+        return where(xn >= 0, self._gam_a[:, None], self._gam_b[:, None])
+
+    def _dat2gauss(self, xn):
+        gam = self._gamma(xn)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = where(gam == 0, xn, -expm1(-gam * xn) / gam)
+        return (g - self._mean2[:, None]) / self._sigma2[:, None]
+
+    def _gauss2dat(self, yn):
+        xn = self._sigma2[:, None] * yn + self._mean2[:, None]
+        gam = self._gamma(xn)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return where(gam == 0, xn, -log1p(-gam * xn) / gam)
+
+
 def main():
     import pylab
     g = TrHermite(skew=0.1, kurt=3.01)
@@ -1,4 +1,5 @@
-from wafo.transform.models import TrHermite, TrOchi, TrLinear
+from wafo.transform.models import (TrHermite, TrOchi, TrLinear,
+                                   TrHermiteBatch, TrOchiBatch)
 import numpy as np
 def test_trhermite():
     
@@ -35,6 +36,31 @@ def test_trlinear():
     true_vals = np.array([ 0.,  1.,  2.,  3.])
     assert((np.abs(vals-true_vals)<1e-7).all())
     
+def test_trhermite_batch():
+    skew = np.array([0.1, 0.2, -0.3, 0.3])
+    kurt = np.array([2.9, 3.3, 3.6, 3.0])
+    gb = TrHermiteBatch(mean=1, sigma=[1, 2, 3, 4], skew=skew, kurt=kurt,
+                        ysigma=2)
+    x = np.linspace(-3, 5, 9)
+    y = gb.dat2gauss(x)
+    for i in range(4):
+        g = TrHermite(mean=1, sigma=i + 1, skew=skew[i], kurt=kurt[i],
+                      ysigma=2)
+        assert(np.allclose(y[i], g.dat2gauss(x)))
+        assert(np.allclose(gb.gauss2dat(y)[i], g.gauss2dat(y[i])))
+    assert(np.allclose(gb.gauss2dat(y), x))
+
+
+def test_trochi_batch():
+    skew = np.array([0., 0.5, -1.2])
+    gb = TrOchiBatch(mean=[0, 1, 2], sigma=2, skew=skew, ysigma=2)
+    x = np.linspace(-5, 5, 11)
+    y = gb.dat2gauss(x)
+    for i in range(3):
+        g = TrOchi(mean=i, sigma=2, skew=skew[i], ysigma=2)
+        assert(np.allclose(y[i], g.dat2gauss(x)))
+    assert(np.allclose(gb.gauss2dat(y), x))
+
 if __name__=='__main__':
     import nose
     nose.run()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from wafo.transform import TrData
+from wafo.transform.estimation import TransformEstimator, BinnedCounts
 import numpy as np
 def test_trdata():
     '''
@@ -23,6 +24,29 @@ def test_trdata():
     assert((np.abs(vals-true_vals)<1e-7).all())
     #Check that the departure from a Gaussian model is zero
     assert(g.dist2gauss() < 1e-16)
+
+
+def test_trdata_binned():
+    '''
+    Estimate transformation from binned counts of Gaussian data
+    '''
+    e = np.random.RandomState(0).randn(20000)
+    x = np.convolve(e, np.exp(-np.linspace(-3, 3, 31) ** 2), mode='same')
+    x = 2 * x / x.std() + 1
+    counts = BinnedCounts()
+    for chunk in np.array_split(x, 3):
+        counts.update(chunk)
+    counts2 = BinnedCounts(mean=counts.ref_mean, sigma=counts.ref_sigma)
+    counts2.update(x)
+    assert((counts.crossings == counts2.crossings).all())
+    assert((counts.below == counts2.below).all())
+    assert(np.abs(counts.mean - x.mean()) < 1e-10)
+    assert(np.abs(counts.sigma - x.std()) < 1e-10)
+
+    u = np.linspace(-2, 2)
+    for method in ['nonlinear', 'mnonlinear']:
+        g, _g_emp = TransformEstimator(method=method)(counts)
+        assert(np.abs(g.dat2gauss(2 * u + 1) - u).max() < 0.1)
     
     
     
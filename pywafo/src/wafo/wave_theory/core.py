@@ -7,7 +7,8 @@ import numpy as np
 from numpy import exp, expm1, inf, nan, pi, hstack, where, atleast_1d, cos, sin
 from dispersion_relation import w2k, k2w  # @UnusedImport
 
-__all__ = ['w2k', 'k2w', 'sensor_typeid', 'sensor_type', 'TransferFunction']
+__all__ = ['w2k', 'k2w', 'sensor_typeid', 'sensor_type', 'TransferFunction',
+           'TransferFunctionBatch']
 
 
 def hyperbolic_ratio(a, b, sa, sb):
@@ -68,7 +69,7 @@ def hyperbolic_ratio(a, b, sa, sb):
     den = np.where(sbk < 0, expm1(-2 * bk), 1 + exp(-2 * bk))
     iden = np.ones(den.shape) * inf
     ind = np.flatnonzero(den != 0)
-    iden.flat[ind] = 1.0 / den[ind]
+    iden.flat[ind] = 1.0 / den.flat[ind]
     val = np.where(num == den, 1, num * iden)
     # ((sak+exp(-2*ak))/(sbk+exp(-2*bk)))
     return signRatio * exp(ak - bk) * val
@@ -175,6 +176,29 @@ def sensor_type(*sensorids):
     return tuple(valid_names[i] for i in ids)
 
 
+def _direction_cosines(theta, bet, thetax, thetay):
+    # convert from angle in degrees to radians
+    thxr = thetax * pi / 180
+    thyr = thetay * pi / 180
+
+    cthx = bet * cos(theta - thxr + pi / 2)
+    #cthy = cos(theta-thyr-pi/2)
+    cthy = bet * sin(theta - thyr)
+    return cthx, cthy
+
+
+def _depth_argument(kw, h, z, igam):
+    if igam == 1:
+        # z measured positive upward from mean water level (default)
+        zk = kw * (h + z)
+    elif igam == 2:
+        # z measured positive downward from mean water level
+        zk = kw * (h - z)
+    else:
+        zk = kw * z  # z measured positive upward from sea floor
+    return zk
+
+
 class TransferFunction(object):
 
     '''
@@ -351,14 +375,8 @@ class TransferFunction(object):
 #---Private member methods
 
     def _get_ee_cthxy(self, theta, kw):
-        # convert from angle in degrees to radians
-        bet = self.bet
-        thxr = self.thetax * pi / 180
-        thyr = self.thetay * pi / 180
-
-        cthx = bet * cos(theta - thxr + pi / 2)
-        #cthy = cos(theta-thyr-pi/2)
-        cthy = bet * sin(theta - thyr)
+        cthx, cthy = _direction_cosines(theta, self.bet, self.thetax,
+                                        self.thetay)
 
         # Compute location complex exponential
         x, y, unused_z = list(self.pos)
@@ -367,17 +385,7 @@ class TransferFunction(object):
         return ee, cthx, cthy
 
     def _get_zk(self, kw):
-        h = self.h
-        z = self.pos[2]
-        if self.igam == 1:
-            # z measured positive upward from mean water level (default)
-            zk = kw * (h + z)
-        elif self.igam == 2:
-            # z measured positive downward from mean water level
-            zk = kw * (h - z)
-        else:
-            zk = kw * z  # z measured positive upward from sea floor
-        return zk
+        return _depth_argument(kw, self.h, self.pos[2], self.igam)
 
     #--- Surface elevation ---
     def _n(self, w, theta, kw):
@@ -507,6 +515,175 @@ class TransferFunction(object):
         zk = self._get_zk(kw)
         return hyperbolic_ratio(zk, hk, -1, -1), ee  # sinh(zk)./sinh(hk), ee
 
+# Factors of the transfer functions, Hw = scale * w**nw * k**nk * ratio and
+# Gwt = coef * cthx**nx * cthy**ny * ee, where ratio is the hyperbolic
+# ratio f(zk, sa) / f(hk, sb) given by (sa, sb), or 1 if (sa, sb) = (0, 0)
+# and scale is rho * g if rho_g is True, otherwise 1.
+#    sensortype: (nw, nk, sa, sb, rho_g, coef, nx, ny)
+_TRANSFER_FACTORS = dict(n=(0, 0, 0, 0, False, 1, 0, 0),
+                         n_t=(1, 0, 0, 0, False, -1j, 0, 0),
+                         n_tt=(2, 0, 0, 0, False, -1, 0, 0),
+                         n_x=(0, 1, 0, 0, False, 1j, 1, 0),
+                         n_y=(0, 1, 0, 0, False, 1j, 0, 1),
+                         n_xx=(0, 2, 0, 0, False, -1, 2, 0),
+                         n_yy=(0, 2, 0, 0, False, -1, 0, 2),
+                         n_xy=(0, 2, 0, 0, False, -1, 1, 1),
+                         p=(0, 0, 1, 1, True, 1, 0, 0),
+                         u=(1, 0, 1, -1, False, 1, 1, 0),
+                         v=(1, 0, 1, -1, False, 1, 0, 1),
+                         w=(1, 0, -1, -1, False, -1j, 0, 0),
+                         u_t=(2, 0, 1, -1, False, -1j, 1, 0),
+                         v_t=(2, 0, 1, -1, False, -1j, 0, 1),
+                         w_t=(2, 0, -1, -1, False, -1, 0, 0),
+                         x_p=(0, 0, 1, -1, False, 1j, 1, 0),
+                         y_p=(0, 0, 1, -1, False, 1j, 0, 1),
+                         z_p=(0, 0, -1, -1, False, 1, 0, 0))
+
+
+class TransferFunctionBatch(object):
+
+    '''
+    Transfer functions for an array of sensors based on linear wave theory
+
+    Parameters
+    ----------
+    pos : array-like, shape (ns, 3)
+        coordinate positions [x, y, z] of the ns sensors.
+    sensortype : sequence of strings or integers, length ns
+        sensortype of each sensor, see TransferFunction.
+    h, g, rho, bet, igam, thetax, thetay :
+        common to all sensors, see TransferFunction.
+
+    The transfer functions of all sensors are evaluated in one broadcast
+    call. The terms shared by the sensors, i.e., the direction cosines,
+    the wave numbers and the hyperbolic functions of the water depth, are
+    only computed once.
+
+    Example
+    -------
+    >>> pos = [(0, 0, 0), (0, 0, 0), (10, 5, -20)]
+    >>> tfb = TransferFunctionBatch(pos, sensortype=['n', 'n_x', 'p'], h=50)
+    >>> w = np.linspace(0.2, 2, 10)
+    >>> theta = np.linspace(-pi, pi, 5)
+    >>> Hw, Gwt = tfb.tran(w, theta)
+    >>> Hw.shape, Gwt.shape
+    ((3, 10), (3, 5, 10))
+    >>> tf = TransferFunction(pos=(10, 5, -20), sensortype='p', h=50)
+    >>> Hw2, Gwt2 = tf.tran(w, theta)
+    >>> np.allclose(Hw[2], Hw2), np.allclose(Gwt[2], Gwt2)
+    (True, True)
+
+    See also
+    --------
+    TransferFunction
+    '''
+
+    def __init__(self, pos=((0, 0, 0),), sensortype=('n',), h=inf, g=9.81,
+                 rho=1028, bet=1, igam=1, thetax=90, thetay=0):
+        pos = np.atleast_2d(np.asarray(pos, dtype=float))
+        if isinstance(sensortype, str):
+            sensortype = [sensortype] * len(pos)
+        sensortype = [stype.lower() if isinstance(stype, str) else
+                      sensor_type(stype)[0] for stype in sensortype]
+        self.pos = pos
+        self.sensortype = sensortype
+        self.h = h
+        self.g = g
+        self.rho = rho
+        self.bet = bet
+        self.igam = igam
+        self.thetax = thetax
+        self.thetay = thetay
+        if len(sensortype) != len(pos):
+            raise ValueError('pos and sensortype must have the same length!')
+        try:
+            factors = np.array([_TRANSFER_FACTORS[stype]
+                                for stype in sensortype], dtype=complex)
+        except KeyError as error:
+            raise ValueError('Unknown sensortype %s' % str(error))
+        nw, nk, sa, sb, rho_g, coef, nx, ny = factors.real.T
+        self._nw, self._nk, self._nx, self._ny = nw, nk, nx, ny
+        self._sa, self._sb = sa, sb
+        self._scale = np.where(rho_g == 1, rho * g, 1.)
+        self._coef = factors[:, 5]
+
+    def __len__(self):
+        return len(self.pos)
+
+    def tran(self, w, theta=0, kw=None):
+        '''
+        Return transfer functions of all sensors
+
+        Parameters
+        ----------
+        w : array-like
+            vector of angular frequencies in Rad/sec. Length Nf
+        theta : array-like
+            vector of directions in radians           Length Nt   (default 0)
+        kw : array-like
+            vector of wave numbers corresponding to angular frequencies, w.
+            Length Nf (default calculated with w2k)
+
+        Returns
+        -------
+        Hw  = transfer function of frequency only,      size Ns x Nf
+        Gwt = transfer function of frequency and direction, size Ns x Nt x Nf
+
+        where Ns is the number of sensors. Hw[i] and Gwt[i] are equal to
+        TransferFunction(pos[i], sensortype[i], ...).tran(w, theta, kw).
+        '''
+        if kw is None:
+            kw, unusedkw2 = w2k(w, 0, self.h)
+
+        w, theta, kw = np.atleast_1d(w, theta, kw)
+        w = w.reshape(1, -1)
+        kw = kw.reshape(1, -1)
+        theta = theta.reshape(1, -1, 1)
+
+        # Direction cosines shared by all sensors, size 1 x Nt x 1
+        cthx, cthy = _direction_cosines(theta, self.bet, self.thetax,
+                                        self.thetay)
+        # exp(i*k(w)*(x*cos(theta)+y*sin(theta)) size Ns x Nt x Nf
+        # computed once for each distinct horizontal position
+        # (x, y) packed as complex since np.unique(axis=0) needs numpy 1.13
+        xy, index = np.unique(self.pos[:, 0] + 1j * self.pos[:, 1],
+                              return_inverse=True)
+        x, y = xy.real[:, None, None], xy.imag[:, None, None]
+        phase = (x * cthx + y * cthy) * kw
+        ee = np.empty(phase.shape, dtype=complex)
+        cos(phase, out=ee.real)
+        sin(phase, out=ee.imag)
+        Gwt = ee[index]
+        Gwt *= (self._coef[:, None, None] * cthx ** self._nx[:, None, None] *
+                cthy ** self._ny[:, None, None])
+
+        Hw = (self._scale[:, None] * w ** self._nw[:, None] *
+              kw ** self._nk[:, None])
+        ix = np.flatnonzero(self._sa != 0)
+        if len(ix):
+            # hk is shared by all sensors, zk differs only by the depth z
+            with np.errstate(all='ignore'):
+                hk = kw * self.h
+                zk = _depth_argument(kw, self.h, self.pos[ix, 2:], self.igam)
+                Hw[ix] *= hyperbolic_ratio(zk, hk, self._sa[ix, None],
+                                           self._sb[ix, None])
+
+        # Set Hw to 0 for expressions w*hyperbolic_ratio(z*k,h*k,1,-1)= 0*inf
+        Hw[~np.isfinite(Hw)] = 0
+
+        # make sure Hw>=0 ie. transfer negative signs to Gwt
+        negative = Hw < 0
+        if negative.any():
+            sgn = np.where(negative, -1, 1)
+            Hw *= sgn
+            Gwt *= sgn[:, None, :]
+
+        if self.igam == 2:
+            Gwt = -Gwt
+        return Hw, Gwt
+    __call__ = tran
+
+
 # def wave_pressure(z, Hm0, h=10000, g=9.81, rho=1028):
 #    '''
 #    Calculate pressure amplitude due to water waves.
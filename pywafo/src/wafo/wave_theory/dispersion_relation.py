@@ -5,14 +5,31 @@ k2w - Translates from wave number to frequency
 w2k - Translates from frequency to wave number
 """
 import warnings
-#import numpy as np
-from numpy import (atleast_1d, sqrt, ones_like, zeros_like, arctan2, where,
-                   tanh, any, sin, cos, sign, inf,
-                   flatnonzero, finfo, cosh, abs)
+import hashlib
+import numpy as np
+from numpy import (atleast_1d, sqrt, zeros_like, arctan2, where,
+                   tanh, any, sin, cos, sign, inf, finfo, cosh, abs)
+from wafo.misc import LRUCache
 
 __all__ = ['k2w', 'w2k']
 
 
+def _dispersion_table(n=1025, ymin=1e-4, ymax=20):
+    '''Return log(x) and log(r) tabulated for y = k*h in [ymin, ymax]
+
+    where x = w**2*h/g = y*tanh(y) and r = k*g/w**2 = 1/tanh(y).
+    '''
+    y = np.logspace(np.log10(ymin), np.log10(ymax), n)
+    return np.log(y * tanh(y)), -np.log(tanh(y))
+
+
+# Dimensionless solution of the dispersion relation, see w2k
+_LOG_X, _LOG_R = _dispersion_table()
+
+# Wave numbers memoized by (frequencies, water depths and gravity)
+_W2K_CACHE = LRUCache(maxsize=32)
+
+
 def k2w(k1, k2=0e0, h=inf, g=9.81, u1=0e0, u2=0e0):
     ''' Translates from wave number to frequency
         using the dispersion relation
@@ -98,7 +115,7 @@ def w2k(w, theta=0.0, h=inf, g=9.81, count_limit=100):
         angular frequency [rad/s].
     theta : array-like, optional
         direction [rad].
-    h : real scalar, optional
+    h : array-like, optional
         water depth [m].
     g : real scalar or array-like of size 2.
         constant of gravity [m/s**2] or 3D normalizing constant
@@ -110,14 +127,18 @@ def w2k(w, theta=0.0, h=inf, g=9.81, count_limit=100):
 
     Description
     -----------
-    Uses Newton Raphson method to find the wave number k in the dispersion
-    relation
+    The dispersion relation
         w**2= g*k*tanh(k*h).
+    is written in dimensionless form x = y*tanh(y) with x = w**2*h/g and
+    y = k*h. A starting value for y is interpolated from a precomputed table
+    of x versus y and polished with Newton Raphson steps, usually one or
+    two. The wave numbers for a given set of frequencies, water depths and
+    gravity are cached, so repeated calls on the same grid are cheap.
     The solution k(w) => k1 = k(w)*cos(theta)
                          k2 = k(w)*sin(theta)
-    The size of k1,k2 is the common shape of w and theta according to numpy
-    broadcasting rules. If w or theta is scalar it functions as a constant
-    matrix of the same shape as the other.
+    The size of k1,k2 is the common shape of w, theta and h according to
+    numpy broadcasting rules. If w or theta is scalar it functions as a
+    constant matrix of the same shape as the other.
 
     Example
     -------
@@ -129,6 +150,8 @@ def w2k(w, theta=0.0, h=inf, g=9.81, count_limit=100):
     array([ 0.        ,  0.1019368 ,  0.4077472 ,  0.91743119])
     >>> wsd.w2k(range(4),h=20)[0]
     array([ 0.        ,  0.10503601,  0.40774726,  0.91743119])
+    >>> wsd.w2k(1, h=[10, 20, inf])[0]
+    array([ 0.12158234,  0.10503601,  0.1019368 ])
 
     >>> plb.close('all')
 
@@ -141,8 +164,8 @@ def w2k(w, theta=0.0, h=inf, g=9.81, count_limit=100):
     if wi.size == 0:
         return zeros_like(wi)
 
-    k = 1.0 * sign(wi) * wi ** 2.0 / gi[0]  # deep water
     if (hi > 10. ** 25).all():
+        k = 1.0 * sign(wi) * wi ** 2.0 / gi[0]  # deep water
         k2 = k * sin(th) * gi[0] / gi[-1]  # size np x nf
         k1 = k * cos(th)
         return k1, k2
@@ -151,53 +174,55 @@ def w2k(w, theta=0.0, h=inf, g=9.81, count_limit=100):
         raise ValueError('Finite depth in combination with 3D normalization' +
                          ' (len(g)=2) is not implemented yet.')
 
-    find = flatnonzero
-    eps = finfo(float).eps
+    key = (_array_key(wi), _array_key(hi), float(gi[0]))
+    k = _W2K_CACHE.get(key)
+    if k is None:
+        k = _w2k(wi, hi, gi[0], count_limit)
+        _W2K_CACHE[key] = k
 
-    oshape = k.shape
-    wi, k, hi = wi.ravel(), k.ravel(), hi.ravel()
+    k2 = k * sin(th)
+    k1 = k * cos(th)
+    return k1, k2
+
+
+def _array_key(x):
+    '''Return hashable key identifying the array x'''
+    x = np.ascontiguousarray(x, dtype=float)
+    return (x.shape, hashlib.sha1(x).hexdigest())
 
-    # Newton's Method
-    # Permit no more than count_limit iterations.
-    hi = hi * ones_like(k)
-    hn = zeros_like(k)
-    ix = find((wi < 0) | (0 < wi))
 
-    # Break out of the iteration loop for three reasons:
-    #  1) the last update is very small (compared to x)
-    #  2) the last update is very small (compared to sqrt(eps))
-    #  3) There are more than 100 iterations. This should NEVER happen.
+def _w2k(w, h, g, count_limit=100):
+    '''Return wave number k(w) for water depth h, see w2k'''
+    w, h = np.broadcast_arrays(w, h)
+    k0 = 1.0 * w ** 2.0 / g  # deep water
+    eps = finfo(float).eps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = where(k0 > 0, k0 * h, 0.0)
+        log_x = np.log(x)
+        # ratio r = k/k0 is 1/sqrt(x) in shallow water and 1 in deep water
+        r = np.where(log_x < _LOG_X[0], 1. / sqrt(x),
+                     np.exp(np.interp(log_x, _LOG_X, _LOG_R)))
+
+    # Newton's Method on y*tanh(y) - x = 0 where y = r*x
+    ix = (0 < x) & (x < 10. ** 25) & (r > 1)
+    xi = x[ix]
+    y = r[ix] * xi
     count = 0
-    while (ix.size > 0 and count < count_limit):
-        ki = k[ix]
-        kh = ki * hi[ix]
-        hn[ix] = (ki * tanh(kh) - wi[ix] ** 2.0 / gi) / \
-            (tanh(kh) + kh / (cosh(kh) ** 2.0))
-        knew = ki - hn[ix]
-        # Make sure that the current guess is not zero.
-        # When Newton's Method suggests steps that lead to zero guesses
-        # take a step 9/10ths of the way to zero:
-        ksmall = find(abs(knew) == 0)
-        if ksmall.size > 0:
-            knew[ksmall] = ki[ksmall] / 10.0
-            hn[ix[ksmall]] = ki[ksmall] - knew[ksmall]
-
-        k[ix] = knew
-        # disp(['Iteration ',num2str(count),'  Number of points left:  '
-        # num2str(length(ix)) ]),
-
-        ix = find((abs(hn) > sqrt(eps) * abs(k)) * abs(hn) > sqrt(eps))
+    hn = zeros_like(y)
+    while count < count_limit:
+        hn = (y * tanh(y) - xi) / (tanh(y) + y / (cosh(y) ** 2.0))
+        y = y - hn
         count += 1
-
-    if count == count_limit:
+        if (abs(hn) <= sqrt(eps) * abs(y)).all():
+            break
+    else:
         warnings.warn('W2K did not converge. The maximum error in the ' +
-                      'last step was: %13.8f' % max(hn[ix]))
-
-    k.shape = oshape
-
-    k2 = k * sin(th)
-    k1 = k * cos(th)
-    return k1, k2
+                      'last step was: %13.8f' % max(abs(hn)))
+    r[ix] = y / xi
+    with np.errstate(invalid='ignore'):
+        k = np.where(x > 0, sign(w) * r * k0, 0.0)
+    k.setflags(write=False)
+    return k
 
 
 def test_docstrings():
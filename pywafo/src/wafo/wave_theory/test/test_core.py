@@ -0,0 +1,25 @@
+import numpy as np
+from wafo.wave_theory.core import (TransferFunction, TransferFunctionBatch,
+                                   sensor_type)
+
+
+def test_transfer_function_batch():
+    stypes = sensor_type(range(18))
+    pos = [(1., 2., -3.)] * 9 + [(-5., 4., -10.)] * 9
+    w = np.linspace(0, 2, 21)
+    theta = np.linspace(-np.pi, np.pi, 7)
+    for h in [20, np.inf]:
+        for igam in [1, 2]:
+            tfb = TransferFunctionBatch(pos, stypes, h=h, igam=igam)
+            Hw, Gwt = tfb.tran(w, theta)
+            assert(Hw.shape == (18, 21))
+            assert(Gwt.shape == (18, 7, 21))
+            for i, stype in enumerate(stypes):
+                tf = TransferFunction(pos[i], stype, h=h, igam=igam)
+                Hw1, Gwt1 = tf.tran(w, theta)
+                assert(np.allclose(Hw[i], Hw1))
+                assert(np.allclose(Gwt[i], Gwt1))
+
+if __name__ == '__main__':
+    import nose
+    nose.run()
@@ -30,6 +30,17 @@ def test_w2k_finite_water_depth():
     true_vals = np.array([0.,  0.10503601,  0.40774726,  0.91743119])
     assert((np.abs(vals - true_vals) < 1e-7).all())
 
+
+def test_w2k_depth_grid():
+    w = np.linspace(-3, 3, 61)
+    h = np.array([0.1, 1., 20., 1000., np.inf])[:, None]
+    k1, k2 = w2k(w, np.pi / 3, h)
+    assert(k1.shape == (5, 61))
+    k = np.hypot(k1, k2) * np.sign(w)
+    w_new = k2w(k[:-1], h=h[:-1])[0] * np.sign(w)
+    assert((np.abs(w_new - w) < 1e-12).all())
+    assert((np.abs(k[-1] - w2k(w)[0]) < 1e-12).all())
+
 if __name__ == '__main__':
     import nose
     nose.run()